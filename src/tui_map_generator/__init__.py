@@ -1,3 +1,10 @@
-from tui_map_generator.diamond_square import DiamondSquare
-
 __all__ = ["DiamondSquare"]
+
+
+def __getattr__(name: str):
+    # generator (numpy, rich...) is imported on first use, not with the package
+    if name == "DiamondSquare":
+        from tui_map_generator.diamond_square import DiamondSquare
+
+        return DiamondSquare
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,47 +1,106 @@
 #!/usr/bin/env python3
-from tui_map_generator.diamond_square import (
-    DiamondSquare,
+# generator (numpy, rich, PIL...) and trogon (textual) are imported by the commands
+# which use them, so "--help" and option errors are shown without waiting for them
+from tui_map_generator.defaults import (
+    ALGORITHM,
     HEIGHT_MAP_SIZE,
     HEIGHT_MAX,
     MAP_NAME,
     ROUGHNESS,
     SCALE_UP,
     COLOR_PALETTE,
-    PALETTES_DICT,
+    ENGINE,
+    ENGINES,
+    PNG_INDEXED,
+    XP_COMPRESS,
+    MAP_COMPRESS,
+    JSON_COMPACT,
+    MEMORY_BUDGET,
+    RENDERER,
+    RENDERERS,
+    EXPORT_FORMATS,
+    EROSION_ITERATIONS,
+    EROSION_KINDS,
+    CACHE,
+    BATCH_CACHE_EXPORTS,
+    is_valid_map_size,
 )
+from tui_map_generator.palettes import PALETTE_REGISTRY
+from tui_map_generator.algorithms import ALGORITHMS, is_valid_size
+from tui_map_generator import profiling
 import random
 import click
-from trogon import tui
 
 
-@tui(
-    command="tui",
-    help="Open terminal UI to set generation parameters. This will lunch a beautiful 'graphic-like' interface, but it's still a terminal application. Try it!",
-)
-@click.option(
+def validate_map_size(ctx, param, value: int) -> int:
+    if not is_valid_map_size(value):
+        raise click.BadParameter(
+            f"{value} is not a valid map size, it must be 2^n + 1 (e.g. 9, 17, 33, 65, 129, 257, 513, 1025...)."
+        )
+    return value
+
+
+def validate_algorithm_size(algorithm: str, map_size: int, map_height: int | None):
+    if is_valid_size(algorithm, map_size, map_height):
+        return
+    if map_height is not None and map_height != map_size:
+        raise click.BadParameter(
+            f"'{algorithm}' algorithm makes only square maps, use one of: {', '.join(name for name in ALGORITHMS if not ALGORITHMS[name].power_of_two_sizes)} for {map_size}x{map_height} map.",
+            param_hint="'--map-height'",
+        )
+    raise click.BadParameter(
+        f"{map_size} is not a valid map size for '{algorithm}' algorithm, it must be 2^n + 1 (e.g. 9, 17, 33, 65, 129, 257, 513, 1025...).",
+        param_hint="'--map-size'",
+    )
+
+
+# options shared by generate and generate-batch commands
+map_size_option = click.option(
     "--map-size",
     "-m",
     "map_size",
-    type=click.Choice(["9", "17", "33", "65", "129"], case_sensitive=False),
+    type=click.IntRange(min=2),
     # required=True,
-    default=str(HEIGHT_MAP_SIZE),
-    help="Map size (for diamond square size must be n^2 + 1). If you need different size, pick bigger value and cut to desired size.",
+    default=HEIGHT_MAP_SIZE,
+    help="Map size (width of the map). For diamond square size must be 2^n + 1, e.g. 9, 17, 33, 65, 129, 257, 513, 1025..., 'fbm' and 'perlin' take any size. There is no upper limit, height map uses 1 or 2 bytes per point.",
 )
-@click.option(
+
+map_height_option = click.option(
+    "--map-height",
+    "map_height",
+    type=click.IntRange(min=2),
+    help="Number of rows of rectangular map (only 'fbm' and 'perlin' algorithms). Skip to get square map of --map-size.",
+)
+
+algorithm_option = click.option(
+    "--algorithm",
+    "-a",
+    type=click.Choice(list(ALGORITHMS), case_sensitive=True),
+    default=ALGORITHM,
+    help="Generation algorithm. "
+    + " ".join(
+        f"'{name}' - {algorithm.description}." for name, algorithm in ALGORITHMS.items()
+    )
+    + " Algorithm is saved in the legend of exported maps.",
+)
+
+palette_option = click.option(
     "--palette",
     "-p",
-    type=click.Choice(list(PALETTES_DICT.keys()), case_sensitive=True),
+    type=click.Choice(PALETTE_REGISTRY.names(), case_sensitive=True),
     default=COLOR_PALETTE,
     help="Name of one of available color palettes. A palette is a set of colors to represent map height values.",
 )
-@click.option(
+
+roughness_option = click.option(
     "--roughness",
     "-r",
     type=click.FloatRange(min=1.0),
     default=ROUGHNESS,
     help="Roughness level - how rapidly values change near by (the higher value the more 'ragged' map). Best results when in range of ~3.0 to MAX_HEIGHT.",
 )
-@click.option(
+
+height_option = click.option(
     "--height",
     "-h",
     "height_max",
@@ -49,11 +108,90 @@ from trogon import tui
     default=HEIGHT_MAX,
     help="Maximum height value (min is always 1). In order to properly display in console, max height must be lower or equal the number of colors in selected palette (the biggest palette is 128). While exporting to files, max height is not limited.",
 )
+
+engine_option = click.option(
+    "--engine",
+    "-e",
+    type=click.Choice(ENGINES, case_sensitive=True),
+    default=ENGINE,
+    help="Generation engine of diamond square algorithm. 'exact' (default) runs each diamond and square pass as whole-array operations and gives exactly the same maps for the same seed as 'loop', the reference pure Python implementation. 'numpy' uses numpy random generator instead (gives statistically equivalent but not identical maps for the same seed). 'parallel' is like 'numpy' but splits each pass into bands generated on all CPU cores (see --workers), it gives the same maps for any number of workers.",
+)
+
+cache_option = click.option(
+    "--cache/--no-cache",
+    "cache",
+    default=CACHE,
+    help="Reuse maps (and exported files) generated before with the same parameters from the on-disk cache (default) or always generate them again. Cache folder is ~/.cache/tui_map_generator, it can be changed with TUI_MAP_GENERATOR_CACHE environment variable. Least recently used files are removed when the cache grows over 1 GB. Maps kept in a --memmap-file are not cached.",
+)
+
+scale_up_option = click.option(
+    "--scale-up",
+    "-u",
+    "scale_up",
+    type=click.IntRange(min=1),
+    default=SCALE_UP,
+    help="Map size scale up factor used while saving to PNG files (see --export-png-filename). With default value of 1 you end up with one pixel per height map value which means a really tiny image. With scale up = 5, each height map point results in 5x5 pixels rectangle. Linear scaling is used in order to preserve exact height values (no interpolation).",
+)
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(
+    name="tui",
+    help="Open terminal UI to set generation parameters. This will lunch a beautiful 'graphic-like' interface, but it's still a terminal application. Try it!",
+)
+@click.pass_context
+def tui_command(ctx):
+    # the same as trogon.tui decorator, but textual is loaded only here
+    from trogon import Trogon
+
+    Trogon(cli, command_name="tui", click_context=ctx).run()
+
+
+@algorithm_option
+@map_size_option
+@map_height_option
+@palette_option
+@roughness_option
+@height_option
+@click.option(
+    "--erosion",
+    type=click.Choice(EROSION_KINDS, case_sensitive=True),
+    help="Erode generated map before printing and exports: 'thermal' (steep slopes slide down), 'hydraulic' (rain carries ground down the slopes) or 'both'. Skip to keep the map as generated. Erosion is saved in the legend.",
+)
+@click.option(
+    "--erosion-iterations",
+    "erosion_iterations",
+    type=click.IntRange(min=1),
+    default=EROSION_ITERATIONS,
+    help="Number of erosion iterations (more - stronger erosion).",
+)
+@click.option(
+    "--erosion-time-budget",
+    "erosion_time_budget",
+    type=click.FloatRange(min=0.0),
+    help="Stop erosion after this many seconds, even if not all iterations are done (at least one is always done).",
+)
 @click.option(
     "--printout/--no-printout",
     default=True,
     help="Print height map to console (default True).",
 )
+@click.option(
+    "--renderer",
+    type=click.Choice(RENDERERS, case_sensitive=True),
+    default=RENDERER,
+    help="How height map is printed to console. 'ansi' (default) writes truecolor escape sequences for runs of the same color (fast, used when terminal supports truecolor), 'half' draws two points in one character using upper half block (fits 4 times more points in the same area). 'rich' renders each point as rich segment. Maps wider than the terminal are downsampled (see --fit-width).",
+)
+@click.option(
+    "--fit-width/--full-width",
+    "fit_width",
+    default=True,
+    help="Downsample printed map to fit terminal width (default) or print all points.",
+)
 @click.option(
     "--export-xp-filename",
     "-x",
@@ -72,6 +210,13 @@ from trogon import tui
     # default=MAP_NAME,
     help="File name (without extension) to export map using json format (.json).",
 )
+@click.option(
+    "--export-map-filename",
+    "-b",
+    "export_map",
+    type=str,
+    help="File name (without extension) to export map using compact binary format (.hmap). It keeps height map as typed array (1 or 2 bytes per point) with generation parameters and can be loaded back with DiamondSquare.load_from_map.",
+)
 @click.option(
     "--export-png-filename",
     "-i",
@@ -82,13 +227,52 @@ from trogon import tui
     help="File name (without extension) to export map PNG file format (.png).",
 )
 @click.option(
-    "--scale-up",
-    "-u",
-    "scale_up",
+    "--xp-gzip/--xp-raw",
+    "xp_gzip",
+    default=XP_COMPRESS,
+    help="Save .xp file compressed with gzip (like Rexpaint does) or uncompressed (default).",
+)
+@click.option(
+    "--json-compact/--json-indent",
+    "json_compact",
+    default=JSON_COMPACT,
+    help="Save .json file without indentation and spaces (several times smaller) or indented, one value per line (default).",
+)
+@click.option(
+    "--map-zlib/--map-raw",
+    "map_zlib",
+    default=MAP_COMPRESS,
+    help="Save .hmap file compressed with zlib or uncompressed (default). Uncompressed files are memory mapped when loaded, so even huge maps open instantly.",
+)
+@click.option(
+    "--png-indexed/--png-rgb",
+    "png_indexed",
+    default=PNG_INDEXED,
+    help="Save PNG with indexed colors (palette mode, 1 byte per pixel instead of 3, faster to save) or as RGB image (default). Indexed mode is used only with palettes up to 256 colors.",
+)
+@engine_option
+@cache_option
+@click.option(
+    "--workers",
+    "-w",
+    "workers",
     type=click.IntRange(min=1),
-    default=SCALE_UP,
-    help="Map size scale up factor used while saving to PNG files (see --export-png-filename). With default value of 1 you end up with one pixel per height map value which means a really tiny image. With scale up = 5, each height map point results in 5x5 pixels rectangle. Linear scaling is used in order to preserve exact height values (no interpolation).",
+    help="Number of threads used by 'parallel' engine. Skip to use one per CPU core.",
 )
+@click.option(
+    "--memmap-file",
+    "memmap_file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Keep height map in this file instead of memory (numpy memmap) and generate/export it in bands. Use it for maps too big to fit in memory (e.g. 65537). Combine with --no-printout.",
+)
+@click.option(
+    "--memory-budget",
+    "memory_budget",
+    type=click.IntRange(min=1),
+    default=MEMORY_BUDGET // (1024 * 1024),
+    help="Memory budget in MB for generation and exports when --memmap-file is used.",
+)
+@scale_up_option
 @click.option(
     "--seed",
     "-s",
@@ -96,22 +280,66 @@ from trogon import tui
     type=int,
     help="Seed for random number generator. Skip to get random maps with each run. If you like the results make sure to note currently used seed. Use explicit value to generate the same map multiple times, still being able to fine tune it (e.g. change roughness level or palette).",
 )
-@click.command(
-    help="Generate height map using diamond square algorithm. Add 'generate --help' to your command to get more help the parameters or use 'tui' command instead 'generate'."
+@click.option(
+    "--profile/--no-profile",
+    default=False,
+    help=f"Print time, peak memory (tracemalloc) and throughput of each step (generation, palette, legend, printing, each export) after the run. Tracing memory slows the run down a bit. Can be also turned on with {profiling.PROFILE_ENV} environment variable.",
+)
+@click.option(
+    "--profile-output",
+    "profile_output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Save profile to file (implies --profile): '.json' - Chrome trace of steps (open in chrome://tracing or ui.perfetto.dev), '.pstats' or '.prof' - cProfile stats of the whole run (open with pstats, snakeviz...).",
+)
+@cli.command(
+    help="Generate height map using diamond square (default) or another algorithm (see --algorithm). Add 'generate --help' to your command to get more help the parameters or use 'tui' command instead 'generate'."
 )
 def generate(
-    map_size: str,
+    algorithm: str,
+    map_size: int,
+    map_height: int | None,
     roughness: float,
     random_seed: int | None,
     height_max: int | None,
     palette: str,
+    erosion: str | None,
+    erosion_iterations: int,
+    erosion_time_budget: float | None,
     printout: bool,
+    renderer: str,
+    fit_width: bool,
     export_xp: str,
     export_json: str,
+    export_map: str,
     export_png: str,
     scale_up: int,
+    png_indexed: bool,
+    xp_gzip: bool,
+    map_zlib: bool,
+    json_compact: bool,
+    engine: str,
+    cache: bool,
+    memmap_file: str | None,
+    memory_budget: int,
+    workers: int | None,
+    profile: bool,
+    profile_output: str | None,
 ):
-    map_size_int: int = int(map_size)
+    validate_algorithm_size(algorithm, map_size, map_height)
+    if profile_output is not None and not any(
+        profile_output.endswith(extension)
+        for extension in profiling.CHROME_TRACE_EXTENSIONS + profiling.PSTATS_EXTENSIONS
+    ):
+        raise click.BadParameter(
+            "profile file must end with .json, .pstats or .prof.",
+            param_hint="'--profile-output'",
+        )
+    if profile or profile_output is not None:
+        profiling.start(profile_output)
+    # started before import, so loading of the generator is profiled too
+    with profiling.phase("import"):
+        from tui_map_generator.diamond_square import DiamondSquare
+
     if random_seed is None:
         random_seed_int = random.randint(0, 10000)
     else:
@@ -121,35 +349,260 @@ def generate(
         height_max = HEIGHT_MAX
     map_name = MAP_NAME
 
+    map_cache = None
+    if cache and memmap_file is None:
+        from tui_map_generator.cache import MapCache
+
+        map_cache = MapCache()
+
     ds = DiamondSquare(
-        map_size_int,
+        map_size,
         roughness=roughness,
         random_seed=random_seed_int,
         height_max=height_max,
         map_name=map_name,
         palette=palette,
+        engine=engine,
+        memmap_file=memmap_file,
+        memory_budget=memory_budget * 1024 * 1024,
+        workers=workers,
+        algorithm=algorithm,
+        map_height=map_height,
+        map_cache=map_cache,
     )
 
     ds.generate()
+    if erosion is not None:
+        ds.erode(erosion, erosion_iterations, erosion_time_budget)
 
     if printout:
-        ds.print_height_map()
+        ds.print_height_map(renderer, fit_width)
+
+    # all formats are saved at once (see DiamondSquare.export)
+    exports = {
+        "xp": export_xp,
+        "json": export_json,
+        "hmap": export_map,
+        "png": export_png,
+    }
+    names = {export_format: name for export_format, name in exports.items() if name}
+    if names:
+        ds.export(
+            list(names),
+            names,
+            xp_compress=xp_gzip,
+            json_compact=json_compact,
+            map_compress=map_zlib,
+            scale_up=scale_up,
+            png_indexed=png_indexed,
+        )
+
+    profiling.finish(ds.console)
+
+
+@algorithm_option
+@map_size_option
+@map_height_option
+@palette_option
+@roughness_option
+@height_option
+@engine_option
+@cache_option
+@click.option(
+    "--cache-exports/--no-cache-exports",
+    "cache_exports",
+    default=BATCH_CACHE_EXPORTS,
+    help="Keep exported files of the batch in the cache too (by default only height maps are cached, exports of big batches would fill the cache and push out other maps).",
+)
+@scale_up_option
+@click.option(
+    "--seeds",
+    "-s",
+    "seeds",
+    type=str,
+    required=True,
+    help="Seeds to generate maps for: a range 'start..stop' (stop excluded, e.g. '0..100' gives seeds 0 to 99) or a list '1,5,7'.",
+)
+@click.option(
+    "--format",
+    "-f",
+    "formats",
+    type=click.Choice(EXPORT_FORMATS, case_sensitive=False),
+    multiple=True,
+    default=["json"],
+    help="Export format, repeat to export to more formats (e.g. -f json -f png). Each map is saved as '<map name>_<seed>.<format>' in maps folder.",
+)
+@click.option(
+    "--map-name",
+    "-n",
+    "map_name",
+    type=str,
+    default=MAP_NAME,
+    help="Base name of exported files.",
+)
+@click.option(
+    "--workers",
+    "-w",
+    "workers",
+    type=click.IntRange(min=1),
+    help="Number of worker processes. Skip to use one per CPU core, use 1 to generate in the current process.",
+)
+@cli.command(
+    name="generate-batch",
+    help="Generate and export height maps for many seeds at once using a pool of processes. Palette and legend template are prepared once per process and maps are saved as soon as they are ready.",
+)
+def generate_batch_command(
+    algorithm: str,
+    map_size: int,
+    map_height: int | None,
+    palette: str,
+    roughness: float,
+    height_max: int,
+    engine: str,
+    cache: bool,
+    cache_exports: bool,
+    scale_up: int,
+    seeds: str,
+    formats: list[str],
+    map_name: str,
+    workers: int | None,
+):
+    validate_algorithm_size(algorithm, map_size, map_height)
+    from tui_map_generator.batch import generate_batch, parse_seeds
+    from tui_map_generator.cache import MapCache
+
+    try:
+        seeds_list = parse_seeds(seeds)
+    except ValueError:
+        raise click.BadParameter(
+            f"'{seeds}' is neither a range 'start..stop' nor a list of seeds '1,5,7'.",
+            param_hint="'--seeds'",
+        )
 
-    if export_xp:
-        ds.map_name = export_xp
-        ds.save_to_xp()
+    generate_batch(
+        seeds_list,
+        map_size,
+        formats=list(formats),
+        map_name=map_name,
+        scale_up=scale_up,
+        workers=workers,
+        roughness=roughness,
+        height_max=height_max,
+        palette=palette,
+        engine=engine,
+        algorithm=algorithm,
+        map_height=map_height,
+        map_cache=MapCache(exports=cache_exports) if cache else None,
+    )
 
-    if export_json:
-        ds.map_name = export_json
-        ds.save_to_json()
 
-    if export_png:
-        ds.map_name = export_png
-        ds.save_to_png(scale_up)
+@click.option(
+    "--map-size",
+    "-m",
+    "sizes",
+    type=int,
+    multiple=True,
+    callback=lambda ctx, param, values: [
+        validate_map_size(ctx, param, value) for value in values
+    ],
+    help="Map size to measure, repeat to measure more sizes (default 65, 257 and 1025).",
+)
+@click.option(
+    "--palette",
+    "-p",
+    "palettes",
+    type=click.Choice(PALETTE_REGISTRY.names(), case_sensitive=True),
+    multiple=True,
+    help="Palette to measure, repeat to measure more palettes (default landscape_16 and grey_128).",
+)
+@click.option(
+    "--operation",
+    "-o",
+    "operations",
+    type=str,
+    multiple=True,
+    help="Operation to measure (generate, erode, convert_to_str, print_height_map, save_to_png, save_to_xp, save_to_json, save_to_map, load_from_xp, load_from_json, load_from_map), repeat to measure more. Skip to measure all. Loads save the file first (not timed) when the matching save is not measured.",
+)
+@click.option(
+    "--repeat",
+    "-r",
+    type=click.IntRange(min=1),
+    default=3,
+    help="Number of runs of each operation, the best time is reported.",
+)
+@click.option(
+    "--output",
+    "output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Save results as JSON file (can be used later as --baseline).",
+)
+@click.option(
+    "--baseline",
+    "baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    help="JSON file with results of previous run to compare with. Command fails (exit code 1) if any operation got slower by more than --tolerance.",
+)
+@click.option(
+    "--tolerance",
+    type=click.FloatRange(min=0.0),
+    default=0.25,
+    help="Allowed slow down compared to baseline as a fraction (0.25 means 25% slower is still fine).",
+)
+@click.option(
+    "--startup/--no-startup",
+    default=False,
+    help="Also check start up time of the command line (fails if it is too slow).",
+)
+@cli.command(
+    help="Measure generation, printing and every export and load for given map sizes and palettes. Results are printed as tables and can be saved as JSON and compared with a baseline to catch performance regressions.",
+)
+@click.pass_context
+def bench(
+    ctx,
+    sizes: list[int],
+    palettes: list[str],
+    operations: list[str],
+    repeat: int,
+    output: str | None,
+    baseline: str | None,
+    tolerance: float,
+    startup: bool,
+):
+    from tui_map_generator import benchmark
+    import json
+
+    unknown = [o for o in operations if o not in benchmark.SUITE_OPERATIONS]
+    if unknown:
+        raise click.BadParameter(
+            f"unknown operation(s): {', '.join(unknown)}.", param_hint="'--operation'"
+        )
+
+    report = benchmark.bench_suite(
+        list(sizes) or benchmark.SUITE_SIZES,
+        list(palettes) or benchmark.SUITE_PALETTES,
+        list(operations) or benchmark.SUITE_OPERATIONS,
+        repeat,
+    )
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        click.echo(f"Results saved to '{output}'.")
+
+    failed = False
+    if baseline:
+        with open(baseline, "r", encoding="utf-8") as f:
+            baseline_report = json.load(f)
+        failed = (
+            len(benchmark.compare_with_baseline(report, baseline_report, tolerance)) > 0
+        )
+    if startup:
+        failed = not benchmark.bench_startup() or failed
+    if failed:
+        ctx.exit(1)
 
 
 if __name__ == "__main__":
-    generate()
+    cli()
     # dungeon
     # python ds.py 129 7 4 6627
     # mono tunnel
@@ -0,0 +1,87 @@
+from importlib import import_module
+from typing import Callable
+from tui_map_generator.defaults import ALGORITHM, is_valid_map_size
+
+# generators of height maps, shared by DiamondSquare (palettes, printing,
+# exports). An algorithm fills given height map in place:
+# generate(height_map, roughness, height_min, height_max, random_seed,
+#          memory_budget, release)
+# and is given as a function or "module:function" (imported on first use, so
+# the registry stays light for the command line). Diamond square has no
+# function here, it is run by DiamondSquare engines (see ENGINES)
+TGenerate = Callable[..., object]
+
+
+class Algorithm:
+    def __init__(
+        self,
+        name: str,
+        generate: TGenerate | str | None,
+        description: str,
+        power_of_two_sizes: bool = False,
+        version: int = 1,
+    ):
+        self.name = name
+        self.target = generate
+        self.description = description
+        # only square maps of 2^n + 1 size
+        self.power_of_two_sizes = power_of_two_sizes
+        # change when the algorithm gives different maps for the same
+        # parameters, so cached maps (see cache.MapCache) are not reused
+        self.version = version
+
+    @property
+    def generate(self) -> TGenerate:
+        if isinstance(self.target, str):
+            module_name, function_name = self.target.split(":")
+            self.target = getattr(import_module(module_name), function_name)
+        if self.target is None:
+            raise Exception(f"Algorithm '{self.name}' is run by DiamondSquare engines.")
+        return self.target
+
+
+ALGORITHMS: dict[str, Algorithm] = {}
+
+
+def register_algorithm(algorithm: Algorithm):
+    ALGORITHMS[algorithm.name] = algorithm
+
+
+def get_algorithm(name: str) -> Algorithm:
+    if name not in ALGORITHMS:
+        raise Exception(
+            f"Unknown algorithm '{name}'. Available algorithms: {', '.join(ALGORITHMS)}."
+        )
+    return ALGORITHMS[name]
+
+
+def is_valid_size(name: str, width: int, height: int | None = None) -> bool:
+    if height is None:
+        height = width
+    if ALGORITHMS[name].power_of_two_sizes:
+        return width == height and is_valid_map_size(width)
+    return width >= 2 and height >= 2
+
+
+register_algorithm(
+    Algorithm(
+        ALGORITHM,
+        None,
+        "midpoint displacement on a square grid, 2^n + 1 sizes only",
+        power_of_two_sizes=True,
+    )
+)
+register_algorithm(
+    Algorithm(
+        "fbm",
+        "tui_map_generator.noise:fbm",
+        "fractal Brownian motion, octaves of gradient noise, roughness sets how strong small details are",
+    )
+)
+register_algorithm(
+    Algorithm(
+        "perlin",
+        "tui_map_generator.noise:perlin",
+        "single octave of gradient noise (smooth hills), roughness is not used",
+    )
+)
@@ -0,0 +1,132 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+from typing import Iterable, Sequence
+from rich.console import Console
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    TextColumn,
+    TimeElapsedColumn,
+    TimeRemainingColumn,
+)
+from tui_map_generator.diamond_square import DiamondSquare, MAP_NAME, SCALE_UP
+
+# maps are named after the seed, e.g. height_map_42
+BATCH_MAP_NAME = "{map_name}_{seed}"
+
+# generator reused by all maps of a worker process, see init_worker
+worker_ds: DiamondSquare | None = None
+worker_options: dict = {}
+
+
+def parse_seeds(seeds: str) -> range | list[int]:
+    # "0..100" (stop excluded, like range) or "1,5,7"
+    if ".." in seeds:
+        start, stop = seeds.split("..", 1)
+        return range(int(start), int(stop))
+    return [int(seed) for seed in seeds.split(",") if seed.strip()]
+
+
+def init_worker(
+    map_size: int,
+    generator_options: dict,
+    formats: Sequence[str],
+    map_name: str,
+    scale_up: int,
+):
+    # palette, legend template and console are set up once per process
+    global worker_ds, worker_options
+    worker_ds = DiamondSquare(map_size, **generator_options)
+    worker_ds.console = Console(quiet=True)
+    worker_options = {
+        "formats": list(formats),
+        "map_name": map_name,
+        "scale_up": scale_up,
+    }
+
+
+def generate_seed(seed: int) -> tuple[int, float]:
+    ds = worker_ds
+    if ds is None:
+        raise Exception("Batch worker has not been initialized.")
+
+    start = perf_counter()
+    ds.random_seed = seed
+    ds.map_name = BATCH_MAP_NAME.format(map_name=worker_options["map_name"], seed=seed)
+    ds.generate()
+
+    # processes already use all cores, formats are saved one after another
+    ds.export(worker_options["formats"], scale_up=worker_options["scale_up"], workers=1)
+
+    return seed, perf_counter() - start
+
+
+def generate_batch(
+    seeds: Iterable[int],
+    map_size: int,
+    formats: Sequence[str] = ("json",),
+    map_name: str = MAP_NAME,
+    scale_up: int = SCALE_UP,
+    workers: int | None = None,
+    console: Console | None = None,
+    **generator_options,
+) -> dict:
+    # generates and exports one map per seed, maps are written to disk by the
+    # workers as soon as they are ready, generator_options go to DiamondSquare
+    if console is None:
+        console = Console()
+    seeds = list(seeds)
+    init_args = (map_size, generator_options, formats, map_name, scale_up)
+
+    progress = Progress(
+        TextColumn("[bold]Generating maps"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TextColumn("[magenta]{task.fields[rate]:.1f} maps/s"),
+        TimeElapsedColumn(),
+        TimeRemainingColumn(),
+        console=console,
+    )
+
+    start = perf_counter()
+    generation_time = 0.0
+    with progress:
+        task = progress.add_task("batch", total=len(seeds), rate=0.0)
+
+        def advance(seconds: float):
+            nonlocal generation_time
+            generation_time += seconds
+            done = progress.tasks[task].completed + 1
+            progress.update(task, advance=1, rate=done / (perf_counter() - start))
+
+        if workers == 1:
+            init_worker(*init_args)
+            for seed in seeds:
+                advance(generate_seed(seed)[1])
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=init_worker, initargs=init_args
+            ) as executor:
+                futures = [executor.submit(generate_seed, seed) for seed in seeds]
+                for future in as_completed(futures):
+                    advance(future.result()[1])
+
+    elapsed = perf_counter() - start
+    summary = {
+        "maps": len(seeds),
+        "seconds": elapsed,
+        "maps_per_second": len(seeds) / elapsed if elapsed > 0 else 0.0,
+        "seconds_per_map": generation_time / len(seeds) if seeds else 0.0,
+    }
+
+    padding = 15
+    console.print(f"[bold]{'Maps':{padding}}[/]: [magenta]{summary['maps']}[/]")
+    console.print(f"[bold]{'Total time':{padding}}[/]: [magenta]{elapsed:.2f}s[/]")
+    console.print(
+        f"[bold]{'Throughput':{padding}}[/]: [magenta]{summary['maps_per_second']:.1f} maps/s[/]"
+    )
+    console.print(
+        f"[bold]{'Time per map':{padding}}[/]: [magenta]{summary['seconds_per_map'] * 1000:.1f}ms[/] (in worker)"
+    )
+    return summary
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+from tui_map_generator.algorithms import ALGORITHMS
+from tui_map_generator.region import RegionMap
+from tui_map_generator.diamond_square import (
+    ALGORITHM,
+    DiamondSquare,
+    ENGINE,
+    ENGINES,
+    HEIGHT_MAX,
+    MAPS_FOLDER,
+    PALETTE_REGISTRY,
+    ROUGHNESS,
+    RANDOM_SEED,
+)
+
+# all valid diamond square sizes from 9 to 4097
+BENCHMARK_SIZES = [2**n + 1 for n in range(3, 13)]
+PARALLEL_BENCHMARK_SIZES = [1025, 2049, 4097]
+# windows of a huge map generated by RegionMap, moved by half a window each time
+REGION_MAP_SIZE = 65537
+REGION_WINDOW = 256
+REGION_QUERIES = 8
+# noise algorithms take any size, these are compared with diamond square
+ALGORITHM_BENCHMARK_SIZES = [65, 257, 1025, 2049]
+# maps exported with the loop engine, used to check that seeds keep giving the same maps
+GOLDEN_MAPS = "example_0*.json"
+# commands timed by bench_startup (each in a fresh interpreter)
+STARTUP_COMMANDS = {
+    "generate --help": ["-m", "tui_map_generator", "generate", "--help"],
+    "import package": ["-c", "import tui_map_generator"],
+    "import generator": ["-c", "import tui_map_generator.diamond_square"],
+}
+STARTUP_RUNS = 5
+# median time of "generate --help" above this limit (seconds) is a regression
+STARTUP_LIMIT: float = 0.5
+# modules which must not be imported just to parse command line
+STARTUP_HEAVY_MODULES = ["numpy", "PIL", "rich", "rich_pixels", "pyrexpaint", "trogon"]
+# operations timed by bench_suite (see suite_operations)
+SUITE_SIZES = [65, 257, 1025]
+SUITE_PALETTES = ["landscape_16", "grey_128"]
+SUITE_OPERATIONS = [
+    "generate",
+    "erode",
+    "convert_to_str",
+    "print_height_map",
+    "save_to_png",
+    "save_to_xp",
+    "save_to_json",
+    "save_to_map",
+    "load_from_xp",
+    "load_from_json",
+    "load_from_map",
+]
+# loads read the file of the matching save, it is run first (not timed) when
+# only the load is measured
+SUITE_SETUP = {
+    "load_from_xp": "save_to_xp",
+    "load_from_json": "save_to_json",
+    "load_from_map": "save_to_map",
+}
+# iterations of "erode" operation (both kinds of erosion)
+SUITE_EROSION_ITERATIONS = 10
+# best of SUITE_REPEAT runs is reported
+SUITE_REPEAT = 3
+# result slower than baseline by more than this fraction is a regression
+SUITE_TOLERANCE: float = 0.25
+# results faster than this (seconds) are too noisy to be compared
+SUITE_MIN_SECONDS: float = 0.005
+BENCH_FILE_VERSION = 1
+
+
+def time_engine(
+    engine: str,
+    map_size: int,
+    height_max: int = HEIGHT_MAX,
+    roughness: float = ROUGHNESS,
+    random_seed: int = RANDOM_SEED,
+    workers: int | None = None,
+    algorithm: str = ALGORITHM,
+) -> dict:
+    ds = DiamondSquare(
+        map_size,
+        height_max=height_max,
+        roughness=roughness,
+        random_seed=random_seed,
+        engine=engine,
+        workers=workers,
+        algorithm=algorithm,
+    )
+    start = perf_counter()
+    ds.generate()
+    elapsed = perf_counter() - start
+
+    heights = np.asarray(ds.height_map)
+    return {
+        "algorithm": algorithm,
+        "engine": engine,
+        "map_size": map_size,
+        "workers": workers,
+        "checksum": hash(heights.tobytes()),
+        "seconds": elapsed,
+        "cells_per_second": map_size * map_size / elapsed,
+        "mean": float(heights.mean()),
+        "std": float(heights.std()),
+    }
+
+
+def bench_engines(
+    sizes: list[int] = BENCHMARK_SIZES,
+    engines: list[str] = ENGINES,
+    console: Console | None = None,
+) -> list[dict]:
+    if console is None:
+        console = Console()
+
+    table = Table(title="diamond square engines")
+    table.add_column("Map size", justify="right")
+    table.add_column("Engine")
+    table.add_column("Time [s]", justify="right")
+    table.add_column("Cells/s", justify="right")
+    table.add_column("Speed up", justify="right")
+    table.add_column("Mean", justify="right")
+    table.add_column("Std", justify="right")
+
+    results = []
+    for map_size in sizes:
+        size_results = [time_engine(engine, map_size) for engine in engines]
+        # speed up is relative to the reference loop engine (if measured)
+        reference = next(
+            (r["seconds"] for r in size_results if r["engine"] == "loop"),
+            size_results[0]["seconds"],
+        )
+        for result in size_results:
+            table.add_row(
+                str(map_size),
+                result["engine"],
+                f"{result['seconds']:.4f}",
+                f"{result['cells_per_second']:,.0f}",
+                f"{reference / result['seconds']:.1f}x",
+                f"{result['mean']:.2f}",
+                f"{result['std']:.2f}",
+            )
+        results.extend(size_results)
+
+    console.print(table)
+    return results
+
+
+def bench_parallel(
+    sizes: list[int] = PARALLEL_BENCHMARK_SIZES,
+    max_workers: int | None = None,
+    console: Console | None = None,
+) -> list[dict]:
+    # scaling of parallel engine from 1 to N cores, maps must be the same for all
+    if console is None:
+        console = Console()
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    table = Table(title=f"parallel engine scaling ({os.cpu_count()} CPU cores)")
+    table.add_column("Map size", justify="right")
+    table.add_column("Workers", justify="right")
+    table.add_column("Time [s]", justify="right")
+    table.add_column("Cells/s", justify="right")
+    table.add_column("Speed up", justify="right")
+    table.add_column("Efficiency", justify="right")
+    table.add_column("Same map", justify="center")
+
+    results = []
+    for map_size in sizes:
+        size_results = [
+            time_engine("parallel", map_size, workers=workers)
+            for workers in range(1, max_workers + 1)
+        ]
+        reference = size_results[0]
+        for result in size_results:
+            speed_up = reference["seconds"] / result["seconds"]
+            table.add_row(
+                str(map_size),
+                str(result["workers"]),
+                f"{result['seconds']:.4f}",
+                f"{result['cells_per_second']:,.0f}",
+                f"{speed_up:.2f}x",
+                f"{speed_up / result['workers']:.0%}",
+                "yes" if result["checksum"] == reference["checksum"] else "[red]NO[/]",
+            )
+        results.extend(size_results)
+
+    console.print(table)
+    return results
+
+
+def bench_algorithms(
+    sizes: list[int] = ALGORITHM_BENCHMARK_SIZES,
+    algorithms: list[str] = list(ALGORITHMS),
+    console: Console | None = None,
+) -> list[dict]:
+    # generation time of each algorithm, speed up is relative to diamond
+    # square with the default engine
+    if console is None:
+        console = Console()
+
+    table = Table(title="algorithms")
+    table.add_column("Map size", justify="right")
+    table.add_column("Algorithm")
+    table.add_column("Time [s]", justify="right")
+    table.add_column("Cells/s", justify="right")
+    table.add_column("Speed up", justify="right")
+    table.add_column("Mean", justify="right")
+    table.add_column("Std", justify="right")
+
+    results = []
+    for map_size in sizes:
+        size_results = [
+            time_engine(ENGINE, map_size, algorithm=algorithm)
+            for algorithm in algorithms
+        ]
+        reference = next(
+            (r["seconds"] for r in size_results if r["algorithm"] == ALGORITHM),
+            size_results[0]["seconds"],
+        )
+        for result in size_results:
+            table.add_row(
+                str(map_size),
+                result["algorithm"],
+                f"{result['seconds']:.4f}",
+                f"{result['cells_per_second']:,.0f}",
+                f"{reference / result['seconds']:.1f}x",
+                f"{result['mean']:.2f}",
+                f"{result['std']:.2f}",
+            )
+        results.extend(size_results)
+
+    console.print(table)
+    return results
+
+
+def bench_region(
+    map_size: int = REGION_MAP_SIZE,
+    window: int = REGION_WINDOW,
+    queries: int = REGION_QUERIES,
+    console: Console | None = None,
+) -> list[dict]:
+    # viewport panning over a huge map, later queries reuse cached ancestors
+    if console is None:
+        console = Console()
+
+    table = Table(title=f"{window}x{window} windows of {map_size}x{map_size} map")
+    table.add_column("Query", justify="right")
+    table.add_column("Time [s]", justify="right")
+    table.add_column("Cells/s", justify="right")
+    table.add_column("Tiles generated", justify="right")
+    table.add_column("Tiles reused", justify="right")
+
+    region_map = RegionMap(map_size)
+    x = y = map_size // 2
+    results = []
+    for query in range(queries):
+        generated, reused = region_map.generated, region_map.reused
+        start = perf_counter()
+        region_map.region(x + query * window // 2, y, window, window)
+        elapsed = perf_counter() - start
+        result = {
+            "query": query,
+            "seconds": elapsed,
+            "cells_per_second": window * window / elapsed,
+            "generated": region_map.generated - generated,
+            "reused": region_map.reused - reused,
+        }
+        table.add_row(
+            str(query + 1),
+            f"{elapsed:.4f}",
+            f"{result['cells_per_second']:,.0f}",
+            str(result["generated"]),
+            str(result["reused"]),
+        )
+        results.append(result)
+
+    console.print(table)
+    return results
+
+
+def check_golden_maps(
+    engine: str = "exact",
+    maps_folder: Path = Path(MAPS_FOLDER),
+    console: Console | None = None,
+) -> bool:
+    if console is None:
+        console = Console()
+
+    all_equal = True
+    for file_name in sorted(maps_folder.glob(GOLDEN_MAPS)):
+        with open(file_name, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        parameters = data["parameters"]
+        ds = DiamondSquare(
+            parameters["Map size"],
+            height_max=parameters["Max height"],
+            roughness=parameters["Roughness"],
+            random_seed=parameters["Random seed"],
+            palette=parameters["Palette"],
+            engine=engine,
+        )
+        ds.generate()
+        equal = bool(np.array_equal(ds.height_map, data["height_map"]))
+        all_equal = all_equal and equal
+        status = "[green]OK[/]" if equal else "[red]DIFFERENT[/]"
+        console.print(f"[bold]{file_name}[/] ({engine}): {status}")
+
+    return all_equal
+
+
+def time_command(args: list[str], runs: int = STARTUP_RUNS) -> float:
+    # median wall time of running python with args in a new process
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run(
+            [sys.executable, *args],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        times.append(perf_counter() - start)
+    return statistics.median(times)
+
+
+def heavy_startup_modules() -> list[str]:
+    # heavy modules imported by the command line module itself
+    check = f"import sys, tui_map_generator.__main__; print(' '.join(m for m in {STARTUP_HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", check], check=True, capture_output=True, text=True
+    )
+    return result.stdout.split()
+
+
+def bench_startup(
+    runs: int = STARTUP_RUNS,
+    limit: float = STARTUP_LIMIT,
+    console: Console | None = None,
+) -> bool:
+    # startup regression check, False if "generate --help" got slower than
+    # limit or command line module imports heavy dependencies again
+    if console is None:
+        console = Console()
+
+    table = Table(title=f"startup time (median of {runs} runs)")
+    table.add_column("Command")
+    table.add_column("Time [s]", justify="right")
+    times = {}
+    for name, args in STARTUP_COMMANDS.items():
+        times[name] = time_command(args, runs)
+        table.add_row(name, f"{times[name]:.3f}")
+    console.print(table)
+
+    heavy = heavy_startup_modules()
+    ok = times["generate --help"] <= limit and len(heavy) == 0
+    if heavy:
+        console.print(f"[red]Command line imports heavy modules:[/] {', '.join(heavy)}")
+    status = "[green]OK[/]" if ok else "[red]REGRESSION[/]"
+    console.print(f"[bold]Startup[/] (limit {limit:.2f}s): {status}")
+    return ok
+
+
+def suite_operations(ds: DiamondSquare) -> dict[str, Callable[[], object]]:
+    # generate must go first, loads read files saved before them
+    return {
+        "generate": ds.generate,
+        "erode": lambda: ds.erode("both", SUITE_EROSION_ITERATIONS),
+        "convert_to_str": ds.convert_to_str,
+        "print_height_map": ds.print_height_map,
+        "save_to_png": ds.save_to_png,
+        "save_to_xp": ds.save_to_xp,
+        "save_to_json": ds.save_to_json,
+        "save_to_map": ds.save_to_map,
+        "load_from_xp": ds.load_from_xp,
+        "load_from_json": ds.load_from_json,
+        "load_from_map": ds.load_from_map,
+    }
+
+
+def time_operations(
+    map_size: int,
+    palette: str,
+    operations: list[str] = SUITE_OPERATIONS,
+    repeat: int = SUITE_REPEAT,
+    engine: str = ENGINE,
+) -> list[dict]:
+    # maps are printed to a console writing to nowhere (but still as
+    # truecolor terminal, so the default renderer is measured)
+    results = []
+    with open(os.devnull, "w") as null:
+        ds = DiamondSquare(
+            map_size,
+            height_max=len(PALETTE_REGISTRY.palettes[palette]),
+            palette=palette,
+            engine=engine,
+            map_name=f"bench_{map_size}_{palette}",
+        )
+        ds.console = Console(
+            file=null, force_terminal=True, color_system="truecolor", width=200
+        )
+        suite = suite_operations(ds)
+        for name, operation in suite.items():
+            if name not in operations:
+                continue
+            setup = SUITE_SETUP.get(name)
+            if setup is not None and setup not in operations:
+                suite[setup]()
+            times = []
+            for _ in range(repeat):
+                # loading replaces generated map, generate works on a fresh one
+                if name == "generate":
+                    ds.generation = None
+                start = perf_counter()
+                operation()
+                times.append(perf_counter() - start)
+            seconds = min(times)
+            results.append(
+                {
+                    "operation": name,
+                    "map_size": map_size,
+                    "palette": palette,
+                    "seconds": seconds,
+                    "cells_per_second": map_size * map_size / seconds,
+                }
+            )
+    return results
+
+
+def bench_suite(
+    sizes: list[int] = SUITE_SIZES,
+    palettes: list[str] = SUITE_PALETTES,
+    operations: list[str] = SUITE_OPERATIONS,
+    repeat: int = SUITE_REPEAT,
+    console: Console | None = None,
+) -> dict:
+    # files are saved in temporary maps folder (relative to working directory)
+    if console is None:
+        console = Console()
+
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            for map_size in sizes:
+                for palette in palettes:
+                    results.extend(
+                        time_operations(map_size, palette, operations, repeat)
+                    )
+        finally:
+            os.chdir(cwd)
+
+    table = Table(title=f"operations (best of {repeat} runs)")
+    table.add_column("Map size", justify="right")
+    table.add_column("Palette")
+    table.add_column("Operation")
+    table.add_column("Time [s]", justify="right")
+    table.add_column("Cells/s", justify="right")
+    for result in results:
+        table.add_row(
+            str(result["map_size"]),
+            result["palette"],
+            result["operation"],
+            f"{result['seconds']:.4f}",
+            f"{result['cells_per_second']:,.0f}",
+        )
+    console.print(table)
+
+    return {
+        "version": BENCH_FILE_VERSION,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def result_key(result: dict) -> tuple:
+    return result["operation"], result["map_size"], result["palette"]
+
+
+def compare_with_baseline(
+    report: dict,
+    baseline: dict,
+    tolerance: float = SUITE_TOLERANCE,
+    console: Console | None = None,
+) -> list[dict]:
+    # results slower than baseline by more than tolerance (empty - no regressions),
+    # results missing in baseline are skipped
+    if console is None:
+        console = Console()
+
+    baseline_results = {result_key(r): r for r in baseline["results"]}
+    table = Table(title=f"comparison with baseline (tolerance {tolerance:.0%})")
+    table.add_column("Map size", justify="right")
+    table.add_column("Palette")
+    table.add_column("Operation")
+    table.add_column("Baseline [s]", justify="right")
+    table.add_column("Time [s]", justify="right")
+    table.add_column("Change", justify="right")
+    table.add_column("Status", justify="center")
+
+    regressions = []
+    for result in report["results"]:
+        reference = baseline_results.get(result_key(result))
+        if reference is None:
+            continue
+        change = result["seconds"] / reference["seconds"] - 1
+        noisy = max(result["seconds"], reference["seconds"]) < SUITE_MIN_SECONDS
+        regression = change > tolerance and not noisy
+        if regression:
+            regressions.append({**result, "baseline_seconds": reference["seconds"]})
+        table.add_row(
+            str(result["map_size"]),
+            result["palette"],
+            result["operation"],
+            f"{reference['seconds']:.4f}",
+            f"{result['seconds']:.4f}",
+            f"{change:+.0%}",
+            "[red]SLOWER[/]" if regression else "[green]OK[/]",
+        )
+    console.print(table)
+
+    if regressions:
+        console.print(
+            f"[bold red]{len(regressions)} regression(s)[/] compared to baseline."
+        )
+    else:
+        console.print("[bold green]No regressions[/] compared to baseline.")
+    return regressions
+
+
+if __name__ == "__main__":
+    check_golden_maps()
+    bench_startup()
+    bench_engines()
+    bench_algorithms()
+    bench_region()
+    bench_parallel()
@@ -0,0 +1,175 @@
+from pathlib import Path
+from typing import BinaryIO, Callable
+import hashlib
+import json
+import os
+import shutil
+import threading
+from tui_map_generator.defaults import CACHE_EXPORTS, CACHE_SIZE
+
+# content-addressed cache of generated maps (compact .hmap) and their exports,
+# files are named by sha256 of the parameters which decide their content, so
+# the same parameters always find the same file. Least recently used files
+# (by modification time, touched on every hit) are removed when the cache
+# grows over its size, files are written under temporary names and renamed,
+# so many processes can share one cache folder. The folder is scanned only
+# when the running total of its size (counted from the first scan, plus own
+# writes) goes over the limit, files of other processes are seen at next scan
+CACHE_ENV = "TUI_MAP_GENERATOR_CACHE"
+# change when generated maps or exported files change for the same parameters
+CACHE_VERSION = 1
+# eviction removes files until the cache takes this part of its size, so
+# next writes don't scan the folder again right away
+CACHE_EVICT_TO: float = 0.9
+
+
+def default_cache_folder() -> Path:
+    folder = os.environ.get(CACHE_ENV)
+    if folder:
+        return Path(folder)
+    return (
+        Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+        / "tui_map_generator"
+    )
+
+
+class MapCache:
+    def __init__(
+        self,
+        folder: str | Path | None = None,
+        max_bytes: int = CACHE_SIZE,
+        exports: bool = CACHE_EXPORTS,
+        hard_links: bool = False,
+    ):
+        self.folder = Path(folder) if folder is not None else default_cache_folder()
+        self.max_bytes = max_bytes
+        # keep exported files too (not only height maps)
+        self.exports = exports
+        # hits are hard linked instead of copied (instant, but the file is
+        # shared with the cache, so it must not be changed in place)
+        self.hard_links = hard_links
+        self.hits = 0
+        self.misses = 0
+        # size of cached files, None - not known until the folder is scanned
+        self.total: int | None = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # sent to batch worker processes without its lock
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def key(self, parameters: dict) -> str:
+        text = json.dumps(
+            {"cache version": CACHE_VERSION, **parameters},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def path(self, key: str, extension: str) -> Path:
+        return self.folder / key[:2] / f"{key}.{extension}"
+
+    def get(self, key: str, extension: str) -> Path | None:
+        path = self.path(key, extension)
+        try:
+            # hit makes the file the most recently used
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def write(self, key: str, extension: str, write: Callable[[BinaryIO], None]):
+        path = self.path(key, extension)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(
+            f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            with open(temporary, "wb") as f:
+                write(f)
+            size = temporary.stat().st_size
+            try:
+                size -= path.stat().st_size
+            except FileNotFoundError:
+                pass
+            os.replace(temporary, path)
+        finally:
+            temporary.unlink(missing_ok=True)
+        with self.lock:
+            if self.total is not None:
+                self.total += size
+            full = self.total is None or self.total > self.max_bytes
+        if full:
+            self.evict()
+
+    def put(self, key: str, extension: str, source: Path):
+        with open(source, "rb") as src:
+            self.write(key, extension, lambda f: shutil.copyfileobj(src, f))
+
+    def fetch(self, key: str, extension: str, target: Path) -> bool:
+        # copies (or links) cached file to target, False if not cached
+        path = self.get(key, extension)
+        if path is None:
+            return False
+        temporary = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        try:
+            if self.hard_links:
+                try:
+                    os.link(path, temporary)
+                except OSError:
+                    # other file system
+                    shutil.copyfile(path, temporary)
+            else:
+                shutil.copyfile(path, temporary)
+            os.replace(temporary, target)
+        except FileNotFoundError:
+            # evicted by another process in the meantime
+            self.hits -= 1
+            self.misses += 1
+            return False
+        finally:
+            temporary.unlink(missing_ok=True)
+        return True
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        # (last use, size, path) of cached files
+        entries = []
+        for path in self.folder.glob("*/*"):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # least recently used files go first, only when the cache is full
+        with self.lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                for _, size, path in entries:
+                    if total <= self.max_bytes * CACHE_EVICT_TO:
+                        break
+                    path.unlink(missing_ok=True)
+                    total -= size
+            self.total = total
+
+    def clear(self):
+        with self.lock:
+            for _, _, path in self.entries():
+                path.unlink(missing_ok=True)
+            self.total = 0
@@ -0,0 +1,69 @@
+# default settings shared by the generator and command line, this module must
+# stay light (no numpy, rich etc.), so "--help" doesn't wait for heavy imports
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+HEIGHT_NIL: int = 0
+HEIGHT_MIN: int = 1
+HEIGHT_MAX: int = 16
+# must be n^2 + 1
+HEIGHT_MAP_SIZE = 65
+ROUGHNESS: float = 16.0
+# RANDOM_SCALAR: float = ROUGHNESS
+RANDOM_SEED = 111
+COLOR_PALETTE = "landscape_16"
+SCALE_UP = 10
+# save PNG with indexed colors (palette mode) instead of RGB
+PNG_INDEXED = False
+# save json without indentation and spaces (much smaller files)
+JSON_COMPACT = False
+MAPS_FOLDER: str = "maps"
+MAP_NAME: str = "height_map"
+# gzip compress .xp files (Rexpaint saves compressed files, pyrexpaint reads only those)
+XP_COMPRESS = False
+# compress native map files (.hmap) with zlib, raw files can be memory mapped
+MAP_COMPRESS = False
+# "loop" is the reference pure Python implementation, "exact" gives the same maps
+# using array operations, "numpy" runs whole passes with numpy random generator,
+# "parallel" splits passes into bands processed by a pool of threads
+ENGINES = ["exact", "numpy", "parallel", "loop"]
+ENGINE = "exact"
+# peak memory used by out-of-core generation and exports (bytes)
+MEMORY_BUDGET: int = 256 * 1024 * 1024
+# "ansi" writes prebuilt truecolor escape sequences, one per run of cells with
+# the same color, "half" packs two rows of the map into one terminal row using
+# upper half block (fg - top point, bg - bottom point), "rich" renders each
+# cell as rich Segment (slow for big maps)
+RENDERERS = ["ansi", "half", "rich"]
+RENDERER = "ansi"
+EXPORT_FORMATS = ["json", "png", "xp", "hmap"]
+# generation algorithm, see algorithms.ALGORITHMS
+ALGORITHM = "diamond square"
+# post-processing of generated map (see DiamondSquare.erode)
+EROSION_KINDS = ["thermal", "hydraulic", "both"]
+EROSION_ITERATIONS: int = 50
+# on-disk cache of generated maps and exports used by the command line (see
+# cache.MapCache), size in bytes, least recently used files are removed first
+CACHE = True
+CACHE_SIZE: int = 1024 * 1024 * 1024
+CACHE_EXPORTS = True
+# exports of generate-batch are not cached by default (many files, used once)
+BATCH_CACHE_EXPORTS = False
+
+
+def is_valid_map_size(map_size: int) -> bool:
+    # diamond square needs map size to be 2^n + 1
+    return map_size >= 3 and (map_size - 1) & (map_size - 2) == 0
+
+
+def height_dtype(height_max: int) -> "np.dtype":
+    # smallest unsigned type holding all height values (numpy is imported by
+    # the first caller, it's already loaded by then)
+    import numpy as np
+
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if height_max <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
@@ -1,123 +1,181 @@
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from functools import lru_cache
+import gzip
 import json
 import random
 import math
+import os
 import numpy as np
-import string
-from PIL import Image
-from PIL.PngImagePlugin import PngInfo
-from sys import argv
-from typing import cast
+from typing import Callable, Iterable, Iterator, cast
 import struct
-from rich.segment import Segment, Segments
-from rich.style import Style
-from rich_pixels import Pixels
+from rich.segment import Segments
 from rich.console import Console
-import pyrexpaint
+import shutil
 from pathlib import Path
+from time import perf_counter
+from tui_map_generator import (
+    algorithms,
+    cache,
+    engines,
+    erosion,
+    incremental,
+    json_map,
+    map_file,
+    profiling,
+    render,
+    tiled,
+)
+from tui_map_generator.defaults import (
+    ALGORITHM,
+    COLOR_PALETTE,
+    ENGINE,
+    ENGINES,
+    EROSION_ITERATIONS,
+    EROSION_KINDS,
+    EXPORT_FORMATS,
+    HEIGHT_MAP_SIZE,
+    HEIGHT_MAX,
+    HEIGHT_MIN,
+    HEIGHT_NIL,
+    JSON_COMPACT,
+    MAP_COMPRESS,
+    MAP_NAME,
+    MAPS_FOLDER,
+    MEMORY_BUDGET,
+    PNG_INDEXED,
+    RANDOM_SEED,
+    RENDERER,
+    ROUGHNESS,
+    SCALE_UP,
+    XP_COMPRESS,
+    height_dtype,
+)
+from tui_map_generator.palettes import (
+    HEIGHT_TO_CHR_MAPPING,
+    PALETTE_REGISTRY,
+)
 
-# Example usage:
-HEIGHT_NIL: int = 0
-HEIGHT_MIN: int = 1
-HEIGHT_MAX: int = 16
-# must be n^2 + 1
-HEIGHT_MAP_SIZE = 65
-ROUGHNESS: float = 16.0
-# RANDOM_SCALAR: float = ROUGHNESS
-RANDOM_SEED = 111
-ALGORITHM_NAME = "diamond square"
-COLOR_PALETTE = "landscape_16"
-SCALE_UP = 10
+# legend name of the default algorithm (kept for API users)
+ALGORITHM_NAME = ALGORITHM
 # PRINT_FORMAT_LEN: int = 3
 JSON_INDENT: int = 4
-HEIGHT_TO_CHR_MAPPING = (
-    list(string.ascii_letters) + list("#$%&*=,.~+@^") + list(map(chr, range(191, 255)))
-)
-MAPS_FOLDER: str = "maps"
-MAP_NAME: str = "height_map"
 XP_LEGEND_START_X = 17
 XP_LEGEND_START_Y = 4
+XP_LEGEND_SEPARATOR_X = 15
 EXPORT_GLYPHS_LAYER = False
-
-THeightMap = list[list[int]]
-PALETTES_DICT = {}
+XP_COPY_CHUNK: int = 1024 * 1024
+
+# height map is kept as a compact 2D array, see height_dtype
+THeightMap = np.ndarray
+# ascii code of the glyph for each height (height 1 -> index 0)
+HEIGHT_TO_CHR_CODES = np.array(list(map(ord, HEIGHT_TO_CHR_MAPPING)), dtype=np.uint32)
+# one cell of a Rexpaint layer: glyph code, fg color, bg color (10 bytes)
+XP_CELL_DTYPE = np.dtype([("glyph", "<i4"), ("fg", "u1", (3,)), ("bg", "u1", (3,))])
+XP_HEADER = struct.Struct("<ii")
+GZIP_MAGIC = b"\x1f\x8b"
+FIRST_OCCURRENCE_BAND: int = 1 << 16
+# unicode code point of each cp437 byte (glyph codes are read as cp437 text)
+CP437_CODES = np.array(
+    [ord(bytes([code]).decode("cp437")) for code in range(256)], dtype=np.uint32
+)
 
 ####################################################################### utils ####################################################################
 
 
-def build_default_palettes():
-    global PALETTES_DICT
-    PALETTES_DICT = {
-        "landscape_4": {
-            HEIGHT_TO_CHR_MAPPING[0]: {"fg": (255, 255, 255), "bg": (000, 000, 255)},
-            HEIGHT_TO_CHR_MAPPING[1]: {"fg": (255, 255, 255), "bg": (215, 175, 000)},
-            HEIGHT_TO_CHR_MAPPING[2]: {"fg": (255, 255, 255), "bg": (000, 191, 000)},
-            HEIGHT_TO_CHR_MAPPING[3]: {"fg": (000, 000, 000), "bg": (255, 255, 255)},
-        },
-        "landscape_8": {
-            HEIGHT_TO_CHR_MAPPING[0]: {"fg": (255, 255, 255), "bg": (000, 000, 63)},
-            HEIGHT_TO_CHR_MAPPING[1]: {"fg": (255, 255, 255), "bg": (000, 000, 255)},
-            HEIGHT_TO_CHR_MAPPING[2]: {"fg": (255, 255, 255), "bg": (215, 175, 000)},
-            HEIGHT_TO_CHR_MAPPING[3]: {"fg": (255, 255, 255), "bg": (000, 191, 000)},
-            HEIGHT_TO_CHR_MAPPING[4]: {"fg": (255, 255, 255), "bg": (000, 63, 000)},
-            HEIGHT_TO_CHR_MAPPING[5]: {"fg": (255, 255, 255), "bg": (138, 117, 88)},
-            HEIGHT_TO_CHR_MAPPING[6]: {"fg": (000, 000, 000), "bg": (85, 85, 85)},
-            HEIGHT_TO_CHR_MAPPING[7]: {"fg": (000, 000, 000), "bg": (255, 255, 255)},
-        },
-        "landscape_16": {
-            HEIGHT_TO_CHR_MAPPING[0]: {"fg": (255, 255, 255), "bg": (000, 000, 63)},
-            HEIGHT_TO_CHR_MAPPING[1]: {"fg": (255, 255, 255), "bg": (000, 000, 127)},
-            HEIGHT_TO_CHR_MAPPING[2]: {"fg": (255, 255, 255), "bg": (000, 000, 191)},
-            HEIGHT_TO_CHR_MAPPING[3]: {"fg": (255, 255, 255), "bg": (000, 000, 255)},
-            HEIGHT_TO_CHR_MAPPING[4]: {"fg": (255, 255, 255), "bg": (215, 175, 000)},
-            HEIGHT_TO_CHR_MAPPING[5]: {"fg": (255, 255, 255), "bg": (000, 191, 000)},
-            HEIGHT_TO_CHR_MAPPING[6]: {"fg": (255, 255, 255), "bg": (000, 127, 000)},
-            HEIGHT_TO_CHR_MAPPING[7]: {"fg": (255, 255, 255), "bg": (000, 63, 000)},
-            HEIGHT_TO_CHR_MAPPING[8]: {"fg": (255, 255, 255), "bg": (81, 69, 52)},
-            HEIGHT_TO_CHR_MAPPING[9]: {"fg": (255, 255, 255), "bg": (100, 85, 64)},
-            HEIGHT_TO_CHR_MAPPING[10]: {"fg": (255, 255, 255), "bg": (119, 101, 76)},
-            HEIGHT_TO_CHR_MAPPING[11]: {"fg": (255, 255, 255), "bg": (138, 117, 88)},
-            HEIGHT_TO_CHR_MAPPING[12]: {"fg": (000, 000, 000), "bg": (85, 85, 85)},
-            HEIGHT_TO_CHR_MAPPING[13]: {"fg": (000, 000, 000), "bg": (135, 135, 135)},
-            HEIGHT_TO_CHR_MAPPING[14]: {"fg": (000, 000, 000), "bg": (150, 150, 150)},
-            HEIGHT_TO_CHR_MAPPING[15]: {"fg": (000, 000, 000), "bg": (255, 255, 255)},
-        },
-    }
-
-    no_shades = 16
-
-    palette_definitions = {}
-    palette_definitions["grey   "] = [1, 1, 1]
-    palette_definitions["red    "] = [1, 0, 0]
-    palette_definitions["green  "] = [0, 1, 0]
-    palette_definitions["blue   "] = [0, 0, 1]
-    palette_definitions["yellow "] = [1, 1, 0]
-    palette_definitions["magenta"] = [1, 0, 1]
-    palette_definitions["cyan   "] = [0, 1, 1]
-
-    for key in palette_definitions:
-        p = build_default_palette(no_shades, palette_definitions[key])
-        PALETTES_DICT[f"{key.strip()}_{no_shades}"] = p
-
-    no_shades_list = [32, 64, 128]
-    for no_shades in no_shades_list:
-        palette_name = "grey   "
-        p = build_default_palette(no_shades, palette_definitions[palette_name])
-        PALETTES_DICT[f"{palette_name.strip()}_{no_shades}"] = p
-
-
-def build_default_palette(no_shades: int, colors: list[int]) -> dict[str, dict]:
-    step = round(255 / no_shades)
-    p = {}
-    for x in range(no_shades):
-        p[HEIGHT_TO_CHR_MAPPING[x]] = {
-            "fg": (255, 255, 255),
-            "bg": (x * step * colors[0], x * step * colors[1], x * step * colors[2]),
-        }
-    return p
+@lru_cache(maxsize=None)
+def load_legend_template():
+    file_name = Path(__file__).parent / Path(MAPS_FOLDER) / "legend.xp"
+    if not file_name.exists():
+        raise Exception(
+            f"Rexpaint file with legend template '{file_name}' not found. Perhaps your installation of tui_map_generator has been corrupted. Try to reinstall it."
+        )
+    import pyrexpaint
+
+    legend_layers = pyrexpaint.load(str(file_name))
+
+    if len(legend_layers) == 0:
+        return None
+
+    legend_layer = legend_layers[0]
+    for tile in legend_layer.tiles:
+        c = cast(bytes, tile.ascii_code).decode("cp437")
+        c = c.replace(chr(0), "")
+        tile.ascii_code = c
+    return legend_layer
+
+
+def read_xp_layers(file_name: str | Path) -> list[np.ndarray]:
+    # layers of gzip compressed or raw .xp file as arrays of cells (height, width),
+    # cells are not copied, arrays are views on the file data
+    with open(file_name, "rb") as f:
+        data = f.read()
+    if data[:2] == GZIP_MAGIC:
+        data = gzip.decompress(data)
+
+    _, layers_no = XP_HEADER.unpack_from(data, 0)
+    offset = XP_HEADER.size
+    layers = []
+    for _ in range(layers_no):
+        width, height = XP_HEADER.unpack_from(data, offset)
+        offset += XP_HEADER.size
+        # cells are stored column by column
+        cells = np.frombuffer(
+            data, dtype=XP_CELL_DTYPE, count=width * height, offset=offset
+        )
+        layers.append(cells.reshape(width, height).T)
+        offset += cells.nbytes
+    return layers
+
+
+def xp_glyph_codes(layer: np.ndarray) -> np.ndarray:
+    # code points of glyph codes read as 4 bytes of cp437 text, (height, width, 4)
+    # or (height, width, 1) when all glyphs are one byte codes (as usual)
+    glyphs = layer["glyph"]
+    if glyphs.size > 0 and glyphs.min() > 0 and glyphs.max() < 256:
+        return CP437_CODES[glyphs][..., np.newaxis]
+    glyphs = np.ascontiguousarray(glyphs)
+    return CP437_CODES[glyphs.view(np.uint8).reshape(glyphs.shape + (4,))]
+
+
+def codes_to_str(codes: np.ndarray) -> str:
+    return codes.astype("<u4").tobytes().decode("utf-32-le").replace(chr(0), "")
+
+
+def first_occurrences(values: np.ndarray) -> np.ndarray:
+    # flat indexes of first cell with each distinct value, in order of appearance
+    values = values.ravel()
+    if values.size == 0 or values.min() < 0 or values.max() >= 2**16:
+        order = np.argsort(values, kind="stable")
+        sorted_values = values[order]
+        starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+        return np.sort(order[starts])
+
+    # small values (heights, glyphs): values are counted band by band and only
+    # bands with values not seen yet are searched, usually just the first ones
+    present = np.bincount(values) > 0
+    seen = np.zeros_like(present)
+    first = []
+    for start in range(0, values.size, FIRST_OCCURRENCE_BAND):
+        band = values[start : start + FIRST_OCCURRENCE_BAND]
+        new = np.flatnonzero((np.bincount(band, minlength=seen.size) > 0) & ~seen)
+        first.extend(start + int(np.argmax(band == value)) for value in new)
+        seen[new] = True
+        if seen.sum() == present.sum():
+            break
+    return np.sort(np.array(first, dtype=np.intp))
+
+
+profiling.start_from_env()
+
+
+def __getattr__(name: str):
+    # palettes are built on first use
+    if name == "PALETTES_DICT":
+        return PALETTE_REGISTRY.palettes
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-build_default_palettes()
 ################################################################### main class ########################################################################
 
 
@@ -132,52 +190,115 @@ class DiamondSquare:
         height_nil: int = HEIGHT_NIL,
         map_name: str = MAP_NAME,
         palette: str = COLOR_PALETTE,
+        engine: str = ENGINE,
+        memmap_file: str | Path | None = None,
+        memory_budget: int = MEMORY_BUDGET,
+        workers: int | None = None,
+        algorithm: str = ALGORITHM,
+        map_height: int | None = None,
+        map_cache: cache.MapCache | None = None,
     ):
         self.console = Console()
+        # map_size is the width, map_height the number of rows (None - square
+        # map), diamond square makes only square maps of 2^n + 1 size
+        self.algorithm = algorithms.get_algorithm(algorithm).name
+        if not algorithms.is_valid_size(self.algorithm, map_size, map_height):
+            raise Exception(
+                f"Map size {map_size}x{map_height or map_size} is not valid for algorithm '{self.algorithm}'."
+            )
         self.map_size = map_size
+        self.map_height = map_height if map_height != map_size else None
         self.height_min = height_min
         self.height_max = height_max
         self.roughness = roughness
         self.random_seed = random_seed
         self.height_nil = height_nil
         self.map_name = map_name
+        # with memmap file height map lives on disk and is processed in bands
+        # fitting into memory budget (bytes)
+        self.memmap_file = memmap_file
+        self.memory_budget = memory_budget
+        # number of threads used by parallel engine (None - one per CPU)
+        self.workers = workers
+        # generated maps and exports are reused from on-disk cache (None - off),
+        # map_key - cache key of the current map (None - not known, e.g. loaded)
+        self.map_cache = map_cache
+        self.map_key = None
         self.xp_legend_layer = None
         self.txt_legend_dict = {}
         self.height_map: THeightMap = self.init_height_map()
         self.map_str = {}
+        # parameters, random stream and state after the last generate (see generate)
+        self.generation = None
+        # erosion applied to the generated map (see erode), saved in the legend
+        self.erosion = None
+        # levels of detail, see iter_generate and build_lod_pyramid
+        self.lod_pyramid = []
         self.glyph_map = []
         self.glyphs = []
-        self.load_legend_from_xp()
 
-        if palette in PALETTES_DICT:
+        if palette in PALETTE_REGISTRY:
             self.palette = palette
         else:
             self.palette = COLOR_PALETTE
 
+        if engine in ENGINES:
+            self.engine = engine
+        else:
+            self.engine = ENGINE
+
         self.build_palette()
         self.export_glyphs = EXPORT_GLYPHS_LAYER
 
+    @profiling.profiled(cells=False)
     def build_palette(self):
-        self.palette_dict = PALETTES_DICT[self.palette]
-        self.mapping = {}
-        for symbol in self.palette_dict:
-            fg_r, fg_g, fg_b = self.palette_dict[symbol]["fg"]
-            bg_r, bg_g, bg_b = self.palette_dict[symbol]["bg"]
-            self.mapping[symbol] = Segment(
-                "  ",
-                Style.parse(f"rgb({fg_r},{fg_g},{fg_b}) on rgb({bg_r},{bg_g},{bg_b})"),
-            )
+        # palette is compiled once and shared with other instances using it
+        compiled = PALETTE_REGISTRY.get(self.palette)
+        self.palette_dict = compiled.palette
+        self.palette_luts = compiled.luts
+        self.mapping = compiled.mapping
+        self.ansi_escapes = compiled.ansi_escapes
+        self.ansi_fg_escapes = compiled.ansi_fg_escapes
         return self.mapping
 
+    @profiling.profiled(cells=False)
     def init_height_map(self) -> THeightMap:
         random.seed(self.random_seed)
 
-        height_map = []
-        for i in range(self.map_size):
-            height_map.append([self.height_nil] * self.map_size)
+        if self.memmap_file is not None:
+            return tiled.create_memmap(
+                self.memmap_file,
+                self.map_shape(),
+                height_dtype(self.height_max),
+                self.height_nil,
+                self.memory_budget,
+            )
+
+        height_map = np.full(
+            self.map_shape(),
+            self.height_nil,
+            dtype=height_dtype(self.height_max),
+        )
 
         return height_map
 
+    def map_shape(self) -> tuple[int, int]:
+        return (self.map_height or self.map_size, self.map_size)
+
+    def is_out_of_core(self) -> bool:
+        # maps loaded from raw .hmap files are copy-on-write memmaps, but they
+        # are changed and exported like maps in memory
+        return self.memmap_file is not None and isinstance(self.height_map, np.memmap)
+
+    def band_budget(self) -> int | None:
+        # in memory maps are processed in one go
+        if self.is_out_of_core():
+            return self.memory_budget
+        return None
+
+    def release_height_map(self):
+        tiled.release(self.height_map)
+
     def round_and_clamp(self, value: float) -> int:
         result = (
             math.floor(value)
@@ -195,19 +316,389 @@ class DiamondSquare:
     def random_value(self, roughness: float) -> float:
         return random.randint(-1, 1) * roughness
 
+    @profiling.profiled
     def generate(self) -> THeightMap:
+        # results of previous generation are reused if possible: palette change
+        # only rebuilds palette, roughness or max height change replays cached
+        # random stream (exact engine), maps are the same as generated from scratch
         random.seed(self.random_seed)
-        self.init_height_map()
+        self.check_palette()
+        self.erosion = None
+
+        generation = self.generation_parameters()
+        previous = self.generation
+        self.generation = None
+        if previous is not None and previous["parameters"] == generation:
+            random.setstate(previous["random_state"])
+            self.generation = previous
+            self.map_key = previous["map_key"]
+            return self.height_map
+
+        self.map_key = None
+        if self.map_cache is not None and self.memmap_file is None:
+            self.map_key = self.map_cache.key(self.cache_parameters())
+            parameters = self.load_cached_map(self.map_key)
+            # entries without random state (older versions) are generated again
+            if parameters is not None and "Random state" in parameters:
+                version, internal_state, gauss_next = parameters["Random state"]
+                random.setstate((version, tuple(internal_state), gauss_next))
+                self.generation = {
+                    "parameters": generation,
+                    "draws": None,
+                    "random_state": random.getstate(),
+                    "map_key": self.map_key,
+                }
+                return self.height_map
+
+        self.height_map = self.init_height_map()
+        draws = None
+        replayed = False
+        if (
+            previous is not None
+            and previous["draws"] is not None
+            and previous["parameters"]["stream"] == generation["stream"]
+        ):
+            with profiling.phase("replay_exact", self.height_map.size):
+                replayed = incremental.replay_exact(
+                    previous["draws"],
+                    self.height_map,
+                    self.roughness,
+                    self.height_min,
+                    self.height_max,
+                    self.band_budget(),
+                    self.release_height_map,
+                )
+        if replayed:
+            draws = previous["draws"]
+        elif self.algorithm != ALGORITHM:
+            self.generate_algorithm()
+        elif self.engine == "exact":
+            with profiling.phase("generate_exact", self.height_map.size):
+                draws = incremental.generate_exact(
+                    self.height_map,
+                    self.roughness,
+                    self.height_min,
+                    self.height_max,
+                    self.random_seed,
+                    self.band_budget(),
+                    self.release_height_map,
+                    record_draws=not self.is_out_of_core(),
+                )
+        else:
+            self.diamond_square()
+
+        self.generation = {
+            "parameters": generation,
+            "draws": draws,
+            "random_state": random.getstate(),
+            "map_key": self.map_key,
+        }
+        if self.map_key is not None:
+            self.cache_map()
+        return self.height_map
+
+    def cache_parameters(self) -> dict:
+        # parameters deciding heights of generated map: legend without palette
+        # (colors only), engine (loop and exact give the same maps) and
+        # version of the algorithm
+        self.generate_legend_dict()
+        parameters = dict(self.txt_legend_dict)
+        del parameters["Palette"]
+        parameters["Min height"] = self.height_min
+        parameters["Nil height"] = self.height_nil
+        parameters["Algorithm version"] = algorithms.get_algorithm(
+            self.algorithm
+        ).version
+        if self.algorithm == ALGORITHM:
+            parameters["Engine"] = "exact" if self.engine == "loop" else self.engine
+        return parameters
+
+    def load_cached_map(self, key: str) -> dict | None:
+        # cached map is read into memory (the cache may remove its file later),
+        # returns parameters it was cached with
+        file_name = self.map_cache.get(key, map_file.MAP_FILE_EXTENSION)
+        if file_name is None:
+            return None
+        header, offset = map_file.read_map_header(file_name)
+        height_map = np.empty(tuple(header["shape"]), dtype=np.dtype(header["dtype"]))
+        with profiling.phase("load_cached_map", height_map.size):
+            self.height_map = map_file.read_map_data(
+                file_name, header, offset, height_map
+            )
+        return header["parameters"]
+
+    def cache_map(self):
+        # generated maps keep random state after generation, so a cache hit
+        # leaves random module in the same state as generating the map
+        parameters = dict(self.txt_legend_dict)
+        if self.generation is not None:
+            parameters["Random state"] = self.generation["random_state"]
+        self.map_cache.write(
+            self.map_key,
+            map_file.MAP_FILE_EXTENSION,
+            lambda f: map_file.write_map_file(f, self.height_map, parameters),
+        )
+
+    def erode(
+        self,
+        kind: str = "both",
+        iterations: int = EROSION_ITERATIONS,
+        time_budget: float | None = None,
+    ) -> dict:
+        # post-processing between generate and export: thermal and/or hydraulic
+        # erosion (see erosion module) on a float copy, heights are rounded and
+        # clamped back the same way as during generation. Stops after time
+        # budget (seconds), map no longer matches its generation parameters.
+        # Erosion is deterministic, eroded maps are cached like generated ones
+        # (runs with time budget are not looked up, they may do fewer iterations)
+        if kind not in EROSION_KINDS:
+            raise Exception(
+                f"Unknown erosion '{kind}'. Available kinds: {', '.join(EROSION_KINDS)}."
+            )
+        if self.is_out_of_core():
+            raise Exception(
+                "Erosion needs the whole map in memory, it can't be used with memmap file."
+            )
+
+        eroded_key = None
+        if self.map_key is not None and time_budget is None:
+            eroded_key = self.eroded_key(f"{kind} x{iterations}")
+        cached = eroded_key is not None and self.load_cached_map(eroded_key) is not None
+        if cached:
+            done, seconds = iterations, 0.0
+        else:
+            done, seconds = self.erode_height_map(kind, iterations, time_budget)
+
+        self.generation = None
+        self.map_str = {}
+        self.lod_pyramid = []
+        self.erosion = f"{kind} x{done}"
+        if self.map_key is not None:
+            self.map_key = self.eroded_key(self.erosion)
+            self.generate_legend_dict()
+            if not cached:
+                self.cache_map()
+        stats = {
+            "kind": kind,
+            "iterations": done,
+            "seconds": seconds,
+            "cell_iterations_per_second": (
+                self.height_map.size * done / seconds if seconds > 0 else 0.0
+            ),
+            "cached": cached,
+        }
+        if cached:
+            self.console.print(
+                f"Erosion ([bold]{kind}[/]): {done} iterations taken from cache."
+            )
+        else:
+            self.console.print(
+                f"Erosion ([bold]{kind}[/]): {done} iterations in {seconds:.3f}s, [bold]{stats['cell_iterations_per_second']:,.0f}[/] cell-iterations/s."
+            )
+        return stats
+
+    def eroded_key(self, erosion_name: str) -> str:
+        return self.map_cache.key({"Map": self.map_key, "Erosion": erosion_name})
+
+    def erode_height_map(
+        self, kind: str, iterations: int, time_budget: float | None
+    ) -> tuple[int, float]:
+        with profiling.phase("erode") as record:
+            start = perf_counter()
+            height_range = max(self.height_max - self.height_min, 1)
+            heights = (
+                self.height_map.astype(erosion.EROSION_FLOAT) - self.height_min
+            ) / height_range
+            done = erosion.erode(heights, kind, iterations, time_budget)
+            self.height_map[:] = engines.round_and_clamp(
+                heights * height_range + self.height_min,
+                self.height_min,
+                self.height_max,
+            )
+            seconds = perf_counter() - start
+            if record is not None:
+                record.cells = self.height_map.size * done
+        return done, seconds
+
+    def check_palette(self):
         self.build_palette()
         if len(self.palette_dict) < self.height_max:
             raise Exception(
                 f"Palette '{self.palette}' has only {len(self.palette_dict)} colors. Max height must be lower or equal to the number of colors in selected palette."
             )
-        self.diamond_square()
+
+    def iter_generate(self, keep_lods: bool = False) -> Iterator[np.ndarray]:
+        # progressive generation: yields the map after each level, from 2x2
+        # corners up to the full map, every 2^level point (see lod), points of
+        # yielded levels don't change later, with keep_lods each level is kept
+        # in lod_pyramid as a copy (the full map is not copied)
+        random.seed(self.random_seed)
+        self.check_palette()
+        self.generation = None
+        self.erosion = None
+        self.map_key = None
+        self.height_map = self.init_height_map()
+        self.lod_pyramid = []
+        if self.algorithm != ALGORITHM:
+            # other algorithms make the whole map in one go
+            self.generate_algorithm()
+            spacings = iter([1])
+        else:
+            spacings = self.iter_diamond_square()
+        for spacing in spacings:
+            level_map = self.height_map[::spacing, ::spacing]
+            if keep_lods:
+                self.lod_pyramid.insert(
+                    0, self.height_map if spacing == 1 else np.array(level_map)
+                )
+            yield level_map
+
+        self.generation = {
+            "parameters": self.generation_parameters(),
+            "draws": None,
+            "random_state": random.getstate(),
+            "map_key": None,
+        }
+
+    def lod_levels(self) -> int:
+        # levels of detail above the full map (level 0)
+        return (self.height_map.shape[0] - 1).bit_length() - 1
+
+    def lod(self, level: int) -> np.ndarray:
+        # every 2^level point in both directions (view), the same points the
+        # generation has produced after level (lod_levels - level)
+        if not 0 <= level <= self.lod_levels():
+            raise Exception(
+                f"Level of detail must be in range 0..{self.lod_levels()}, got {level}."
+            )
+        return self.height_map[:: 2**level, :: 2**level]
+
+    @profiling.profiled
+    def build_lod_pyramid(self) -> list[np.ndarray]:
+        # levels of detail of existing map as typed arrays, lod_pyramid[level]
+        self.lod_pyramid = [self.height_map] + [
+            np.array(self.lod(level)) for level in range(1, self.lod_levels() + 1)
+        ]
+        return self.lod_pyramid
+
+    def generation_parameters(self) -> dict:
+        # "stream" parameters decide the random stream, the others only how it's used
+        return {
+            "stream": (
+                self.algorithm,
+                self.engine,
+                self.random_seed,
+                self.map_size,
+                self.map_height,
+                self.height_min,
+                self.height_nil,
+                self.memmap_file,
+                self.memory_budget if self.memmap_file is not None else None,
+            ),
+            "roughness": self.roughness,
+            "height_max": self.height_max,
+        }
+
+    def iter_diamond_square(self) -> Iterator[int]:
+        # yields spacing of finished grid after each level, the loop engine
+        # runs in one go
+        if self.engine == "numpy":
+            return engines.iter_diamond_square_numpy(
+                self.height_map,
+                self.roughness,
+                self.height_min,
+                self.height_max,
+                self.random_seed,
+                self.band_budget(),
+                self.release_height_map,
+            )
+        if self.engine == "exact":
+            return engines.iter_diamond_square_exact(
+                self.height_map,
+                self.roughness,
+                self.height_min,
+                self.height_max,
+                self.band_budget(),
+                self.release_height_map,
+            )
+        if self.engine == "parallel":
+            return engines.iter_diamond_square_parallel(
+                self.height_map,
+                self.roughness,
+                self.height_min,
+                self.height_max,
+                self.random_seed,
+                self.workers,
+                self.release_height_map,
+            )
+        self.diamond_square_loop()
+        return iter([1])
+
+    @profiling.profiled
+    def generate_algorithm(self) -> THeightMap:
+        # algorithms of the registry (see algorithms.ALGORITHMS) fill the map in
+        # place, in bands fitting into memory budget for out-of-core maps
+        algorithms.get_algorithm(self.algorithm).generate(
+            self.height_map,
+            self.roughness,
+            self.height_min,
+            self.height_max,
+            self.random_seed,
+            self.band_budget(),
+            self.release_height_map,
+        )
         return self.height_map
 
+    @profiling.profiled
     def diamond_square(self) -> THeightMap:
+        if self.engine == "numpy":
+            return self.diamond_square_numpy()
+        if self.engine == "exact":
+            return self.diamond_square_exact()
+        if self.engine == "parallel":
+            return self.diamond_square_parallel()
+        return self.diamond_square_loop()
+
+    def diamond_square_parallel(self) -> THeightMap:
+        engines.diamond_square_parallel(
+            self.height_map,
+            self.roughness,
+            self.height_min,
+            self.height_max,
+            self.random_seed,
+            self.workers,
+            self.release_height_map,
+        )
+        return self.height_map
+
+    def diamond_square_exact(self) -> THeightMap:
+        engines.diamond_square_exact(
+            self.height_map,
+            self.roughness,
+            self.height_min,
+            self.height_max,
+            self.band_budget(),
+            self.release_height_map,
+        )
+        return self.height_map
+
+    def diamond_square_numpy(self) -> THeightMap:
+        engines.diamond_square_numpy(
+            self.height_map,
+            self.roughness,
+            self.height_min,
+            self.height_max,
+            self.random_seed,
+            self.band_budget(),
+            self.release_height_map,
+        )
+        return self.height_map
+
+    def diamond_square_loop(self) -> THeightMap:
         random_scalar: float = self.roughness
+        # the reference implementation works on plain lists
+        height_map = self.height_map
+        self.height_map = height_map.tolist()
 
         self.height_map[0][0] = random.randint(self.height_min, self.height_max)
         self.height_map[0][-1] = random.randint(self.height_min, self.height_max)
@@ -262,34 +753,51 @@ class DiamondSquare:
             chunk_size = chunk_size // 2
             random_scalar = max(random_scalar / 2, 0.1)
 
+        height_map[:] = self.height_map
+        self.height_map = height_map
         return self.height_map
 
-    def convert_to_str(self) -> list[str]:
+    @profiling.profiled
+    def convert_to_str(self, heights: np.ndarray | None = None) -> list[str]:
+        # glyphs are looked up for a whole row at once and decoded from utf-32
+        if heights is None:
+            heights = self.height_map
         self.map_str = []
-        for row in self.height_map:
-            new_row = ""
-            for col in row:
-                if self.palette == "custom":
-                    new_row += chr(col)
-                else:
-                    new_row += HEIGHT_TO_CHR_MAPPING[col - 1]
-            self.map_str.append(new_row)
+        for row in heights:
+            codes = self.height_to_codes(row)
+            self.map_str.append(codes.astype("<u4").tobytes().decode("utf-32-le"))
         return self.map_str
 
+    def height_to_codes(self, heights: np.ndarray) -> np.ndarray:
+        # ascii codes of the glyphs representing heights
+        if self.palette == "custom":
+            return heights
+        return HEIGHT_TO_CHR_CODES.take(heights.astype(np.int64) - 1, mode="wrap")
+
+    def palette_lut(self, key: str = "bg") -> np.ndarray:
+        # fg or bg color for each height value, heights index the table directly,
+        # tables are built once per palette (see render.CompiledPalette)
+        return self.palette_luts[key]
+
     def convert_from_str(self):
-        self.height_map = []
+        # ascii code -> height, codes not in HEIGHT_TO_CHR_MAPPING stay as they are
+        chr_to_height = np.arange(HEIGHT_TO_CHR_CODES.max() + 1, dtype=np.uint32)
+        if self.palette != "custom":
+            chr_to_height[HEIGHT_TO_CHR_CODES] = np.arange(len(HEIGHT_TO_CHR_CODES))
 
+        rows = []
         for row in self.map_str:
-            new_row = []
-            for col in row:
-                if self.palette == "custom" or col not in HEIGHT_TO_CHR_MAPPING:
-                    new_row.append(ord(col))
-                else:
-                    new_row.append(HEIGHT_TO_CHR_MAPPING.index(col))
-            self.height_map.append(new_row)
+            codes = np.frombuffer(row.encode("utf-32-le"), dtype="<u4")
+            known = codes < len(chr_to_height)
+            rows.append(
+                np.where(known, chr_to_height[np.where(known, codes, 0)], codes)
+            )
+        self.height_map = np.array(rows, dtype=height_dtype(max(map(max, rows))))
         return
 
-    def print_height_map(self):
+    @profiling.profiled
+    def print_height_map(self, renderer: str = RENDERER, fit_width: bool = True):
+        # with fit_width big maps are downsampled to the width of the terminal
         padding = 15
 
         self.generate_legend_dict()
@@ -301,74 +809,359 @@ class DiamondSquare:
         self.console.print(self.get_palette_preview())
         self.console.print(f"\n[bold]{'Height map':{padding}}[/]:")
 
-        self.grid = "\n".join(self.convert_to_str())
-        pixels = Pixels.from_ascii(self.grid, self.mapping)
+        # half block renderer draws each point as 1 column and half of a row
+        step = render.fit_step(
+            self.height_map.shape[1],
+            self.console.width if fit_width else None,
+            1 if renderer == "half" else len(render.CELL),
+        )
+        heights = render.downsample(self.height_map, step)
+        if step > 1:
+            self.console.print(f"(every {step}. point to fit the terminal)")
+
+        in_palette = int(heights.max()) < len(self.ansi_escapes)
+        if renderer == "half" and in_palette and self.can_render_ansi():
+            lines = render.render_half_ansi(
+                heights, self.ansi_fg_escapes, self.ansi_escapes
+            )
+            self.write_to_console(lines)
+        elif renderer == "half" and in_palette:
+            segments = render.half_block_segments(heights, self.palette_lut("bg"))
+            self.console.print(Segments(segments))
+        elif renderer == "ansi" and in_palette and self.can_render_ansi():
+            self.write_to_console(render.render_ansi(heights, self.ansi_escapes))
+        else:
+            self.grid = "\n".join(self.convert_to_str(heights))
+            from rich_pixels import Pixels
 
-        self.console.print(pixels)
+            pixels = Pixels.from_ascii(self.grid, self.mapping)
+            self.console.print(pixels)
         self.console.print("\n")
 
+    def can_render_ansi(self) -> bool:
+        # escape sequences are written straight to terminal supporting truecolor,
+        # other cases are left to rich (e.g. downgrading colors, no output)
+        return (
+            self.console.color_system == "truecolor"
+            and not self.console.quiet
+            and not self.console.is_dumb_terminal
+        )
+
+    def write_to_console(self, lines: Iterable[str]):
+        for line in lines:
+            self.console.file.write(line)
+        self.console.file.flush()
+
     def get_palette_preview(self, palette: str | None = None):
-        if palette is None or palette == self.palette:
-            return Segments(list(self.mapping.values()))
-
-        old_palette = self.palette
-        old_mapping = self.mapping
-        self.palette = palette
-        result = self.build_palette()
-        self.palette = old_palette
-        self.mapping = old_mapping
-        return Segments(list(result.values()))
-
-    def save_to_json(self):
+        if palette is None:
+            palette = self.palette
+        return Segments(list(PALETTE_REGISTRY.get(palette).mapping.values()))
+
+    @profiling.profiled
+    def save_to_json(self, compact: bool = JSON_COMPACT):
         # if len(self.map_str) == 0:
         #     self.convert_to_str()
 
         self.generate_legend_dict()
-        data = {
-            "parameters": self.txt_legend_dict,
-            "height_map": self.height_map,
-            # "glyph_map": self.map_str,
-        }
 
+        file_name = self.export_file_name("json")
+        self.write_json_file(file_name, compact)
+
+        self.console.print(f"Map saved to '[bold]{file_name}[/]'.")
+
+    @profiling.profiled
+    def write_json_file(self, file_name: Path, compact: bool = JSON_COMPACT):
+        with open(file_name, "w", encoding="utf-8") as f:
+            self.write_json(f, compact)
+
+    def write_json(self, f, compact: bool = JSON_COMPACT):
+        # writes the same document as json.dump(data, f, indent=JSON_INDENT)
+        # one row at a time, so the height map is never turned into nested lists
+        if compact:
+            self.write_json_compact(f)
+            return
+        indent = " " * JSON_INDENT
+        parameters = json.dumps(self.txt_legend_dict, indent=JSON_INDENT)
+        f.write(f'{{\n{indent}"parameters": ')
+        f.write(parameters.replace("\n", f"\n{indent}"))
+        f.write(f',\n{indent}"height_map": [')
+        separator = f",\n{indent * 3}"
+        for y0, band in tiled.iter_row_bands(self.height_map, self.band_budget()):
+            for i, row in enumerate(band, start=y0):
+                if i > 0:
+                    f.write(",")
+                f.write(f"\n{indent * 2}[\n{indent * 3}")
+                f.write(separator.join(map(str, row.tolist())))
+                f.write(f"\n{indent * 2}]")
+        f.write(f"\n{indent}]\n}}")
+
+    def write_json_compact(self, f):
+        # same as json.dump(data, f, separators=(",", ":"))
+        parameters = json.dumps(self.txt_legend_dict, separators=(",", ":"))
+        f.write(f'{{"parameters":{parameters},"height_map":[')
+        for y0, band in tiled.iter_row_bands(self.height_map, self.band_budget()):
+            for i, row in enumerate(band, start=y0):
+                if i > 0:
+                    f.write(",")
+                f.write(f"[{','.join(map(str, row.tolist()))}]")
+        f.write("]}")
+
+    @profiling.profiled
+    def load_from_json(self):
+        # rows are parsed one at a time into typed array (or memmap file if set)
         maps_folder = self.fix_maps_folder()
         file_name = maps_folder / f"{self.map_name}.json"
-        with open(file_name, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=JSON_INDENT)
+        with open(file_name, "r", encoding="utf-8") as f:
+            parameters, self.height_map = json_map.read_json_map(
+                f, self.new_height_map, self.memory_budget
+            )
+        self.apply_parameters(parameters)
+
+    def new_height_map(self, shape: tuple[int, int], height_max: int) -> THeightMap:
+        if self.memmap_file is not None:
+            return tiled.create_memmap(
+                self.memmap_file,
+                shape,
+                height_dtype(height_max),
+                memory_budget=self.memory_budget,
+            )
+        return np.zeros(shape, dtype=height_dtype(height_max))
+
+    def apply_parameters(self, parameters: dict):
+        # generation parameters of loaded map (see generate_legend_dict)
+        self.map_size = parameters.get("Map size", self.height_map.shape[1])
+        rows, columns = self.height_map.shape
+        self.map_height = parameters.get(
+            "Map height", rows if rows != columns else None
+        )
+        if parameters.get("Algorithm") in algorithms.ALGORITHMS:
+            self.algorithm = parameters["Algorithm"]
+        self.erosion = parameters.get("Erosion")
+        self.map_key = None
+        self.height_max = parameters.get("Max height", self.height_max)
+        self.roughness = parameters.get("Roughness", self.roughness)
+        self.random_seed = parameters.get("Random seed", self.random_seed)
+        if parameters.get("Palette") in PALETTE_REGISTRY:
+            self.palette = parameters["Palette"]
+        self.build_palette()
+        self.map_str = {}
+        self.generation = None
+
+    @profiling.profiled
+    def save_to_map(self, compress: bool = MAP_COMPRESS):
+        self.generate_legend_dict()
+
+        file_name = self.export_file_name("hmap")
+        self.write_map_file(file_name, compress)
 
         self.console.print(f"Map saved to '[bold]{file_name}[/]'.")
 
+    @profiling.profiled
+    def write_map_file(self, file_name: Path, compress: bool = MAP_COMPRESS):
+        with open(file_name, "wb") as f:
+            map_file.write_map_file(
+                f, self.height_map, self.txt_legend_dict, compress, self.band_budget()
+            )
+
+    @profiling.profiled
+    def load_from_map(self):
+        # raw map files are memory mapped, compressed ones are read into memory
+        # or into memmap file (if set)
+        maps_folder = self.fix_maps_folder()
+        file_name = maps_folder / f"{self.map_name}.{map_file.MAP_FILE_EXTENSION}"
+        header, offset = map_file.read_map_header(file_name)
+
+        out = None
+        if self.memmap_file is not None:
+            out = tiled.create_memmap(
+                self.memmap_file,
+                tuple(header["shape"]),
+                np.dtype(header["dtype"]),
+                memory_budget=self.memory_budget,
+            )
+        self.height_map = map_file.read_map_data(
+            file_name, header, offset, out, self.memory_budget
+        )
+
+        self.apply_parameters(header["parameters"])
+
     def fix_maps_folder(self):
         maps_folder = Path(MAPS_FOLDER)
         if not maps_folder.exists():
             maps_folder.mkdir()
         return maps_folder
 
-    def save_to_png(self, scale_up: int = SCALE_UP):
-        maps_folder = self.fix_maps_folder()
-        file_name = maps_folder / f"{self.map_name}.png"
+    def export_file_name(self, export_format: str, map_name: str | None = None) -> Path:
+        extension = (
+            map_file.MAP_FILE_EXTENSION if export_format == "hmap" else export_format
+        )
+        return self.fix_maps_folder() / f"{map_name or self.map_name}.{extension}"
+
+    def export_cells(self, formats: list[str], png_indexed: bool = PNG_INDEXED) -> dict:
+        # per cell data used by more than one format, computed once for the
+        # whole map (row order): "bg"/"fg" colors, "codes" of glyphs
+        cells = {}
+        indexed = png_indexed and len(self.palette_lut("bg")) <= 256
+        if "xp" in formats or ("png" in formats and not indexed):
+            cells["bg"] = self.palette_lut("bg")[self.height_map]
+        if "xp" in formats:
+            cells["fg"] = self.palette_lut("fg")[self.height_map]
+            if self.export_glyphs:
+                cells["codes"] = self.height_to_codes(self.height_map)
+        return cells
 
-        size = len(self.height_map[0])
-        img = np.zeros((size, size, 3), dtype=np.uint8)
+    @profiling.profiled
+    def export(
+        self,
+        formats: Iterable[str],
+        names: dict[str, str] | None = None,
+        xp_compress: bool = XP_COMPRESS,
+        json_compact: bool = JSON_COMPACT,
+        map_compress: bool = MAP_COMPRESS,
+        scale_up: int = SCALE_UP,
+        png_indexed: bool = PNG_INDEXED,
+        workers: int | None = None,
+    ) -> list[Path]:
+        # saves the map in many formats at once (names - map name per format,
+        # map_name by default): legend and per cell data are prepared once,
+        # then encoders run on a pool of threads, so compression and writing
+        # files overlap, out-of-core maps are saved one format after another
+        # to stay within memory budget (workers - threads, one per format up to
+        # number of CPU cores by default)
+        formats = list(dict.fromkeys(formats))
+        unknown = [f for f in formats if f not in EXPORT_FORMATS]
+        if unknown:
+            raise Exception(
+                f"Unknown export format(s): {', '.join(unknown)}. Available formats: {', '.join(EXPORT_FORMATS)}."
+            )
+        if names is None:
+            names = {}
+
+        self.generate_legend_dict()
+        cells = {} if self.is_out_of_core() else self.export_cells(formats, png_indexed)
+        writers = {
+            "json": lambda file_name: self.write_json_file(file_name, json_compact),
+            "png": lambda file_name: self.write_png_file(
+                file_name, scale_up, png_indexed, cells
+            ),
+            "xp": lambda file_name: self.write_xp_file(file_name, xp_compress, cells),
+            "hmap": lambda file_name: self.write_map_file(file_name, map_compress),
+        }
+        file_names = [self.export_file_name(f, names.get(f)) for f in formats]
+        if (
+            self.map_key is not None
+            and self.map_cache.exports
+            and not self.is_out_of_core()
+        ):
+            options = {
+                "json": {"compact": json_compact},
+                "png": {"scale_up": scale_up, "indexed": png_indexed},
+                "xp": {"compress": xp_compress, "glyphs": self.export_glyphs},
+                "hmap": {"compress": map_compress},
+            }
+            for export_format, file_name in zip(formats, file_names):
+                writers[export_format] = self.cached_writer(
+                    export_format, writers[export_format], options[export_format]
+                )
+
+        if self.is_out_of_core():
+            workers = 1
+        elif workers is None:
+            workers = min(len(formats), os.cpu_count() or 1)
+        if workers <= 1 or len(formats) <= 1:
+            from_cache = [
+                writers[export_format](file_name)
+                for export_format, file_name in zip(formats, file_names)
+            ]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(writers[export_format], file_name)
+                    for export_format, file_name in zip(formats, file_names)
+                ]
+                from_cache = [future.result() for future in futures]
+
+        for file_name, cached in zip(file_names, from_cache):
+            source = " (from cache)" if cached else ""
+            self.console.print(f"Map saved to '[bold]{file_name}[/]'{source}.")
+        return file_names
+
+    def cached_writer(
+        self, export_format: str, write: Callable[[Path], None], options: dict
+    ) -> Callable[[Path], bool]:
+        # file is copied from cache when the same map has been exported before
+        # with the same legend, colors, options and name, otherwise it is
+        # written and stored in cache, returns True for files taken from cache
+        def cached_write(file_name: Path) -> bool:
+            key = self.map_cache.key(
+                {
+                    "Map": self.map_key,
+                    "Legend": self.txt_legend_dict,
+                    "Colors": self.palette_dict,
+                    "Format": export_format,
+                    "Options": options,
+                    "Name": file_name.stem,
+                }
+            )
+            extension = file_name.suffix[1:]
+            if self.map_cache.fetch(key, extension, file_name):
+                return True
+            write(file_name)
+            self.map_cache.put(key, extension, file_name)
+            return False
+
+        return cached_write
+
+    @profiling.profiled
+    def save_to_png(self, scale_up: int = SCALE_UP, indexed: bool = PNG_INDEXED):
+        # indexed PNG stores heights with palette colors (1 byte per pixel),
+        # used only when palette has no more than 256 entries
+        self.generate_legend_dict()
+        file_name = self.export_file_name("png")
+        self.write_png_file(file_name, scale_up, indexed)
+        self.console.print(f"Map saved to '[bold]{file_name}[/]'.")
+
+    @profiling.profiled
+    def write_png_file(
+        self,
+        file_name: Path,
+        scale_up: int = SCALE_UP,
+        indexed: bool = PNG_INDEXED,
+        cells: dict | None = None,
+    ):
+        # cells - per cell data prepared by export_cells (colors are reused)
+        from PIL import Image
+        from PIL.PngImagePlugin import PngInfo
+
+        lut = self.palette_lut("bg")
+        indexed = indexed and len(lut) <= 256
 
-        for x in range(len(self.height_map)):
-            for y in range(len(self.height_map[0])):
-                height = self.height_map[y][x]
-                ch_str = HEIGHT_TO_CHR_MAPPING[height - 1]
+        if self.is_out_of_core():
+            self.save_to_png_stream(file_name, scale_up, indexed)
+            return
 
-                img[y][x] = self.palette_dict[ch_str]["bg"]
+        if indexed:
+            img = self.height_map.astype(np.uint8, copy=False)
+            img_resized = Image.fromarray(tiled.scale_up_pixels(img, scale_up), "P")
+            img_resized.putpalette(lut.tobytes())
+        else:
+            img = cells["bg"] if cells and "bg" in cells else lut[self.height_map]
+            img_resized = Image.fromarray(tiled.scale_up_pixels(img, scale_up))
 
-        new_size = size * scale_up
-        img_resized = Image.fromarray(img).resize((new_size, new_size), Image.NEAREST)
         metadata = PngInfo()
-        metadata.add_text("Title", f"{self.map_name} - height map")
-        metadata.add_text("Software", "tui-map-generator")
-        metadata.add_text(
-            "Comment",
-            "Visit https://github.com/HubertReX/tui-map-generator to learn more",
-        )
-        self.generate_legend_dict()
+        for key, value in self.png_text(file_name.stem).items():
+            metadata.add_text(key, value)
+        img_resized.save(file_name, pnginfo=metadata)
+        # img_resized.show()
+
+    def png_text(self, map_name: str | None = None) -> dict[str, str]:
+        text = {
+            "Title": f"{map_name or self.map_name} - height map",
+            "Software": "tui-map-generator",
+            "Comment": "Visit https://github.com/HubertReX/tui-map-generator to learn more",
+        }
         for key in self.txt_legend_dict:
-            metadata.add_text(key, str(self.txt_legend_dict[key]))
+            text[key] = str(self.txt_legend_dict[key])
 
         description_list = [
             "Height map generated using tui-map-generator by Hubert Nafalski"
@@ -376,33 +1169,77 @@ class DiamondSquare:
         for key in self.txt_legend_dict:
             description_list.append(f"{key:15}: {self.txt_legend_dict[key]}")
 
-        metadata.add_text(
-            "Description",
-            "\n".join(description_list),
+        text["Description"] = "\n".join(description_list)
+        return text
+
+    def save_to_png_stream(
+        self, file_name: Path, scale_up: int = SCALE_UP, indexed: bool = PNG_INDEXED
+    ):
+        # encodes band after band, so the image is never held in memory
+        lut = self.palette_lut("bg")
+        height, width = self.height_map.shape
+        bands = (
+            tiled.scale_up_pixels(
+                band.astype(np.uint8, copy=False) if indexed else lut[band], scale_up
+            )
+            for _, band in tiled.iter_row_bands(
+                self.height_map,
+                self.band_budget(),
+                tiled.EXPORT_BYTES_PER_CELL + 6 * scale_up * scale_up,
+            )
         )
-        img_resized.save(file_name, pnginfo=metadata)
-        # img_resized.show()
-        self.console.print(f"Map saved to '[bold]{file_name}[/]'.")
+        with open(file_name, "wb") as fp:
+            tiled.write_png_stream(
+                fp,
+                width * scale_up,
+                height * scale_up,
+                bands,
+                self.png_text(file_name.stem),
+                lut if indexed else None,
+            )
 
     def generate_legend_dict(self):
         self.txt_legend_dict[f"Map size"] = self.map_size
-        self.txt_legend_dict[f"Algorithm"] = ALGORITHM_NAME
+        # square maps keep the legend of older versions
+        if self.map_height is not None:
+            self.txt_legend_dict[f"Map height"] = self.map_height
+        else:
+            self.txt_legend_dict.pop(f"Map height", None)
+        self.txt_legend_dict[f"Algorithm"] = self.algorithm
         self.txt_legend_dict[f"Max height"] = self.height_max
         self.txt_legend_dict[f"Roughness"] = self.roughness
         self.txt_legend_dict[f"Random seed"] = self.random_seed
         self.txt_legend_dict[f"Palette"] = self.palette
+        # only eroded maps have it, so legends of other maps don't change
+        if self.erosion is not None:
+            self.txt_legend_dict[f"Erosion"] = self.erosion
+        else:
+            self.txt_legend_dict.pop(f"Erosion", None)
 
-    def save_to_xp(self):
-        layers_no = 2
-
-        if self.export_glyphs:
-            layers_no += 1
+    @profiling.profiled
+    def save_to_xp(self, compress: bool = XP_COMPRESS):
+        # compressed files are gzip streams, as saved by Rexpaint itself
 
         # if len(self.map_str) == 0:
         #     self.convert_to_str()
 
         # self.save_palette()
 
+        self.generate_legend_dict()
+        file_name = self.export_file_name("xp")
+        self.write_xp_file(file_name, compress)
+        self.console.print(f"Map saved to '[bold]{file_name}[/]'.")
+
+    @profiling.profiled
+    def write_xp_file(
+        self, file_name: Path, compress: bool = XP_COMPRESS, cells: dict | None = None
+    ):
+        # cells - per cell data prepared by export_cells (colors, glyph codes)
+        layers_no = 2
+
+        if self.export_glyphs:
+            layers_no += 1
+
         if self.xp_legend_layer is None:
             self.load_legend_from_xp()
 
@@ -411,78 +1248,141 @@ class DiamondSquare:
                 f"Rexpaint file with legend template not found. Perhaps your installation of tui_map_generator has been corrupted. Try to reinstall it."
             )
         legend_layer = deepcopy(self.xp_legend_layer)
-        self.generate_legend_dict()
+        # template has styled rows only for the original legend, every row is
+        # written with styles of its first rows: label, separator and value
+        # (the first row has a number, the second one a text)
+        label_tile, separator_tile, number_tile, text_tile = (
+            legend_layer.tiles[self.xp_pos(y, x, legend_layer)]
+            for x, y in (
+                (0, XP_LEGEND_START_Y),
+                (XP_LEGEND_SEPARATOR_X, XP_LEGEND_START_Y),
+                (XP_LEGEND_START_X, XP_LEGEND_START_Y),
+                (XP_LEGEND_START_X, XP_LEGEND_START_Y + 1),
+            )
+        )
         for j, (label, value) in enumerate(self.txt_legend_dict.items()):
-            self.text_to_tiles(0, XP_LEGEND_START_Y + j, legend_layer, label)
+            y = XP_LEGEND_START_Y + j
+            value_tile = text_tile if isinstance(value, str) else number_tile
+            self.text_to_tiles(0, y, legend_layer, label, label_tile)
             self.text_to_tiles(
-                XP_LEGEND_START_X, XP_LEGEND_START_Y + j, legend_layer, str(value)
+                XP_LEGEND_SEPARATOR_X, y, legend_layer, ":", separator_tile
+            )
+            self.text_to_tiles(
+                XP_LEGEND_START_X, y, legend_layer, str(value), value_tile
             )
 
-        maps_folder = self.fix_maps_folder()
-        file_name = maps_folder / f"{self.map_name}.xp"
-        with open(file_name, "wb") as fp:
-            # write header
-            fp.write(struct.pack("i", 1))  # version
-            fp.write(struct.pack("i", layers_no))  # layers
-            fp.write(struct.pack("i", len(self.height_map[0])))
-            fp.write(struct.pack("i", len(self.height_map)))
-
-            # write background color layer (1)
-            for x in range(len(self.height_map[0])):
-                for y in range(len(self.height_map)):
-                    ch_str = HEIGHT_TO_CHR_MAPPING[self.height_map[y][x] - 1]
-                    ch_int = ord(ch_str)
-                    if self.export_glyphs:
-                        fp.write(struct.pack("i", ch_int))
-                    else:
-                        fp.write(struct.pack("i", ord(" ")))
-                    fp.write(
-                        struct.pack(
-                            "BBBBBB",
-                            *self.palette_dict[ch_str]["fg"],
-                            *self.palette_dict[ch_str]["bg"],
-                        )
-                    )
-
-            # write ASCII code mapped height layer (2)
+        if compress and self.is_out_of_core():
+            # streamed layers are written with seeks, so raw file is compressed afterwards
+            raw_file_name = file_name.with_name(f"{file_name.name}.raw")
+            with open(raw_file_name, "wb") as fp:
+                self.write_xp(fp, layers_no, legend_layer)
+            with open(raw_file_name, "rb") as src, gzip.open(file_name, "wb") as fp:
+                shutil.copyfileobj(src, fp, XP_COPY_CHUNK)
+            raw_file_name.unlink()
+        elif compress:
+            with gzip.open(file_name, "wb") as fp:
+                self.write_xp(fp, layers_no, legend_layer, cells)
+        else:
+            with open(file_name, "wb") as fp:
+                self.write_xp(fp, layers_no, legend_layer, cells)
+
+    def write_xp(self, fp, layers_no: int, legend_layer, cells: dict | None = None):
+        # write header
+        fp.write(struct.pack("i", 1))  # version
+        fp.write(struct.pack("i", layers_no))  # layers
+        fp.write(struct.pack("i", self.height_map.shape[1]))
+        fp.write(struct.pack("i", self.height_map.shape[0]))
+
+        if self.is_out_of_core():
+            self.write_xp_layer_stream(fp, glyph_layer=False)
             if self.export_glyphs:
-                fp.write(struct.pack("i", len(self.height_map[0])))
-                fp.write(struct.pack("i", len(self.height_map)))
-                for x in range(len(self.height_map[0])):
-                    for y in range(len(self.height_map)):
-                        ch_str = HEIGHT_TO_CHR_MAPPING[self.height_map[y][x] - 1]
-                        ch_int = ord(ch_str)
-                        fp.write(struct.pack("i", ch_int))
-                        # white letters on black background
-                        fp.write(struct.pack("BBBBBB", 255, 255, 255, 0, 0, 0))
-
-            # write legend layer (3)
-            fp.write(struct.pack("i", legend_layer.width))
-            fp.write(struct.pack("i", legend_layer.height))
-            for tile in legend_layer.tiles:
-                fp.write(struct.pack("i", ord(tile.ascii_code)))
-                fp.write(
-                    struct.pack(
-                        "BBBBBB",
-                        tile.fg_r,
-                        tile.fg_g,
-                        tile.fg_b,
-                        tile.bg_r,
-                        tile.bg_g,
-                        tile.bg_b,
-                    )
-                )
+                fp.write(struct.pack("i", self.height_map.shape[1]))
+                fp.write(struct.pack("i", self.height_map.shape[0]))
+                self.write_xp_layer_stream(fp, glyph_layer=True)
+        else:
+            self.write_xp_layers(fp, cells)
+
+        # write legend layer (3)
+        fp.write(struct.pack("i", legend_layer.width))
+        fp.write(struct.pack("i", legend_layer.height))
+        fp.write(self.xp_legend_cells(legend_layer).tobytes())
+
+    def xp_legend_cells(self, legend_layer) -> np.ndarray:
+        cells = np.zeros(len(legend_layer.tiles), dtype=XP_CELL_DTYPE)
+        cells["glyph"] = [ord(tile.ascii_code) for tile in legend_layer.tiles]
+        cells["fg"] = [(tile.fg_r, tile.fg_g, tile.fg_b) for tile in legend_layer.tiles]
+        cells["bg"] = [(tile.bg_r, tile.bg_g, tile.bg_b) for tile in legend_layer.tiles]
+        return cells
+
+    def xp_cells(
+        self, heights: np.ndarray, glyph_layer: bool, shared: dict | None = None
+    ) -> np.ndarray:
+        # Rexpaint cells for heights: map colors on background layer,
+        # white glyphs on black on glyph layer, shared - per cell data of
+        # heights (see export_cells) used instead of computing it again
+        if shared is None:
+            shared = {}
+        codes = shared.get("codes")
+        if codes is None and (glyph_layer or self.export_glyphs):
+            codes = self.height_to_codes(heights)
+
+        cells = np.zeros(heights.shape, dtype=XP_CELL_DTYPE)
+        if glyph_layer:
+            cells["glyph"] = codes
+            cells["fg"] = (255, 255, 255)
+            return cells
 
-        self.console.print(f"Map saved to '[bold]{file_name}[/]'.")
+        if self.export_glyphs:
+            cells["glyph"] = codes
+        else:
+            cells["glyph"] = ord(" ")
+        for key in ("fg", "bg"):
+            colors = shared.get(key)
+            cells[key] = self.palette_lut(key)[heights] if colors is None else colors
+        return cells
+
+    def write_xp_layer_stream(self, fp, glyph_layer: bool):
+        # layer cells are stored column by column, so the map is read in
+        # tiles and each tile column is written at its place in the file
+        height = self.height_map.shape[0]
+        layer_start = fp.tell()
+        for y0, x0, tile in tiled.iter_tiles(self.height_map, self.band_budget()):
+            cells = self.xp_cells(tile.T, glyph_layer)
+            for x, column in enumerate(cells, start=x0):
+                fp.seek(layer_start + (x * height + y0) * XP_CELL_DTYPE.itemsize)
+                fp.write(column.tobytes())
+        fp.seek(layer_start + self.height_map.size * XP_CELL_DTYPE.itemsize)
+
+    def write_xp_layers(self, fp, cells: dict | None = None):
+        # each layer is built as one array of cells in column-major order
+        # (transposed height map) and written with a single call
+        shared = {key: np.swapaxes(value, 0, 1) for key, value in (cells or {}).items()}
+        # write background color layer (1)
+        fp.write(
+            self.xp_cells(self.height_map.T, glyph_layer=False, shared=shared).tobytes()
+        )
+
+        # write ASCII code mapped height layer (2)
+        if self.export_glyphs:
+            fp.write(struct.pack("i", self.height_map.shape[1]))
+            fp.write(struct.pack("i", self.height_map.shape[0]))
+            fp.write(
+                self.xp_cells(
+                    self.height_map.T, glyph_layer=True, shared=shared
+                ).tobytes()
+            )
 
-    def text_to_tiles(self, start_x, start_y, layer, text):
-        tile = layer.tiles[self.xp_pos(start_y, start_x, layer)]
+    def text_to_tiles(self, start_x, start_y, layer, text, tile=None):
+        # characters get the style of given tile or of the first one replaced
+        if tile is None:
+            tile = layer.tiles[self.xp_pos(start_y, start_x, layer)]
 
         for i, c in enumerate(text):
             tile = deepcopy(tile)
             tile.ascii_code = c
             layer.tiles[self.xp_pos(start_y, start_x + i, layer)] = tile
 
+    @profiling.profiled(cells=False)
     def save_palette(self):
         palette_size = len(self.palette_dict)
         maps_folder = self.fix_maps_folder()
@@ -515,82 +1415,63 @@ class DiamondSquare:
     def xp_pos(self, x, y, layer):
         return (y * layer.height) + x
 
+    @profiling.profiled(cells=False)
     def load_legend_from_xp(self):
-        file_name = Path(__file__).parent / Path(MAPS_FOLDER) / "legend.xp"
-        if not file_name.exists():
-            raise Exception(
-                f"Rexpaint file with legend template '{file_name}' not found. Perhaps your installation of tui_map_generator has been corrupted. Try to reinstall it."
-            )
-        legend_layers = pyrexpaint.load(str(file_name))
-
-        if len(legend_layers) > 0:
-            self.xp_legend_layer = legend_layers[0]
-            for tile in self.xp_legend_layer.tiles:
-                c = cast(bytes, tile.ascii_code).decode("cp437")
-                c = c.replace(chr(0), "")
-                tile.ascii_code = c
+        # template is shared by all instances, save_to_xp works on a copy
+        self.xp_legend_layer = load_legend_template()
 
+    @profiling.profiled
     def load_from_xp(self):
         maps_folder = self.fix_maps_folder()
         file_name = maps_folder / f"{self.map_name}.xp"
-        self.image_layers = pyrexpaint.load(str(file_name))
+        self.image_layers = read_xp_layers(file_name)
+        self.generation = None
+        self.map_key = None
 
         # read background layer
         if len(self.image_layers) > 0:
             self.xp_layer = self.image_layers[0]
-            self.map_size = max(self.xp_layer.width, self.xp_layer.height)
-            self.height_map = []
-            # color_index = 1
-            # colors_map = {}
+            self.map_size = self.xp_layer.shape[1]
+            self.map_height = (
+                self.xp_layer.shape[0]
+                if self.xp_layer.shape[0] != self.xp_layer.shape[1]
+                else None
+            )
+            # heights are codes of one character glyphs
+            codes = xp_glyph_codes(self.xp_layer)
+            if codes.shape[2] > 1:
+                if (np.count_nonzero(codes, axis=2) != 1).any():
+                    raise Exception(
+                        f"Rexpaint file '{file_name}' has glyphs which are not single characters."
+                    )
+                codes = codes.max(axis=2, keepdims=True)
+            heights = codes[..., 0]
+            self.height_map = heights.astype(height_dtype(int(heights.max())))
+
+            # palette is made of colors of first cell with each glyph (in row order)
+            ys, xs = np.divmod(first_occurrences(self.height_map), heights.shape[1])
             p = {}
-            for i in range(self.xp_layer.height):
-                row: list[int] = []
-                for j in range(self.xp_layer.width):
-                    tile = self.xp_layer.tiles[self.xp_pos(i, j, self.xp_layer)]
-                    fg = tile.fg_r, tile.fg_g, tile.fg_b
-                    bg = tile.bg_r, tile.bg_g, tile.bg_b
-                    # color_id = (fg, bg)
-
-                    char = cast(bytes, tile.ascii_code).decode("cp437")
-
-                    char = char.replace(chr(0), "")
-                    if char not in p:
-                        p[char] = {"fg": fg, "bg": bg}
-                    # console.print(char, end="")
-                    # val = ord(char)
-                    row.append(ord(char))
-                self.height_map.append(row)
-            global PALETTES_DICT
-            PALETTES_DICT["custom"] = p
-            # self.console.print(p.keys())
+            for height, fg, bg in zip(
+                self.height_map[ys, xs],
+                self.xp_layer["fg"][ys, xs],
+                self.xp_layer["bg"][ys, xs],
+            ):
+                p[chr(height)] = {"fg": tuple(map(int, fg)), "bg": tuple(map(int, bg))}
+            PALETTE_REGISTRY.register("custom", p)
             self.palette = "custom"
             self.build_palette()
-            # self.generate()
 
         # read glyph layer
         if len(self.image_layers) > 1:
             self.glyph_layer = self.image_layers[1]
-            # self.map_size = max(self.xp_layer.width, self.xp_layer.height)
-            self.glyph_map = []
-            self.glyphs = []
-            for i in range(self.glyph_layer.width):
-                row: str = ""
-                for j in range(self.glyph_layer.height):
-                    tile = self.glyph_layer.tiles[self.xp_pos(i, j, self.glyph_layer)]
-                    # fg = tile.fg_r, tile.fg_g, tile.fg_b
-                    # bg = tile.bg_r, tile.bg_g, tile.bg_b
-
-                    char = cast(bytes, tile.ascii_code).decode("cp437")
-
-                    char = char.replace(chr(0), "")
-                    if char not in self.glyphs:
-                        self.glyphs.append(char)
-                    # console.print(char, end="")
-                    # val = ord(char)
-                    row += char
-                self.glyph_map.append(row)
-                # self.console.print(row)
-            # self.console.print(glyphs)
+            codes = xp_glyph_codes(self.glyph_layer)
+            self.glyph_map = [codes_to_str(row) for row in codes]
+            cells = codes.reshape(-1, codes.shape[2])
+            if codes.shape[2] > 1:
+                first = first_occurrences(self.glyph_layer["glyph"])
+            else:
+                first = first_occurrences(codes)
+            self.glyphs = list(dict.fromkeys(codes_to_str(cells[i]) for i in first))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,491 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+import mmap
+import random
+import numpy as np
+
+# every engine draws noise as a flat vector of -1/0/1 values in traversal order,
+# i.e. in the same order the loop version of diamond square visits the cells
+TNoiseSource = Callable[[int], np.ndarray]
+
+NOISE_DTYPE = np.int32
+# max number of 32 bit words pulled from the random module at once
+NOISE_CHUNK: int = 1 << 20
+# rough size of temporary arrays per cell processed in a band
+BAND_BYTES_PER_CELL: int = 256
+# cells per band of the parallel engine, bands (and their random substreams)
+# don't depend on the number of workers, so neither does the map
+PARALLEL_BAND_CELLS: int = 1 << 16
+ROUGHNESS_MIN: float = 0.1
+
+
+def round_and_clamp(values: np.ndarray, height_min: int, height_max: int) -> np.ndarray:
+    # same rounding as DiamondSquare.round_and_clamp (ties go up), done on whole arrays
+    floor = np.floor(values)
+    ceil = np.ceil(values)
+    result = np.where(np.abs(ceil - values) > np.abs(values - floor), floor, ceil)
+    return np.clip(result, height_min, height_max)
+
+
+def square_noise_size(blocks: int, start: int = 0, stop: int | None = None) -> int:
+    # rows on the corner grid have `blocks` cells, rows between them have `blocks + 1`
+    if stop is None:
+        stop = blocks + 1
+    return (stop - start) * blocks + (min(stop, blocks) - start) * (blocks + 1)
+
+
+def split_square_noise(
+    noise: np.ndarray, blocks: int, start: int = 0, stop: int | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    if stop is None:
+        stop = blocks + 1
+    odd_rows = min(stop, blocks) - start
+    pairs = noise[: odd_rows * (2 * blocks + 1)].reshape(odd_rows, 2 * blocks + 1)
+    noise_even = pairs[:, :blocks]
+    if stop - start > odd_rows:
+        noise_even = np.concatenate((noise_even, noise[None, -blocks:]))
+    noise_odd = pairs[:, blocks:]
+    return noise_even, noise_odd
+
+
+def band_blocks(
+    memory_budget: int | None, blocks: int, chunk_size: int, itemsize: int
+) -> int:
+    # number of block rows processed at once, so that temporary arrays and
+    # touched pages of a memory mapped height map stay within the budget
+    if memory_budget is None:
+        return blocks + 1
+    cell_bytes = BAND_BYTES_PER_CELL + 3 * min(chunk_size * itemsize, mmap.PAGESIZE)
+    return max(1, memory_budget // (cell_bytes * (blocks + 1)))
+
+
+def diamond_step(
+    height_map: np.ndarray,
+    chunk_size: int,
+    start: int,
+    stop: int,
+    noise: np.ndarray,
+    random_scalar: float,
+    height_min: int,
+    height_max: int,
+):
+    # fills centers of block rows from start to stop (exclusive)
+    half = chunk_size // 2
+    corners = height_map[
+        start * chunk_size : stop * chunk_size + 1 : chunk_size, ::chunk_size
+    ]
+    average = (
+        np.add(corners[:-1, :-1], corners[:-1, 1:], dtype=np.float64)
+        + corners[1:, :-1]
+        + corners[1:, 1:]
+    ) / 4
+    height_map[
+        start * chunk_size + half : stop * chunk_size : chunk_size, half::chunk_size
+    ] = round_and_clamp(average + noise * random_scalar, height_min, height_max)
+
+
+def square_step(
+    height_map: np.ndarray,
+    chunk_size: int,
+    start: int,
+    stop: int,
+    noise_even: np.ndarray,
+    noise_odd: np.ndarray,
+    random_scalar: float,
+    height_min: int,
+    height_max: int,
+):
+    # fills row pairs from start to stop (exclusive), where pair m is the row
+    # on the corner grid m * chunk_size and the row half a chunk below it.
+    # Neighbours lying on the first row or column are skipped (`> 0` checks
+    # in the loop version), so the sums and counts are built the same way here
+    half = chunk_size // 2
+    blocks = (height_map.shape[0] - 1) // chunk_size
+    odd_stop = min(stop, blocks)
+    even_rows = stop - start
+    odd_rows = odd_stop - start
+    # centers rows from one above the band, `offset` tells if that row exists
+    offset = 1 if start > 0 else 0
+    centers = height_map[
+        (start - offset) * chunk_size + half : odd_stop * chunk_size : chunk_size,
+        half::chunk_size,
+    ].astype(np.float64)
+    corner_rows = height_map[
+        start * chunk_size : odd_stop * chunk_size + 1 : chunk_size, ::chunk_size
+    ].astype(np.float64)
+
+    # cells on rows of the corner grid: corners left/right, centers up/down
+    total_even = corner_rows[:even_rows, 1:].copy()
+    count_even = np.ones(total_even.shape)
+    total_even[:, 1:] += corner_rows[:even_rows, 1:-1]
+    count_even[:, 1:] += 1
+    total_even[1 - offset :] += centers[: even_rows - 1 + offset]
+    count_even[1 - offset :] += 1
+    total_even[:odd_rows] += centers[offset : odd_rows + offset]
+    count_even[:odd_rows] += 1
+
+    height_map[
+        start * chunk_size : (stop - 1) * chunk_size + 1 : chunk_size, half::chunk_size
+    ] = round_and_clamp(
+        total_even / count_even + noise_even * random_scalar, height_min, height_max
+    )
+
+    if odd_rows == 0:
+        return
+
+    # cells between corner rows: centers left/right, corners up/down
+    total_odd = corner_rows[1 : odd_rows + 1].copy()
+    count_odd = np.ones(total_odd.shape)
+    total_odd[1 - offset :] += corner_rows[1 - offset : odd_rows]
+    count_odd[1 - offset :] += 1
+    total_odd[:, 1:] += centers[offset : odd_rows + offset]
+    count_odd[:, 1:] += 1
+    total_odd[:, :-1] += centers[offset : odd_rows + offset]
+    count_odd[:, :-1] += 1
+
+    height_map[
+        start * chunk_size + half : odd_stop * chunk_size : chunk_size, ::chunk_size
+    ] = round_and_clamp(
+        total_odd / count_odd + noise_odd * random_scalar, height_min, height_max
+    )
+
+
+def run(levels: Iterator[int]):
+    for _ in levels:
+        pass
+
+
+def diamond_square(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    noise_source: TNoiseSource,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> np.ndarray:
+    run(
+        iter_diamond_square(
+            height_map,
+            roughness,
+            height_min,
+            height_max,
+            noise_source,
+            memory_budget,
+            release,
+        )
+    )
+    return height_map
+
+
+def iter_diamond_square(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    noise_source: TNoiseSource,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> Iterator[int]:
+    # each pass is processed in bands of block rows (one band without budget),
+    # noise is drawn band after band so the result does not depend on the budget.
+    # After each level yields spacing of the grid which is done (and won't change)
+    map_size = height_map.shape[0]
+    random_scalar = roughness
+
+    chunk_size = map_size - 1
+    while chunk_size > 1:
+        blocks = (map_size - 1) // chunk_size
+        step = band_blocks(memory_budget, blocks, chunk_size, height_map.itemsize)
+
+        for start in range(0, blocks, step):
+            stop = min(start + step, blocks)
+            noise = noise_source((stop - start) * blocks).reshape(stop - start, blocks)
+            diamond_step(
+                height_map,
+                chunk_size,
+                start,
+                stop,
+                noise,
+                random_scalar,
+                height_min,
+                height_max,
+            )
+            if release is not None:
+                release()
+
+        for start in range(0, blocks + 1, step):
+            stop = min(start + step, blocks + 1)
+            noise_even, noise_odd = split_square_noise(
+                noise_source(square_noise_size(blocks, start, stop)),
+                blocks,
+                start,
+                stop,
+            )
+            square_step(
+                height_map,
+                chunk_size,
+                start,
+                stop,
+                noise_even,
+                noise_odd,
+                random_scalar,
+                height_min,
+                height_max,
+            )
+            if release is not None:
+                release()
+
+        chunk_size = chunk_size // 2
+        random_scalar = max(random_scalar / 2, ROUGHNESS_MIN)
+        yield chunk_size
+
+
+def numpy_seed(random_seed: int) -> int:
+    # numpy seeds must not be negative
+    return random_seed % 2**64
+
+
+def numpy_noise_source(rng: np.random.Generator) -> TNoiseSource:
+    def draw(size: int) -> np.ndarray:
+        return rng.integers(-1, 2, size=size, dtype=NOISE_DTYPE)
+
+    return draw
+
+
+def diamond_square_numpy(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    random_seed: int,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> np.ndarray:
+    run(
+        iter_diamond_square_numpy(
+            height_map,
+            roughness,
+            height_min,
+            height_max,
+            random_seed,
+            memory_budget,
+            release,
+        )
+    )
+    return height_map
+
+
+def iter_diamond_square_numpy(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    random_seed: int,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> Iterator[int]:
+    rng = np.random.default_rng(numpy_seed(random_seed))
+    corners = rng.integers(height_min, height_max + 1, size=4)
+    height_map[0, 0], height_map[0, -1], height_map[-1, 0], height_map[-1, -1] = corners
+    yield height_map.shape[0] - 1
+    yield from iter_diamond_square(
+        height_map,
+        roughness,
+        height_min,
+        height_max,
+        numpy_noise_source(rng),
+        memory_budget,
+        release,
+    )
+
+
+def python_noise_source(record: list[np.ndarray] | None = None) -> TNoiseSource:
+    # random.randint(-1, 1) takes the top 2 bits of one Mersenne Twister word
+    # (getrandbits(2)) and draws again on 3. A batch of n words is pulled with
+    # getrandbits(32 * n), which returns them least significant word first.
+    # Never more words are pulled than values are still missing, so the
+    # stream is left exactly where the loop version would leave it.
+    # With record, top 2 bits of all pulled words are appended to it.
+    def draw(size: int) -> np.ndarray:
+        result = np.empty(size, dtype=NOISE_DTYPE)
+        filled = 0
+        while filled < size:
+            words_no = min(size - filled, NOISE_CHUNK)
+            words = np.frombuffer(
+                random.getrandbits(32 * words_no).to_bytes(4 * words_no, "little"),
+                dtype="<u4",
+            )
+            values = words >> 30
+            if record is not None:
+                record.append(values.astype(np.uint8))
+            values = values[values < 3]
+            result[filled : filled + len(values)] = values
+            filled += len(values)
+        return result - 1
+
+    return draw
+
+
+def diamond_square_exact(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+    record: list[np.ndarray] | None = None,
+) -> np.ndarray:
+    run(
+        iter_diamond_square_exact(
+            height_map,
+            roughness,
+            height_min,
+            height_max,
+            memory_budget,
+            release,
+            record,
+        )
+    )
+    return height_map
+
+
+def iter_diamond_square_exact(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+    record: list[np.ndarray] | None = None,
+) -> Iterator[int]:
+    # consumes the random module stream in the same order as the loop version
+    height_map[0, 0] = random.randint(height_min, height_max)
+    height_map[0, -1] = random.randint(height_min, height_max)
+    height_map[-1, 0] = random.randint(height_min, height_max)
+    height_map[-1, -1] = random.randint(height_min, height_max)
+    yield height_map.shape[0] - 1
+    yield from iter_diamond_square(
+        height_map,
+        roughness,
+        height_min,
+        height_max,
+        python_noise_source(record),
+        memory_budget,
+        release,
+    )
+
+
+def band_noise_source(
+    random_seed: int, chunk_size: int, pass_no: int, start: int
+) -> TNoiseSource:
+    # independent substream for one band of one pass
+    seed_sequence = np.random.SeedSequence(
+        [numpy_seed(random_seed), chunk_size, pass_no, start]
+    )
+    return numpy_noise_source(np.random.default_rng(seed_sequence))
+
+
+def diamond_square_parallel(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    random_seed: int,
+    workers: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> np.ndarray:
+    run(
+        iter_diamond_square_parallel(
+            height_map, roughness, height_min, height_max, random_seed, workers, release
+        )
+    )
+    return height_map
+
+
+def iter_diamond_square_parallel(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    random_seed: int,
+    workers: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> Iterator[int]:
+    # bands of a pass don't depend on each other (diamond step writes centers
+    # reading corners, square step writes edges reading corners and centers),
+    # so they run on a thread pool, numpy releases the GIL in the kernels
+    rng = np.random.default_rng(numpy_seed(random_seed))
+    corners = rng.integers(height_min, height_max + 1, size=4)
+    height_map[0, 0], height_map[0, -1], height_map[-1, 0], height_map[-1, -1] = corners
+    yield height_map.shape[0] - 1
+
+    map_size = height_map.shape[0]
+    random_scalar = roughness
+
+    def diamond_band(
+        chunk_size: int, blocks: int, step: int, start: int, random_scalar: float
+    ):
+        stop = min(start + step, blocks)
+        noise_source = band_noise_source(random_seed, chunk_size, 0, start)
+        noise = noise_source((stop - start) * blocks).reshape(stop - start, blocks)
+        diamond_step(
+            height_map,
+            chunk_size,
+            start,
+            stop,
+            noise,
+            random_scalar,
+            height_min,
+            height_max,
+        )
+
+    def square_band(
+        chunk_size: int, blocks: int, step: int, start: int, random_scalar: float
+    ):
+        stop = min(start + step, blocks + 1)
+        noise_source = band_noise_source(random_seed, chunk_size, 1, start)
+        noise_even, noise_odd = split_square_noise(
+            noise_source(square_noise_size(blocks, start, stop)), blocks, start, stop
+        )
+        square_step(
+            height_map,
+            chunk_size,
+            start,
+            stop,
+            noise_even,
+            noise_odd,
+            random_scalar,
+            height_min,
+            height_max,
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        chunk_size = map_size - 1
+        while chunk_size > 1:
+            blocks = (map_size - 1) // chunk_size
+            step = max(1, PARALLEL_BAND_CELLS // (blocks + 1))
+
+            # list() waits for all bands of a pass before the next one starts
+            list(
+                executor.map(
+                    lambda start: diamond_band(
+                        chunk_size, blocks, step, start, random_scalar
+                    ),
+                    range(0, blocks, step),
+                )
+            )
+            list(
+                executor.map(
+                    lambda start: square_band(
+                        chunk_size, blocks, step, start, random_scalar
+                    ),
+                    range(0, blocks + 1, step),
+                )
+            )
+            if release is not None:
+                release()
+
+            chunk_size = chunk_size // 2
+            random_scalar = max(random_scalar / 2, ROUGHNESS_MIN)
+            yield chunk_size
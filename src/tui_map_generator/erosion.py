@@ -0,0 +1,114 @@
+from time import perf_counter
+import numpy as np
+
+# erosion works on a float copy of the height map scaled to 0..1, each
+# iteration is a few whole-array stencil operations on the edges between
+# neighbouring cells (4 neighbours), material leaving one cell through an edge
+# lands in the other one, so nothing is lost
+EROSION_FLOAT = np.float32
+# thermal: slopes steeper than talus (per cell, scaled by map size as
+# EROSION_TALUS / map size) slide down, rate is the part of the excess moved
+EROSION_TALUS: float = 4.0
+THERMAL_RATE: float = 0.5
+# hydraulic: rain falls on every cell, dissolves ground, water flows down
+# carrying sediment and evaporates, leaving what it can't carry anymore
+HYDRAULIC_RAIN: float = 0.01
+HYDRAULIC_SOLUBILITY: float = 0.3
+HYDRAULIC_EVAPORATION: float = 0.5
+HYDRAULIC_CAPACITY: float = 0.3
+
+
+def edge_views(values: np.ndarray, axis: int) -> tuple[np.ndarray, np.ndarray]:
+    # (first, second) cells of every edge along the axis
+    if axis == 0:
+        return values[:-1], values[1:]
+    return values[:, :-1], values[:, 1:]
+
+
+def thermal_step(heights: np.ndarray, talus: float, rate: float = THERMAL_RATE):
+    # flows of both axes come from the same state, then are applied
+    flows = []
+    for axis in (0, 1):
+        first, second = edge_views(heights, axis)
+        diff = first - second
+        excess = np.maximum(np.abs(diff) - talus, 0)
+        flows.append(np.copysign(excess, diff) * (rate / 4))
+    for axis, flow in enumerate(flows):
+        first, second = edge_views(heights, axis)
+        first -= flow
+        second += flow
+
+
+class HydraulicState:
+    # water and sediment carried between iterations
+    def __init__(self, shape: tuple[int, int]):
+        self.water = np.zeros(shape, dtype=EROSION_FLOAT)
+        self.sediment = np.zeros(shape, dtype=EROSION_FLOAT)
+
+    def settle(self, heights: np.ndarray):
+        # all sediment left in the water is deposited
+        heights += self.sediment
+        self.sediment[:] = 0
+        self.water[:] = 0
+
+
+def hydraulic_step(heights: np.ndarray, state: HydraulicState):
+    water = state.water
+    sediment = state.sediment
+    water += HYDRAULIC_RAIN
+    dissolved = water * HYDRAULIC_SOLUBILITY
+    heights -= dissolved
+    sediment += dissolved
+
+    # water levels even out, each edge moves at most a quarter of the water
+    # of its source cell, so a cell never gives more than it has
+    # (water is never zero here, it has just rained)
+    surface = heights + water
+    quarter = water / 4
+    concentration = sediment / water
+    flows = []
+    for axis in (0, 1):
+        first, second = edge_views(surface, axis)
+        first_quarter, second_quarter = edge_views(quarter, axis)
+        flow = np.clip((first - second) / 2, -second_quarter, first_quarter)
+        first_concentration, second_concentration = edge_views(concentration, axis)
+        carried = flow * np.where(flow > 0, first_concentration, second_concentration)
+        flows.append((flow, carried))
+    for axis, (flow, carried) in enumerate(flows):
+        first_water, second_water = edge_views(water, axis)
+        first_water -= flow
+        second_water += flow
+        first_sediment, second_sediment = edge_views(sediment, axis)
+        first_sediment -= carried
+        second_sediment += carried
+
+    water *= 1 - HYDRAULIC_EVAPORATION
+    deposit = np.maximum(sediment - water * HYDRAULIC_CAPACITY, 0)
+    sediment -= deposit
+    heights += deposit
+
+
+def erode(
+    heights: np.ndarray,
+    kind: str,
+    iterations: int,
+    time_budget: float | None = None,
+) -> int:
+    # erodes heights (floats 0..1) in place, kind: "thermal", "hydraulic" or
+    # "both", stops early when time budget (seconds) runs out, but always
+    # after at least one iteration, returns the number of iterations done
+    talus = EROSION_TALUS / max(heights.shape)
+    state = HydraulicState(heights.shape) if kind != "thermal" else None
+    start = perf_counter()
+    done = 0
+    while done < iterations:
+        if state is not None:
+            hydraulic_step(heights, state)
+        if kind != "hydraulic":
+            thermal_step(heights, talus)
+        done += 1
+        if time_budget is not None and perf_counter() - start >= time_budget:
+            break
+    if state is not None:
+        state.settle(heights)
+    return done
@@ -0,0 +1,155 @@
+from typing import Callable
+import random
+import numpy as np
+from tui_map_generator import engines
+
+# number of first words of the stream kept in full (for corners drawn by randint)
+HEAD_WORDS: int = 64
+# rejected value of random.randint(-1, 1) (see engines.python_noise_source)
+REJECTED_NOISE: int = 3
+
+
+class DrawCache:
+    # random module stream consumed by the exact engine for one seed: all
+    # words are needed in full only for corners, noise uses top 2 bits of
+    # each word, roughness and max height don't change the stream itself
+    def __init__(
+        self,
+        random_seed: int,
+        head: np.ndarray,
+        top_bits: np.ndarray,
+        final_state: tuple,
+    ):
+        self.random_seed = random_seed
+        self.head = head
+        self.top_bits = top_bits
+        self.final_state = final_state
+
+
+def stream_words(random_seed: int, words_no: int) -> np.ndarray:
+    # first words of the stream, random module state is left untouched
+    state = random.getstate()
+    random.seed(random_seed)
+    words = random.getrandbits(32 * words_no).to_bytes(4 * words_no, "little")
+    random.setstate(state)
+    return np.frombuffer(words, dtype="<u4")
+
+
+def skip_words(random_seed: int, words_no: int):
+    # puts random module where it is after pulling words_no words of the stream
+    random.seed(random_seed)
+    while words_no > 0:
+        chunk = min(words_no, engines.NOISE_CHUNK)
+        random.getrandbits(32 * chunk)
+        words_no -= chunk
+
+
+def randint_words(
+    words: np.ndarray, position: int, height_min: int, height_max: int
+) -> tuple[int, int]:
+    # random.randint(height_min, height_max) on words from position,
+    # returns value and position of the next word (IndexError if out of words)
+    n = height_max - height_min + 1
+    k = n.bit_length()
+    r = int(words[position]) >> (32 - k)
+    position += 1
+    while r >= n:
+        r = int(words[position]) >> (32 - k)
+        position += 1
+    return height_min + r, position
+
+
+def generate_exact(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    random_seed: int,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+    record_draws: bool = True,
+) -> DrawCache | None:
+    # cold generation (random module seeded by the caller), recording the stream
+    # (one byte per cell, out-of-core maps skip it to stay within memory budget)
+    if not record_draws:
+        engines.diamond_square_exact(
+            height_map, roughness, height_min, height_max, memory_budget, release
+        )
+        return None
+    record = []
+    engines.diamond_square_exact(
+        height_map, roughness, height_min, height_max, memory_budget, release, record
+    )
+    head = stream_words(random_seed, HEAD_WORDS)
+    corner_words = 0
+    try:
+        for _ in range(4):
+            _, corner_words = randint_words(head, corner_words, height_min, height_max)
+    except IndexError:
+        return None
+    top_bits = np.concatenate([(head[:corner_words] >> 30).astype(np.uint8)] + record)
+    return DrawCache(random_seed, head, top_bits, random.getstate())
+
+
+def replay_exact(
+    cache: DrawCache,
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> bool:
+    # the same map and random module state as cold generation, but the
+    # stream comes from the cache, False if it can't be replayed
+    corners = []
+    position = 0
+    try:
+        for _ in range(4):
+            corner, position = randint_words(
+                cache.head, position, height_min, height_max
+            )
+            corners.append(corner)
+    except IndexError:
+        return False
+
+    # every cell except corners gets one noise value
+    noise_size = height_map.size - 4
+    tail = cache.top_bits[position:]
+    accepted = np.flatnonzero(tail != REJECTED_NOISE)
+    while len(accepted) < noise_size:
+        # corners took more words than before, the stream is continued
+        record = []
+        random.setstate(cache.final_state)
+        engines.python_noise_source(record)(noise_size - len(accepted))
+        cache.top_bits = np.concatenate([cache.top_bits] + record)
+        cache.final_state = random.getstate()
+        tail = cache.top_bits[position:]
+        accepted = np.flatnonzero(tail != REJECTED_NOISE)
+
+    noise = tail[accepted[:noise_size]]
+    consumed = position + (int(accepted[noise_size - 1]) + 1 if noise_size else 0)
+    if consumed == len(cache.top_bits):
+        random.setstate(cache.final_state)
+    else:
+        skip_words(cache.random_seed, consumed)
+
+    drawn = 0
+
+    def draw(size: int) -> np.ndarray:
+        nonlocal drawn
+        values = noise[drawn : drawn + size].astype(engines.NOISE_DTYPE) - 1
+        drawn += size
+        return values
+
+    height_map[0, 0], height_map[0, -1], height_map[-1, 0], height_map[-1, -1] = corners
+    engines.diamond_square(
+        height_map,
+        roughness,
+        height_min,
+        height_max,
+        draw,
+        memory_budget,
+        release,
+    )
+    return True
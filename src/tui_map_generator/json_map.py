@@ -0,0 +1,169 @@
+from typing import Callable, TextIO
+import json
+import numpy as np
+from tui_map_generator import tiled
+
+JSON_READ_CHUNK: int = 1024 * 1024
+JSON_WHITESPACE = " \t\n\r"
+# creates array for height map of given shape able to hold heights up to max height
+TAllocate = Callable[[tuple[int, int], int], np.ndarray]
+
+
+class JsonStream:
+    # minimal incremental reader, the file is read in chunks and only the
+    # part which has not been parsed yet is kept in buffer
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        data = self.f.read(JSON_READ_CHUNK)
+        if not data:
+            return False
+        self.buffer = self.buffer[self.pos :] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while (
+                self.pos < len(self.buffer) and self.buffer[self.pos] in JSON_WHITESPACE
+            ):
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise Exception("Unexpected end of JSON map file.")
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise Exception(
+                f"Invalid JSON map file, expected '{char}', found '{found}'."
+            )
+        self.pos += 1
+
+    def value(self):
+        # any JSON value (used for keys and parameters), value must be followed
+        # by another character, so numbers are never cut at the end of buffer
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                if end < len(self.buffer):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                pass
+            if not self.fill():
+                raise Exception("Invalid JSON map file, could not parse value.")
+
+    def array_text(self) -> str:
+        # content of flat array of numbers, e.g. "1, 2, 3" for [1, 2, 3]
+        self.expect("[")
+        end = self.buffer.find("]", self.pos)
+        while end < 0:
+            searched = len(self.buffer) - self.pos
+            if not self.fill():
+                raise Exception("Unexpected end of JSON map file.")
+            end = self.buffer.find("]", searched)
+        text = self.buffer[self.pos : end]
+        self.pos = end + 1
+        return text
+
+
+def parse_row(text: str) -> np.ndarray:
+    row = np.fromstring(text, dtype=np.int64, sep=",")
+    if len(row) != text.count(",") + 1:
+        raise Exception("Invalid JSON map file, height map rows must hold integers.")
+    return row
+
+
+def read_rows(
+    stream: JsonStream,
+    parameters: dict,
+    allocate: TAllocate,
+    memory_budget: int | None = None,
+) -> np.ndarray:
+    # rows are parsed one by one straight into typed array, when parameters
+    # (read earlier) give map size and max height, the array is allocated up front
+    # (rectangular maps give the number of rows as map height)
+    stream.expect("[")
+    height_map = None
+    rows = []
+    y = 0
+    while stream.peek() != "]":
+        if y > 0:
+            stream.expect(",")
+        row = parse_row(stream.array_text())
+        if (
+            y == 0
+            and parameters.get("Map size") == len(row)
+            and "Max height" in parameters
+        ):
+            height_map = allocate(
+                (parameters.get("Map height", len(row)), len(row)),
+                parameters["Max height"],
+            )
+            band = tiled.band_rows(memory_budget, len(row))
+
+        if height_map is None:
+            if len(rows) > 0 and len(row) != len(rows[0]):
+                raise Exception(
+                    "Invalid JSON map file, height map rows must have the same length."
+                )
+            rows.append(row)
+        else:
+            if y >= height_map.shape[0] or len(row) != height_map.shape[1]:
+                raise Exception(
+                    f"Invalid JSON map file, height map must be {height_map.shape[1]}x{height_map.shape[0]}."
+                )
+            if row.min() < 0 or row.max() > np.iinfo(height_map.dtype).max:
+                raise Exception(
+                    f"Invalid JSON map file, height values must be in range 0..{parameters['Max height']}."
+                )
+            height_map[y] = row
+            if (y + 1) % band == 0:
+                tiled.release(height_map)
+        y += 1
+    stream.pos += 1
+
+    if height_map is None:
+        if len(rows) == 0:
+            raise Exception("Invalid JSON map file, height map is empty.")
+        heights = np.array(rows)
+        height_map = allocate(heights.shape, int(heights.max()))
+        height_map[:] = heights
+    elif y != height_map.shape[0]:
+        raise Exception(
+            f"Invalid JSON map file, height map must be {height_map.shape[1]}x{height_map.shape[0]}."
+        )
+    tiled.release(height_map)
+    return height_map
+
+
+def read_json_map(
+    f: TextIO, allocate: TAllocate, memory_budget: int | None = None
+) -> tuple[dict, np.ndarray]:
+    # reads {"parameters": {...}, "height_map": [[...], ...]} in any formatting
+    stream = JsonStream(f)
+    parameters = {}
+    height_map = None
+    stream.expect("{")
+    while stream.peek() != "}":
+        if stream.peek() == ",":
+            stream.pos += 1
+        key = stream.value()
+        stream.expect(":")
+        if key == "height_map":
+            height_map = read_rows(stream, parameters, allocate, memory_budget)
+        elif key == "parameters":
+            parameters = stream.value()
+        else:
+            stream.value()
+
+    if height_map is None:
+        raise Exception("Invalid JSON map file, 'height_map' not found.")
+    return parameters, height_map
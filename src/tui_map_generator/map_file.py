@@ -0,0 +1,119 @@
+from pathlib import Path
+from typing import BinaryIO, Iterator
+import json
+import struct
+import zlib
+import numpy as np
+from tui_map_generator import tiled
+
+# native map file: magic, header length, json header, padding, height map data
+# (raw rows of typed array, can be memory mapped, or zlib stream of them)
+MAP_FILE_EXTENSION = "hmap"
+MAP_MAGIC = b"TUIHMAP\x00"
+MAP_VERSION = 1
+MAP_HEADER_LENGTH = struct.Struct("<I")
+# data starts at multiple of this offset
+MAP_ALIGNMENT = 64
+MAP_COMPRESSION_LEVEL = 6
+MAP_READ_CHUNK: int = 1024 * 1024
+
+
+def write_map_file(
+    fp: BinaryIO,
+    height_map: np.ndarray,
+    parameters: dict,
+    compress: bool = False,
+    memory_budget: int | None = None,
+):
+    header = {
+        "version": MAP_VERSION,
+        "parameters": parameters,
+        "dtype": height_map.dtype.str,
+        "shape": list(height_map.shape),
+        "compression": "zlib" if compress else "raw",
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    fp.write(MAP_MAGIC)
+    fp.write(MAP_HEADER_LENGTH.pack(len(header_bytes)))
+    fp.write(header_bytes)
+    header_end = len(MAP_MAGIC) + MAP_HEADER_LENGTH.size + len(header_bytes)
+    fp.write(b"\0" * (-header_end % MAP_ALIGNMENT))
+
+    compressor = zlib.compressobj(MAP_COMPRESSION_LEVEL) if compress else None
+    for _, band in tiled.iter_row_bands(height_map, memory_budget):
+        data = np.ascontiguousarray(band).data
+        fp.write(data if compressor is None else compressor.compress(data))
+    if compressor is not None:
+        fp.write(compressor.flush())
+
+
+def read_map_header(file_name: str | Path) -> tuple[dict, int]:
+    # header and offset of height map data
+    with open(file_name, "rb") as f:
+        magic = f.read(len(MAP_MAGIC))
+        if magic != MAP_MAGIC:
+            raise Exception(f"File '{file_name}' is not a tui-map-generator map file.")
+        (header_length,) = MAP_HEADER_LENGTH.unpack(f.read(MAP_HEADER_LENGTH.size))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+
+    if header["version"] > MAP_VERSION:
+        raise Exception(
+            f"Map file '{file_name}' has version {header['version']}, only versions up to {MAP_VERSION} are supported. Try to upgrade tui_map_generator."
+        )
+    header_end = len(MAP_MAGIC) + MAP_HEADER_LENGTH.size + header_length
+    return header, header_end + (-header_end % MAP_ALIGNMENT)
+
+
+def iter_map_data(f: BinaryIO, compressed: bool) -> Iterator[bytes]:
+    # chunks of height map data, at most MAP_READ_CHUNK bytes each
+    decompressor = zlib.decompressobj() if compressed else None
+    while True:
+        data = f.read(MAP_READ_CHUNK)
+        if not data:
+            return
+        if decompressor is None:
+            yield data
+            continue
+        while data:
+            yield decompressor.decompress(data, MAP_READ_CHUNK)
+            data = decompressor.unconsumed_tail
+
+
+def read_map_data(
+    file_name: str | Path,
+    header: dict,
+    offset: int,
+    out: np.ndarray | None = None,
+    memory_budget: int | None = None,
+) -> np.ndarray:
+    # raw data is memory mapped copy-on-write (nothing is read until used,
+    # changes are never written back), otherwise data is read into out
+    # (new array if not given), memory mapped out is released within budget
+    dtype = np.dtype(header["dtype"])
+    shape = tuple(header["shape"])
+    if header["compression"] == "raw" and out is None:
+        return np.memmap(file_name, dtype=dtype, mode="c", offset=offset, shape=shape)
+
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    if memory_budget is None:
+        memory_budget = tiled.MEMORY_BUDGET
+    flat = out.reshape(-1).view(np.uint8)
+    position = 0
+    released = 0
+    with open(file_name, "rb") as f:
+        f.seek(offset)
+        for data in iter_map_data(f, header["compression"] == "zlib"):
+            data = data[: flat.size - position]
+            flat[position : position + len(data)] = np.frombuffer(data, np.uint8)
+            position += len(data)
+            if position - released >= memory_budget // 2:
+                tiled.release(out)
+                released = position
+            if position == flat.size:
+                break
+    tiled.release(out)
+
+    if position < flat.size:
+        raise Exception(f"Map file '{file_name}' is truncated.")
+    return out
@@ -0,0 +1,181 @@
+from typing import Callable
+import math
+import numpy as np
+from tui_map_generator import engines, tiled
+
+# gradient noise (Perlin) and fractal Brownian motion (sum of octaves of
+# gradient noise), any width and height, whole bands of rows at once.
+# The first octave has NOISE_FEATURES features along the longer side of the map
+# (the same look for all sizes, like diamond square), next octaves have twice
+# higher frequency, down to features of NOISE_MIN_PERIOD cells
+NOISE_FEATURES: int = 4
+NOISE_MIN_PERIOD: float = 2.0
+# noise is computed in bands of about this many cells (temporary arrays stay
+# in CPU cache), smaller bands are used when memory budget asks for it
+NOISE_BAND_CELLS: int = 1 << 16
+# temporary float arrays per cell of a band
+NOISE_BYTES_PER_CELL: int = 48
+NOISE_FLOAT = np.float32
+# splitmix64 constants, gradients are hashes of lattice point coordinates
+HASH_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+HASH_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+HASH_MIX_2 = np.uint64(0x94D049BB133111EB)
+HASH_ROW = np.uint64(0xD6E8FEB86659FD93)
+
+
+def mix(h: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer, uint64 arithmetic wraps around
+    with np.errstate(over="ignore"):
+        h = (h ^ (h >> np.uint64(30))) * HASH_MIX_1
+        h = (h ^ (h >> np.uint64(27))) * HASH_MIX_2
+    return h ^ (h >> np.uint64(31))
+
+
+class Octave:
+    # gradients (unit vectors) at lattice points period cells apart are
+    # hashes of the point and octave key, so the lattice is never kept in
+    # memory and any band of rows can be computed on its own
+    def __init__(self, key: np.uint64, period: float, amplitude: float):
+        self.key = key
+        self.period = period
+        self.amplitude = amplitude
+
+    def gradients(
+        self, rows: np.ndarray, columns: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        with np.errstate(over="ignore"):
+            row_keys = rows.astype(np.uint64)[:, None] * HASH_ROW + self.key
+        h = mix(row_keys ^ mix(columns.astype(np.uint64)[None, :] + HASH_GOLDEN))
+        angles = (h >> np.uint64(11)) * (2 * math.pi / 2**53)
+        return np.cos(angles).astype(NOISE_FLOAT), np.sin(angles).astype(NOISE_FLOAT)
+
+
+def fade(t: np.ndarray) -> np.ndarray:
+    return t * t * t * (t * (t * 6 - 15) + 10)
+
+
+def gradient_noise(octave: Octave, y0: int, y1: int, width: int) -> np.ndarray:
+    # noise of rows y0..y1 (range about -0.7..0.7). Along a row of lattice
+    # points dot products and x interpolation depend only on x, so they are
+    # computed once per lattice row (p - x part, q - factor of y offset) and
+    # whole rows of the band are taken from them, leaving a few operations
+    # per cell
+    xs = np.arange(width) / octave.period
+    xi = xs.astype(np.int64)
+    xf = (xs - xi).astype(NOISE_FLOAT)
+    u = fade(xf)
+    ys = np.arange(y0, y1) / octave.period
+    yi = ys.astype(np.int64)
+    yf = (ys - yi).astype(NOISE_FLOAT)[:, None]
+    v = fade(yf)
+
+    first = yi[0]
+    gx, gy = octave.gradients(np.arange(first, yi[-1] + 2), np.arange(xi[-1] + 2))
+    left = gx[:, xi] * xf
+    p = left + u * (gx[:, xi + 1] * (xf - 1) - left)
+    q = gy[:, xi] + u * (gy[:, xi + 1] - gy[:, xi])
+
+    rows = yi - first
+    upper = p[rows] + yf * q[rows]
+    lower = p[rows + 1] + (yf - 1) * q[rows + 1]
+    return upper + v * (lower - upper)
+
+
+def octaves(
+    shape: tuple[int, int],
+    random_seed: int,
+    gain: float,
+    octaves_no: int | None = None,
+) -> list[Octave]:
+    # each octave has its own key (seed of its gradient hashes)
+    seed = np.uint64(engines.numpy_seed(random_seed))
+    period = max(max(shape) - 1, 1) / NOISE_FEATURES
+    if octaves_no is None:
+        octaves_no = max(1, int(math.log2(max(period, 1) / NOISE_MIN_PERIOD)) + 1)
+    keys = mix(seed + HASH_GOLDEN * np.arange(1, octaves_no + 1, dtype=np.uint64))
+    return [Octave(key, period / 2**i, gain**i) for i, key in enumerate(keys)]
+
+
+def fbm_band(layers: list[Octave], y0: int, y1: int, width: int) -> np.ndarray:
+    values = np.zeros((y1 - y0, width), dtype=NOISE_FLOAT)
+    for octave in layers:
+        values += octave.amplitude * gradient_noise(octave, y0, y1, width)
+    return values
+
+
+def fill_heights(
+    height_map: np.ndarray,
+    layers: list[Octave],
+    height_min: int,
+    height_max: int,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> np.ndarray:
+    # noise is stretched to the full range of heights, so the first pass finds
+    # its lowest and highest value, in memory the noise is kept for the second
+    # pass, out-of-core maps (memory budget) compute it again band by band
+    height, width = height_map.shape
+    rows = max(1, NOISE_BAND_CELLS // width)
+    if memory_budget is not None:
+        rows = min(rows, tiled.band_rows(memory_budget, width, NOISE_BYTES_PER_CELL))
+    bands = [(y0, min(y0 + rows, height)) for y0 in range(0, height, rows)]
+    noise = None
+    if memory_budget is None:
+        noise = np.empty(height_map.shape, dtype=NOISE_FLOAT)
+    low, high = math.inf, -math.inf
+    for y0, y1 in bands:
+        values = fbm_band(layers, y0, y1, width)
+        low = min(low, float(values.min()))
+        high = max(high, float(values.max()))
+        if noise is not None:
+            noise[y0:y1] = values
+
+    scale = (height_max - height_min) / (high - low) if high > low else 0.0
+    for y0, y1 in bands:
+        if noise is not None:
+            values = noise[y0:y1]
+        else:
+            values = fbm_band(layers, y0, y1, width)
+        height_map[y0:y1] = np.rint(height_min + (values - low) * scale)
+        if release is not None:
+            release()
+    return height_map
+
+
+def perlin(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    random_seed: int,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> np.ndarray:
+    # one octave of gradient noise (smooth hills), roughness is not used
+    layers = octaves(height_map.shape, random_seed, 1.0, 1)
+    return fill_heights(
+        height_map, layers, height_min, height_max, memory_budget, release
+    )
+
+
+def fbm_gain(roughness: float, height_min: int, height_max: int) -> float:
+    # amplitude ratio of next octaves, default roughness (equal to heights
+    # range) gives about 0.5, lower is smoother, higher is more ragged
+    return roughness / (roughness + max(height_max - height_min, 1))
+
+
+def fbm(
+    height_map: np.ndarray,
+    roughness: float,
+    height_min: int,
+    height_max: int,
+    random_seed: int,
+    memory_budget: int | None = None,
+    release: Callable[[], None] | None = None,
+) -> np.ndarray:
+    layers = octaves(
+        height_map.shape, random_seed, fbm_gain(roughness, height_min, height_max)
+    )
+    return fill_heights(
+        height_map, layers, height_min, height_max, memory_budget, release
+    )
@@ -0,0 +1,138 @@
+from typing import TYPE_CHECKING, Callable
+import string
+
+if TYPE_CHECKING:
+    from tui_map_generator import render
+
+# palette: {symbol: {"fg": (r, g, b), "bg": (r, g, b)}}, symbols are glyphs of
+# HEIGHT_TO_CHR_MAPPING or, for palettes read from files ("custom"), any
+# characters whose codes are heights
+TPalette = dict[str, dict]
+HEIGHT_TO_CHR_MAPPING = (
+    list(string.ascii_letters) + list("#$%&*=,.~+@^") + list(map(chr, range(191, 255)))
+)
+
+
+def palette_hash(palette: TPalette) -> int:
+    return hash(
+        tuple(
+            (symbol, tuple(colors["fg"]), tuple(colors["bg"]))
+            for symbol, colors in palette.items()
+        )
+    )
+
+
+def build_default_palettes() -> dict[str, TPalette]:
+    palettes = {
+        "landscape_4": {
+            HEIGHT_TO_CHR_MAPPING[0]: {"fg": (255, 255, 255), "bg": (000, 000, 255)},
+            HEIGHT_TO_CHR_MAPPING[1]: {"fg": (255, 255, 255), "bg": (215, 175, 000)},
+            HEIGHT_TO_CHR_MAPPING[2]: {"fg": (255, 255, 255), "bg": (000, 191, 000)},
+            HEIGHT_TO_CHR_MAPPING[3]: {"fg": (000, 000, 000), "bg": (255, 255, 255)},
+        },
+        "landscape_8": {
+            HEIGHT_TO_CHR_MAPPING[0]: {"fg": (255, 255, 255), "bg": (000, 000, 63)},
+            HEIGHT_TO_CHR_MAPPING[1]: {"fg": (255, 255, 255), "bg": (000, 000, 255)},
+            HEIGHT_TO_CHR_MAPPING[2]: {"fg": (255, 255, 255), "bg": (215, 175, 000)},
+            HEIGHT_TO_CHR_MAPPING[3]: {"fg": (255, 255, 255), "bg": (000, 191, 000)},
+            HEIGHT_TO_CHR_MAPPING[4]: {"fg": (255, 255, 255), "bg": (000, 63, 000)},
+            HEIGHT_TO_CHR_MAPPING[5]: {"fg": (255, 255, 255), "bg": (138, 117, 88)},
+            HEIGHT_TO_CHR_MAPPING[6]: {"fg": (000, 000, 000), "bg": (85, 85, 85)},
+            HEIGHT_TO_CHR_MAPPING[7]: {"fg": (000, 000, 000), "bg": (255, 255, 255)},
+        },
+        "landscape_16": {
+            HEIGHT_TO_CHR_MAPPING[0]: {"fg": (255, 255, 255), "bg": (000, 000, 63)},
+            HEIGHT_TO_CHR_MAPPING[1]: {"fg": (255, 255, 255), "bg": (000, 000, 127)},
+            HEIGHT_TO_CHR_MAPPING[2]: {"fg": (255, 255, 255), "bg": (000, 000, 191)},
+            HEIGHT_TO_CHR_MAPPING[3]: {"fg": (255, 255, 255), "bg": (000, 000, 255)},
+            HEIGHT_TO_CHR_MAPPING[4]: {"fg": (255, 255, 255), "bg": (215, 175, 000)},
+            HEIGHT_TO_CHR_MAPPING[5]: {"fg": (255, 255, 255), "bg": (000, 191, 000)},
+            HEIGHT_TO_CHR_MAPPING[6]: {"fg": (255, 255, 255), "bg": (000, 127, 000)},
+            HEIGHT_TO_CHR_MAPPING[7]: {"fg": (255, 255, 255), "bg": (000, 63, 000)},
+            HEIGHT_TO_CHR_MAPPING[8]: {"fg": (255, 255, 255), "bg": (81, 69, 52)},
+            HEIGHT_TO_CHR_MAPPING[9]: {"fg": (255, 255, 255), "bg": (100, 85, 64)},
+            HEIGHT_TO_CHR_MAPPING[10]: {"fg": (255, 255, 255), "bg": (119, 101, 76)},
+            HEIGHT_TO_CHR_MAPPING[11]: {"fg": (255, 255, 255), "bg": (138, 117, 88)},
+            HEIGHT_TO_CHR_MAPPING[12]: {"fg": (000, 000, 000), "bg": (85, 85, 85)},
+            HEIGHT_TO_CHR_MAPPING[13]: {"fg": (000, 000, 000), "bg": (135, 135, 135)},
+            HEIGHT_TO_CHR_MAPPING[14]: {"fg": (000, 000, 000), "bg": (150, 150, 150)},
+            HEIGHT_TO_CHR_MAPPING[15]: {"fg": (000, 000, 000), "bg": (255, 255, 255)},
+        },
+    }
+
+    no_shades = 16
+
+    palette_definitions = {}
+    palette_definitions["grey   "] = [1, 1, 1]
+    palette_definitions["red    "] = [1, 0, 0]
+    palette_definitions["green  "] = [0, 1, 0]
+    palette_definitions["blue   "] = [0, 0, 1]
+    palette_definitions["yellow "] = [1, 1, 0]
+    palette_definitions["magenta"] = [1, 0, 1]
+    palette_definitions["cyan   "] = [0, 1, 1]
+
+    for key in palette_definitions:
+        p = build_default_palette(no_shades, palette_definitions[key])
+        palettes[f"{key.strip()}_{no_shades}"] = p
+
+    no_shades_list = [32, 64, 128]
+    for no_shades in no_shades_list:
+        palette_name = "grey   "
+        p = build_default_palette(no_shades, palette_definitions[palette_name])
+        palettes[f"{palette_name.strip()}_{no_shades}"] = p
+    return palettes
+
+
+def build_default_palette(no_shades: int, colors: list[int]) -> TPalette:
+    step = round(255 / no_shades)
+    p = {}
+    for x in range(no_shades):
+        p[HEIGHT_TO_CHR_MAPPING[x]] = {
+            "fg": (255, 255, 255),
+            "bg": (x * step * colors[0], x * step * colors[1], x * step * colors[2]),
+        }
+    return p
+
+
+class PaletteRegistry:
+    # palettes are built on first use (load), compiled on first use and
+    # cached by name and content hash, so a palette changed in place is compiled
+    # again, register drops compiled versions of replaced palette
+    def __init__(self, load: Callable[[], dict[str, TPalette]]):
+        self.load = load
+        self.loaded: dict[str, TPalette] | None = None
+        self.compiled: dict[tuple[str, int], "render.CompiledPalette"] = {}
+
+    @property
+    def palettes(self) -> dict[str, TPalette]:
+        if self.loaded is None:
+            self.loaded = self.load()
+        return self.loaded
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.palettes
+
+    def names(self) -> list[str]:
+        return list(self.palettes)
+
+    def register(self, name: str, palette: TPalette):
+        self.palettes[name] = palette
+        for key in [key for key in self.compiled if key[0] == name]:
+            del self.compiled[key]
+
+    def get(self, name: str) -> "render.CompiledPalette":
+        # render (numpy, rich) is imported by the first caller which needs colors
+        from tui_map_generator import render
+
+        palette = self.palettes[name]
+        key = (name, palette_hash(palette))
+        if key not in self.compiled:
+            # heights of custom palette are codes of its symbols
+            self.compiled[key] = render.CompiledPalette(
+                palette, None if name == "custom" else HEIGHT_TO_CHR_MAPPING
+            )
+        return self.compiled[key]
+
+
+# palettes shared by all instances
+PALETTE_REGISTRY = PaletteRegistry(build_default_palettes)
@@ -0,0 +1,245 @@
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Iterator
+import atexit
+import json
+import os
+import threading
+import tracemalloc
+
+# set to anything to print profile summary at exit, to file name ending with
+# .json to also save Chrome trace (chrome://tracing, Perfetto) or with
+# .pstats/.prof to also save cProfile stats
+PROFILE_ENV = "TUI_MAP_GENERATOR_PROFILE"
+PSTATS_EXTENSIONS = [".pstats", ".prof"]
+CHROME_TRACE_EXTENSIONS = [".json"]
+
+
+class Phase:
+    # one timed call, peak is the highest traced memory during the phase
+    def __init__(
+        self, name: str, depth: int, start: float, memory: int, thread: int = 0
+    ):
+        self.name = name
+        self.depth = depth
+        self.thread = thread
+        self.start = start
+        self.seconds = 0.0
+        self.start_memory = memory
+        self.peak = memory
+        self.cells = 0
+
+
+class Profiler:
+    # records phases (instrumented DiamondSquare methods and blocks of code),
+    # phases can be nested, memory is traced with tracemalloc (slows down
+    # allocations), cProfile runs the whole session when output asks for it.
+    # Each thread has its own stack of phases, phases of other threads (e.g.
+    # export encoders) are nested under the phase open on the main thread,
+    # memory is traced for the whole process, so peaks of phases running at
+    # the same time include each other's allocations
+    def __init__(self, output: str | Path | None = None):
+        self.output = Path(output) if output else None
+        self.phases: list[Phase] = []
+        self.stacks: dict[int, list[Phase]] = {}
+        self.lock = threading.Lock()
+        self.started = perf_counter()
+        self.thread = threading.get_ident()
+        self.stack = self.stacks.setdefault(self.thread, [])
+        self.cprofile = None
+        self.was_tracing = tracemalloc.is_tracing()
+        if not self.was_tracing:
+            tracemalloc.start()
+        if self.output is not None and self.output.suffix in PSTATS_EXTENSIONS:
+            import cProfile
+
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @contextmanager
+    def phase(self, name: str, cells: int = 0) -> Iterator[Phase]:
+        thread = threading.get_ident()
+        with self.lock:
+            stack = self.stacks.setdefault(thread, [])
+            if stack:
+                depth = stack[-1].depth + 1
+            elif thread != self.thread:
+                depth = len(self.stack)
+            else:
+                depth = 0
+            memory, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            record = Phase(name, depth, perf_counter(), memory, thread)
+            record.cells = cells
+            self.phases.append(record)
+        stack.append(record)
+        try:
+            yield record
+        finally:
+            record.seconds = perf_counter() - record.start
+            _, peak = tracemalloc.get_traced_memory()
+            record.peak = max(record.peak, peak)
+            stack.pop()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, record.peak)
+
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if not self.was_tracing:
+            tracemalloc.stop()
+
+    def summary(self) -> list[dict]:
+        # phases merged by name (and depth), in order of first call
+        rows = {}
+        for record in self.phases:
+            key = (record.depth, record.name)
+            row = rows.setdefault(
+                key,
+                {
+                    "phase": record.name,
+                    "depth": record.depth,
+                    "calls": 0,
+                    "seconds": 0.0,
+                    "peak_bytes": 0,
+                    "cells": 0,
+                },
+            )
+            row["calls"] += 1
+            row["seconds"] += record.seconds
+            row["peak_bytes"] = max(
+                row["peak_bytes"], record.peak - record.start_memory
+            )
+            row["cells"] += record.cells
+        return list(rows.values())
+
+    def print_summary(self, console):
+        from rich.table import Table
+
+        total = perf_counter() - self.started
+        table = Table(title=f"profile ({total:.3f}s in total)")
+        table.add_column("Phase")
+        table.add_column("Calls", justify="right")
+        table.add_column("Time [s]", justify="right")
+        table.add_column("Share", justify="right")
+        table.add_column("Peak memory [MB]", justify="right")
+        table.add_column("Cells/s", justify="right")
+        for row in self.summary():
+            table.add_row(
+                "  " * row["depth"] + row["phase"],
+                str(row["calls"]),
+                f"{row['seconds']:.4f}",
+                f"{row['seconds'] / total:.0%}" if total > 0 else "-",
+                f"{row['peak_bytes'] / (1024 * 1024):.2f}",
+                (
+                    f"{row['cells'] / row['seconds']:,.0f}"
+                    if row["cells"] and row["seconds"] > 0
+                    else "-"
+                ),
+            )
+        console.print(table)
+
+    def chrome_trace(self) -> dict:
+        # complete events ("X") in microseconds since the start of profiling
+        events = []
+        for record in self.phases:
+            events.append(
+                {
+                    "name": record.name,
+                    "ph": "X",
+                    "ts": (record.start - self.started) * 1e6,
+                    "dur": record.seconds * 1e6,
+                    "pid": os.getpid(),
+                    "tid": record.thread,
+                    "args": {
+                        "peak_bytes": record.peak - record.start_memory,
+                        "cells": record.cells,
+                    },
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self) -> Path | None:
+        if self.output is None:
+            return None
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(self.output)
+        elif self.output.suffix in CHROME_TRACE_EXTENSIONS:
+            with open(self.output, "w", encoding="utf-8") as f:
+                json.dump(self.chrome_trace(), f)
+        else:
+            raise Exception(
+                f"Unknown profile file type '{self.output.suffix}', use one of: {', '.join(CHROME_TRACE_EXTENSIONS + PSTATS_EXTENSIONS)}."
+            )
+        return self.output
+
+
+# profiler of the current session, None - instrumentation is off
+PROFILER: Profiler | None = None
+
+
+def start(output: str | Path | None = None) -> Profiler:
+    global PROFILER
+    if PROFILER is None:
+        PROFILER = Profiler(output)
+    return PROFILER
+
+
+def finish(console=None) -> Profiler | None:
+    # stops profiling, prints summary and saves output file (if any)
+    global PROFILER
+    profiler = PROFILER
+    if profiler is None:
+        return None
+    PROFILER = None
+    profiler.stop()
+    if console is None:
+        from rich.console import Console
+
+        console = Console(stderr=True)
+    profiler.print_summary(console)
+    output = profiler.save()
+    if output is not None:
+        console.print(f"Profile saved to '[bold]{output}[/]'.")
+    return profiler
+
+
+def start_from_env():
+    # profiling of API users, summary is printed when the program ends
+    value = os.environ.get(PROFILE_ENV)
+    if value and PROFILER is None:
+        start(value if Path(value).suffix else None)
+        atexit.register(finish)
+
+
+@contextmanager
+def phase(name: str, cells: int = 0) -> Iterator[Phase | None]:
+    if PROFILER is None:
+        yield None
+        return
+    with PROFILER.phase(name, cells) as record:
+        yield record
+
+
+def profiled(method: Callable | None = None, *, cells: bool = True) -> Callable:
+    # times DiamondSquare method as a phase, with cells size of the height map
+    # after the call is used for throughput (skip for steps not processing the
+    # map), nothing is done when profiling is off
+    if method is None:
+        return lambda method: profiled(method, cells=cells)
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if PROFILER is None:
+            return method(self, *args, **kwargs)
+        with PROFILER.phase(method.__name__) as record:
+            result = method(self, *args, **kwargs)
+            if cells:
+                record.cells = getattr(getattr(self, "height_map", None), "size", 0)
+        return result
+
+    return wrapper
@@ -0,0 +1,197 @@
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+from tui_map_generator import engines, noise
+from tui_map_generator.defaults import (
+    HEIGHT_MAX,
+    HEIGHT_MIN,
+    RANDOM_SEED,
+    ROUGHNESS,
+    height_dtype,
+    is_valid_map_size,
+)
+
+# diamond square map of any size (e.g. 65537) of which only requested windows
+# are generated. Random values are hashes of (seed, level, x, y) instead of
+# one sequential stream, so every point can be computed on its own from its
+# ancestors: the points of coarser grids it is averaged from. Each grid (level,
+# points every `spacing` cells) is split into tiles of REGION_TILE x REGION_TILE
+# points, tiles are generated on first use, from tiles of the coarser grid,
+# and kept in LRU cache shared by all queries, so a window needs its own tiles
+# plus a few tiles per level above it (O(log n) levels)
+REGION_TILE = 64
+# max number of tiles (of all levels) kept in memory
+REGION_CACHE_SIZE = 1024
+HASH_LEVEL = np.uint64(0xA0761D6478BD642F)
+HASH_ROW = np.uint64(0xE7037ED1A0B428DB)
+
+
+class RegionMap:
+    def __init__(
+        self,
+        map_size: int,
+        random_seed: int = RANDOM_SEED,
+        roughness: float = ROUGHNESS,
+        height_min: int = HEIGHT_MIN,
+        height_max: int = HEIGHT_MAX,
+        cache_size: int = REGION_CACHE_SIZE,
+    ):
+        if not is_valid_map_size(map_size):
+            raise Exception(f"Map size must be 2^n + 1, got {map_size}.")
+        self.map_size = map_size
+        self.random_seed = random_seed
+        self.roughness = roughness
+        self.height_min = height_min
+        self.height_max = height_max
+        self.cache_size = cache_size
+        self.dtype = height_dtype(height_max)
+        self.key = noise.mix(np.uint64(engines.numpy_seed(random_seed)))
+        self.tiles: OrderedDict[tuple[int, int, int], np.ndarray] = OrderedDict()
+        self.lock = Lock()
+        # number of tiles generated and taken from cache (all levels)
+        self.generated = 0
+        self.reused = 0
+
+    def points(self, spacing: int) -> int:
+        # points of the grid along each axis
+        return (self.map_size - 1) // spacing + 1
+
+    def random_scalar(self, spacing: int) -> float:
+        # the same as engines use for the level adding points of this spacing
+        scalar = self.roughness
+        chunk_size = self.map_size - 1
+        while chunk_size > 2 * spacing:
+            chunk_size //= 2
+            scalar = max(scalar / 2, engines.ROUGHNESS_MIN)
+        return scalar
+
+    def hashes(self, spacing: int, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        # one hash per point (map coordinates), rows of ys, columns of xs
+        with np.errstate(over="ignore"):
+            level_key = noise.mix(self.key ^ (np.uint64(spacing) * HASH_LEVEL))
+            row_keys = noise.mix(ys.astype(np.uint64)[:, None] * HASH_ROW ^ level_key)
+        return noise.mix(row_keys ^ noise.mix(xs.astype(np.uint64)[None, :]))
+
+    def noise(self, spacing: int, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        # -1, 0 or 1 like random_value of DiamondSquare
+        return (self.hashes(spacing, xs, ys) % np.uint64(3)).astype(np.int64) - 1
+
+    def region(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        # window of the map with top left corner at (x, y)
+        if (
+            x < 0
+            or y < 0
+            or width < 1
+            or height < 1
+            or x + width > self.map_size
+            or y + height > self.map_size
+        ):
+            raise Exception(
+                f"Region {width}x{height} at ({x}, {y}) doesn't fit in {self.map_size}x{self.map_size} map."
+            )
+        return self.grid(1, x, x + width, y, y + height)
+
+    def grid(self, spacing: int, i0: int, i1: int, j0: int, j1: int) -> np.ndarray:
+        # points [j0, j1) x [i0, i1) of the grid (indices in grid points)
+        result = np.empty((j1 - j0, i1 - i0), dtype=self.dtype)
+        for ty in range(j0 // REGION_TILE, (j1 - 1) // REGION_TILE + 1):
+            for tx in range(i0 // REGION_TILE, (i1 - 1) // REGION_TILE + 1):
+                tile = self.tile(spacing, tx, ty)
+                top = max(j0, ty * REGION_TILE)
+                bottom = min(j1, ty * REGION_TILE + tile.shape[0])
+                left = max(i0, tx * REGION_TILE)
+                right = min(i1, tx * REGION_TILE + tile.shape[1])
+                result[top - j0 : bottom - j0, left - i0 : right - i0] = tile[
+                    top - ty * REGION_TILE : bottom - ty * REGION_TILE,
+                    left - tx * REGION_TILE : right - tx * REGION_TILE,
+                ]
+        return result
+
+    def tile(self, spacing: int, tx: int, ty: int) -> np.ndarray:
+        key = (spacing, tx, ty)
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+                self.reused += 1
+                return tile
+
+        tile = self.generate_tile(spacing, tx, ty)
+        tile.flags.writeable = False
+        with self.lock:
+            self.generated += 1
+            self.tiles[key] = tile
+            while len(self.tiles) > self.cache_size:
+                self.tiles.popitem(last=False)
+        return tile
+
+    def generate_tile(self, spacing: int, tx: int, ty: int) -> np.ndarray:
+        n = self.points(spacing)
+        i0, i1 = tx * REGION_TILE, min((tx + 1) * REGION_TILE, n)
+        j0, j1 = ty * REGION_TILE, min((ty + 1) * REGION_TILE, n)
+        if spacing == self.map_size - 1:
+            # corners of the map
+            values = self.hashes(
+                spacing, np.arange(i0, i1) * spacing, np.arange(j0, j1) * spacing
+            ) % np.uint64(self.height_max - self.height_min + 1)
+            return values.astype(self.dtype) + self.dtype.type(self.height_min)
+
+        # block of the grid with one point more on each side (centers next to
+        # the tile are neighbours of its edge points), even points are the
+        # points of the coarser grid
+        ei0, ei1 = max(i0 - 1, 0), min(i1 + 1, n)
+        ej0, ej1 = max(j0 - 1, 0), min(j1 + 1, n)
+        coarse_n = self.points(2 * spacing)
+        ci0, ci1 = ei0 // 2, min(ei1 // 2 + 1, coarse_n)
+        cj0, cj1 = ej0 // 2, min(ej1 // 2 + 1, coarse_n)
+        coarse = self.grid(2 * spacing, ci0, ci1, cj0, cj1).astype(np.float64)
+        block = np.zeros((ej1 - ej0, ei1 - ei0))
+        even = block[ej0 % 2 :: 2, ei0 % 2 :: 2]
+        top, left = (ej0 + 1) // 2 - cj0, (ei0 + 1) // 2 - ci0
+        even[:] = coarse[top : top + even.shape[0], left : left + even.shape[1]]
+        scalar = self.random_scalar(spacing)
+
+        # diamond step: centers of coarse squares, average of 4 corners
+        oi = np.arange(ei0 + 1 - ei0 % 2, ei1, 2)
+        oj = np.arange(ej0 + 1 - ej0 % 2, ej1, 2)
+        if len(oi) > 0 and len(oj) > 0:
+            left, top = (oi - 1) // 2 - ci0, (oj - 1) // 2 - cj0
+            average = (
+                coarse[np.ix_(top, left)]
+                + coarse[np.ix_(top, left + 1)]
+                + coarse[np.ix_(top + 1, left)]
+                + coarse[np.ix_(top + 1, left + 1)]
+            ) / 4
+            block[np.ix_(oj - ej0, oi - ei0)] = engines.round_and_clamp(
+                average + self.noise(spacing, oi * spacing, oj * spacing) * scalar,
+                self.height_min,
+                self.height_max,
+            )
+
+        # square step: cells between two corners and two centers, neighbours
+        # on the first row or column are skipped (like in the loop version)
+        ii = np.arange(i0, i1)
+        jj = np.arange(j0, j1)
+        padded = np.zeros((block.shape[0] + 2, block.shape[1] + 2))
+        padded[1:-1, 1:-1] = block
+        y, x = j0 - ej0 + 1, i0 - ei0 + 1
+        h, w = j1 - j0, i1 - i0
+        total = np.zeros((h, w))
+        count = np.zeros((h, w))
+        for dy, dx, valid in (
+            (0, -1, (ii - 1 > 0)[None, :]),
+            (0, 1, (ii + 1 < n)[None, :]),
+            (-1, 0, (jj - 1 > 0)[:, None]),
+            (1, 0, (jj + 1 < n)[:, None]),
+        ):
+            total += padded[y + dy : y + dy + h, x + dx : x + dx + w] * valid
+            count += valid
+        square = (ii[None, :] + jj[:, None]) % 2 == 1
+        tile = block[y - 1 : y - 1 + h, x - 1 : x - 1 + w]
+        tile[square] = engines.round_and_clamp(
+            total[square] / count[square]
+            + self.noise(spacing, ii * spacing, jj * spacing)[square] * scalar,
+            self.height_min,
+            self.height_max,
+        )
+        return tile.astype(self.dtype)
@@ -0,0 +1,130 @@
+from typing import Iterator
+import math
+import numpy as np
+from rich.color import Color
+from rich.segment import Segment
+from rich.style import Style
+
+# each height map cell is drawn as 2 terminal columns (to look square)
+CELL = "  "
+HALF_BLOCK = "\u2580"
+ANSI_RESET = "\x1b[0m"
+ANSI_DEFAULT_BG = "\x1b[49m"
+
+
+def bg_escapes(lut: np.ndarray) -> list[str]:
+    # truecolor background escape sequence for each height (see palette_lut)
+    return [f"\x1b[48;2;{r};{g};{b}m" for r, g, b in lut.tolist()]
+
+
+def fg_escapes(lut: np.ndarray) -> list[str]:
+    return [f"\x1b[38;2;{r};{g};{b}m" for r, g, b in lut.tolist()]
+
+
+def fit_step(width: int, max_width: int | None, cell_width: int = len(CELL)) -> int:
+    # every step-th cell (in both directions) is drawn to fit in max_width columns
+    if max_width is None:
+        return 1
+    return max(1, math.ceil(width * cell_width / max_width))
+
+
+def downsample(heights: np.ndarray, step: int) -> np.ndarray:
+    if step == 1:
+        return heights
+    return heights[::step, ::step]
+
+
+def iter_runs(row: np.ndarray) -> Iterator[tuple[int, int]]:
+    # (value, length) of runs of the same values
+    starts = np.flatnonzero(np.r_[True, row[1:] != row[:-1]])
+    lengths = np.diff(np.r_[starts, len(row)])
+    return zip(row[starts].tolist(), lengths.tolist())
+
+
+def render_ansi(heights: np.ndarray, escapes: list[str]) -> Iterator[str]:
+    # lines of terminal output, color is set once per run of cells
+    for row in heights:
+        runs = "".join(f"{escapes[value]}{CELL * n}" for value, n in iter_runs(row))
+        yield f"{runs}{ANSI_RESET}\n"
+
+
+def iter_half_rows(
+    heights: np.ndarray,
+) -> Iterator[tuple[np.ndarray, np.ndarray | None]]:
+    # pairs of rows (top, bottom), last row of odd map has no pair
+    for y in range(0, heights.shape[0], 2):
+        yield heights[y], heights[y + 1] if y + 1 < heights.shape[0] else None
+
+
+def render_half_ansi(
+    heights: np.ndarray, fg: list[str], bg: list[str]
+) -> Iterator[str]:
+    # runs are made of cells with the same pair of colors
+    for top, bottom in iter_half_rows(heights):
+        if bottom is None:
+            runs = "".join(
+                f"{fg[value]}{ANSI_DEFAULT_BG}{HALF_BLOCK * n}"
+                for value, n in iter_runs(top)
+            )
+        else:
+            pairs = top.astype(np.int64) * len(bg) + bottom
+            runs = "".join(
+                f"{fg[value // len(bg)]}{bg[value % len(bg)]}{HALF_BLOCK * n}"
+                for value, n in iter_runs(pairs)
+            )
+        yield f"{runs}{ANSI_RESET}\n"
+
+
+def half_block_segments(heights: np.ndarray, lut: np.ndarray) -> list[Segment]:
+    # the same picture as render_half_ansi for rich (other color systems)
+    colors = [Color.from_rgb(r, g, b) for r, g, b in lut.tolist()]
+    styles = {}
+    segments = []
+    for top, bottom in iter_half_rows(heights):
+        if bottom is None:
+            bottom = np.full_like(top, -1, dtype=np.int64)
+        pairs = top.astype(np.int64) * (len(lut) + 1) + bottom + 1
+        for value, n in iter_runs(pairs):
+            if value not in styles:
+                top_value, bottom_value = divmod(value, len(lut) + 1)
+                styles[value] = Style(
+                    color=colors[top_value],
+                    bgcolor=colors[bottom_value - 1] if bottom_value > 0 else None,
+                )
+            segments.append(Segment(HALF_BLOCK * n, styles[value]))
+        segments.append(Segment.line())
+    return segments
+
+
+class CompiledPalette:
+    # everything renderers and exports need from one palette, built once:
+    # rich segments (mapping), color lookup tables indexed by height and
+    # escape sequences of ansi renderers, all shared, must not be changed
+    def __init__(self, palette: dict[str, dict], height_symbols: list[str] | None):
+        self.palette = palette
+        self.mapping = {}
+        for symbol, colors in palette.items():
+            fg_r, fg_g, fg_b = colors["fg"]
+            bg_r, bg_g, bg_b = colors["bg"]
+            self.mapping[symbol] = Segment(
+                CELL,
+                Style.parse(f"rgb({fg_r},{fg_g},{fg_b}) on rgb({bg_r},{bg_g},{bg_b})"),
+            )
+        self.luts = {key: self.build_lut(key, height_symbols) for key in ("fg", "bg")}
+        self.ansi_escapes = bg_escapes(self.luts["bg"])
+        self.ansi_fg_escapes = fg_escapes(self.luts["bg"])
+
+    def build_lut(self, key: str, height_symbols: list[str] | None) -> np.ndarray:
+        # without height symbols codes of the symbols are heights
+        if height_symbols is None:
+            lut = np.zeros((max(map(ord, self.palette)) + 1, 3), dtype=np.uint8)
+            for symbol, colors in self.palette.items():
+                lut[ord(symbol)] = colors[key]
+        else:
+            lut = np.zeros((len(height_symbols) + 1, 3), dtype=np.uint8)
+            for height in range(len(lut)):
+                symbol = height_symbols[height - 1]
+                if symbol in self.palette:
+                    lut[height] = self.palette[symbol][key]
+        lut.flags.writeable = False
+        return lut
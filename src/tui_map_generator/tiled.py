@@ -0,0 +1,124 @@
+from pathlib import Path
+from typing import BinaryIO, Iterator
+import mmap
+import struct
+import zlib
+import numpy as np
+from tui_map_generator.defaults import MEMORY_BUDGET
+
+# rough size of temporary data per cell while exporting a band of rows
+EXPORT_BYTES_PER_CELL: int = 64
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COMPRESSION_LEVEL: int = 6
+
+
+def create_memmap(
+    file_name: str | Path,
+    shape: tuple[int, int],
+    dtype: np.dtype,
+    fill: int = 0,
+    memory_budget: int | None = None,
+) -> np.memmap:
+    height_map = np.memmap(file_name, dtype=dtype, mode="w+", shape=shape)
+    # new file is already filled with zeros
+    if fill != 0:
+        for _, band in iter_row_bands(height_map, memory_budget):
+            band[:] = fill
+    return height_map
+
+
+def release(height_map: np.ndarray):
+    # write dirty pages back to the file and drop touched pages from the
+    # process, so resident memory does not grow up to the whole map
+    # (copy-on-write memmaps would lose their changes, they are kept)
+    if not isinstance(height_map, np.memmap) or height_map.mode == "c":
+        return
+    height_map.flush()
+    mm = getattr(height_map, "_mmap", None)
+    if mm is not None and hasattr(mmap, "MADV_DONTNEED"):
+        mm.madvise(mmap.MADV_DONTNEED)
+
+
+def band_rows(
+    memory_budget: int | None,
+    width: int,
+    bytes_per_cell: int = EXPORT_BYTES_PER_CELL,
+) -> int:
+    if memory_budget is None:
+        memory_budget = MEMORY_BUDGET
+    return max(1, memory_budget // (width * bytes_per_cell))
+
+
+def iter_row_bands(
+    height_map: np.ndarray,
+    memory_budget: int | None,
+    bytes_per_cell: int = EXPORT_BYTES_PER_CELL,
+) -> Iterator[tuple[int, np.ndarray]]:
+    # bands are views, pages of a memory mapped height map are released
+    # once the consumer asks for the next band
+    rows = band_rows(memory_budget, height_map.shape[1], bytes_per_cell)
+    for y0 in range(0, height_map.shape[0], rows):
+        yield y0, height_map[y0 : y0 + rows]
+        release(height_map)
+
+
+def iter_tiles(
+    height_map: np.ndarray,
+    memory_budget: int | None,
+    bytes_per_cell: int = EXPORT_BYTES_PER_CELL,
+) -> Iterator[tuple[int, int, np.ndarray]]:
+    # square tiles, used when data has to be written column by column
+    side = max(1, int((band_rows(memory_budget, 1, bytes_per_cell)) ** 0.5))
+    for x0 in range(0, height_map.shape[1], side):
+        for y0 in range(0, height_map.shape[0], side):
+            yield y0, x0, height_map[y0 : y0 + side, x0 : x0 + side]
+            release(height_map)
+
+
+def scale_up_pixels(img: np.ndarray, scale_up: int) -> np.ndarray:
+    # each pixel becomes scale_up x scale_up square (same as nearest resize)
+    if scale_up == 1:
+        return img
+    return np.repeat(np.repeat(img, scale_up, axis=0), scale_up, axis=1)
+
+
+def write_png_chunk(fp: BinaryIO, chunk_type: bytes, data: bytes):
+    fp.write(struct.pack(">I", len(data)))
+    fp.write(chunk_type)
+    fp.write(data)
+    fp.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+
+def write_png_stream(
+    fp: BinaryIO,
+    width: int,
+    height: int,
+    rows: Iterator[np.ndarray],
+    text: dict[str, str],
+    palette: np.ndarray | None = None,
+):
+    # minimal PNG encoder compressing image rows as they come, rows are
+    # (n, width, 3) uint8 arrays or (n, width) palette indexes if palette is given
+    channels = 3 if palette is None else 1
+    color_type = 2 if palette is None else 3
+    fp.write(PNG_SIGNATURE)
+    write_png_chunk(
+        fp, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    )
+    if palette is not None:
+        write_png_chunk(fp, b"PLTE", palette.astype(np.uint8).tobytes())
+    for key, value in text.items():
+        write_png_chunk(
+            fp, b"tEXt", key.encode("latin-1") + b"\0" + value.encode("latin-1")
+        )
+
+    compressor = zlib.compressobj(PNG_COMPRESSION_LEVEL)
+    for band in rows:
+        # filter type 0 (none) at the beginning of each row
+        lines = np.zeros((band.shape[0], width * channels + 1), dtype=np.uint8)
+        lines[:, 1:] = band.reshape(band.shape[0], width * channels)
+        data = compressor.compress(lines.tobytes())
+        if data:
+            write_png_chunk(fp, b"IDAT", data)
+    write_png_chunk(fp, b"IDAT", compressor.flush())
+    write_png_chunk(fp, b"IEND", b"")
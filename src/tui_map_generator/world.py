@@ -0,0 +1,208 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+import numpy as np
+from tui_map_generator import engines
+from tui_map_generator.defaults import (
+    HEIGHT_MAX,
+    HEIGHT_MIN,
+    RANDOM_SEED,
+    ROUGHNESS,
+    height_dtype,
+    is_valid_map_size,
+)
+
+# endless world made of square chunks, chunk (cx, cy) covers world points from
+# (cx, cy) * (chunk_size - 1) to (cx + 1, cy + 1) * (chunk_size - 1), so
+# neighbouring chunks share their edges. Edges are generated on their own
+# (1D midpoint displacement) from seeds made of world seed and edge coordinates,
+# so both chunks get the same edge and interior is generated around it
+CHUNK_SIZE = 257
+# max number of chunks kept in memory
+CHUNK_CACHE_SIZE = 64
+# chunks around requested one generated in background (1 - 3x3 chunks)
+PREFETCH_RADIUS = 1
+# kinds of random substreams
+SEED_CORNER = 0
+SEED_EDGE = 1
+SEED_CHUNK = 2
+
+
+def substream(random_seed: int, kind: int, *coordinates: int) -> np.random.Generator:
+    # coordinates may be negative, numpy seeds may not
+    return np.random.default_rng(
+        [engines.numpy_seed(random_seed), kind]
+        + [engines.numpy_seed(c) for c in coordinates]
+    )
+
+
+class ChunkedWorld:
+    def __init__(
+        self,
+        chunk_size: int = CHUNK_SIZE,
+        random_seed: int = RANDOM_SEED,
+        roughness: float = ROUGHNESS,
+        height_min: int = HEIGHT_MIN,
+        height_max: int = HEIGHT_MAX,
+        cache_size: int = CHUNK_CACHE_SIZE,
+        prefetch_radius: int = PREFETCH_RADIUS,
+    ):
+        if not is_valid_map_size(chunk_size):
+            raise Exception(f"Chunk size must be 2^n + 1, got {chunk_size}.")
+        self.chunk_size = chunk_size
+        self.random_seed = random_seed
+        self.roughness = roughness
+        self.height_min = height_min
+        self.height_max = height_max
+        self.cache_size = cache_size
+        self.prefetch_radius = prefetch_radius
+        self.chunks: OrderedDict[tuple[int, int], np.ndarray] = OrderedDict()
+        self.pending: dict[tuple[int, int], Future] = {}
+        self.lock = Lock()
+        # one background worker, chunks are generated in order of requests
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def corner(self, cx: int, cy: int) -> int:
+        rng = substream(self.random_seed, SEED_CORNER, cx, cy)
+        return int(rng.integers(self.height_min, self.height_max + 1))
+
+    def edge(self, cx: int, cy: int, vertical: bool) -> np.ndarray:
+        # edge starting at corner (cx, cy) going right (or down if vertical)
+        end = (cx, cy + 1) if vertical else (cx + 1, cy)
+        values = np.zeros(self.chunk_size, dtype=np.float64)
+        values[0] = self.corner(cx, cy)
+        values[-1] = self.corner(*end)
+        noise_source = engines.numpy_noise_source(
+            substream(self.random_seed, SEED_EDGE, cx, cy, int(vertical))
+        )
+
+        # the same scale of noise as diamond square levels of the chunk
+        random_scalar = self.roughness
+        step = self.chunk_size - 1
+        while step > 1:
+            half = step // 2
+            average = (values[0:-1:step] + values[step::step]) / 2
+            values[half::step] = engines.round_and_clamp(
+                average + noise_source(len(average)) * random_scalar,
+                self.height_min,
+                self.height_max,
+            )
+            step = half
+            random_scalar = max(random_scalar / 2, engines.ROUGHNESS_MIN)
+        return values
+
+    def generate_chunk(self, cx: int, cy: int) -> np.ndarray:
+        height_map = np.zeros(
+            (self.chunk_size, self.chunk_size), dtype=height_dtype(self.height_max)
+        )
+        edges = (
+            (np.s_[0, :], self.edge(cx, cy, False)),
+            (np.s_[-1, :], self.edge(cx, cy + 1, False)),
+            (np.s_[:, 0], self.edge(cx, cy, True)),
+            (np.s_[:, -1], self.edge(cx + 1, cy, True)),
+        )
+        for index, values in edges:
+            height_map[index] = values
+
+        # square steps compute edges from the inside of the chunk, they are put
+        # back after each level, before the next level reads them
+        noise_source = engines.numpy_noise_source(
+            substream(self.random_seed, SEED_CHUNK, cx, cy)
+        )
+        for _ in engines.iter_diamond_square(
+            height_map,
+            self.roughness,
+            self.height_min,
+            self.height_max,
+            noise_source,
+        ):
+            for index, values in edges:
+                height_map[index] = values
+        height_map.flags.writeable = False
+        return height_map
+
+    def chunk(self, cx: int, cy: int, prefetch: bool = True) -> np.ndarray:
+        # read only chunk, generated now if not cached or being prefetched
+        key = (cx, cy)
+        with self.lock:
+            if key in self.chunks:
+                self.chunks.move_to_end(key)
+                height_map = self.chunks[key]
+            else:
+                height_map = None
+                future = self.pending.get(key)
+
+        if height_map is None:
+            if future is not None:
+                height_map = future.result()
+            else:
+                height_map = self.store(key, self.generate_chunk(cx, cy))
+        if prefetch:
+            self.prefetch(cx, cy)
+        return height_map
+
+    def store(self, key: tuple[int, int], height_map: np.ndarray) -> np.ndarray:
+        with self.lock:
+            self.pending.pop(key, None)
+            self.chunks[key] = height_map
+            self.chunks.move_to_end(key)
+            while len(self.chunks) > self.cache_size:
+                self.chunks.popitem(last=False)
+        return height_map
+
+    def prefetch(self, cx: int, cy: int, radius: int | None = None) -> list[Future]:
+        # schedules generation of chunks around (cx, cy), nearest first
+        if radius is None:
+            radius = self.prefetch_radius
+        around = sorted(
+            (
+                (cx + dx, cy + dy)
+                for dy in range(-radius, radius + 1)
+                for dx in range(-radius, radius + 1)
+            ),
+            key=lambda key: abs(key[0] - cx) + abs(key[1] - cy),
+        )
+        futures = []
+        with self.lock:
+            for key in around[: self.cache_size]:
+                if key in self.chunks or key in self.pending:
+                    continue
+                future = self.executor.submit(
+                    lambda key: self.store(key, self.generate_chunk(*key)), key
+                )
+                self.pending[key] = future
+                futures.append(future)
+        return futures
+
+    def chunk_of(self, x: int, y: int) -> tuple[int, int]:
+        return x // (self.chunk_size - 1), y // (self.chunk_size - 1)
+
+    def region(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        # window of the world with top left corner at world point (x, y)
+        step = self.chunk_size - 1
+        result = np.zeros((height, width), dtype=height_dtype(self.height_max))
+        cx0, cy0 = self.chunk_of(x, y)
+        cx1, cy1 = self.chunk_of(x + width - 1, y + height - 1)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                height_map = self.chunk(cx, cy, prefetch=False)
+                # part of the window covered by this chunk (shared edges included)
+                top = max(y, cy * step)
+                bottom = min(y + height, (cy + 1) * step + 1)
+                left = max(x, cx * step)
+                right = min(x + width, (cx + 1) * step + 1)
+                result[top - y : bottom - y, left - x : right - x] = height_map[
+                    top - cy * step : bottom - cy * step,
+                    left - cx * step : right - cx * step,
+                ]
+        self.prefetch(*self.chunk_of(x + width // 2, y + height // 2))
+        return result
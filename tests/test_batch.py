@@ -0,0 +1,25 @@
+from pathlib import Path
+import json
+import numpy as np
+from rich.console import Console
+from tui_map_generator.batch import generate_batch, parse_seeds
+from tui_map_generator.diamond_square import DiamondSquare
+
+
+def test_parse_seeds():
+    assert list(parse_seeds("3..6")) == [3, 4, 5]
+    assert parse_seeds("1,5,7") == [1, 5, 7]
+
+
+def test_batch_maps_equal_single_maps(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    summary = generate_batch(
+        [4, 9], 33, map_name="batch", workers=1, console=Console(quiet=True)
+    )
+    assert summary["maps"] == 2
+    for seed in (4, 9):
+        with open(tmp_path / "maps" / f"batch_{seed}.json", encoding="utf-8") as f:
+            data = json.load(f)
+        ds = DiamondSquare(33, random_seed=seed)
+        ds.generate()
+        assert np.array_equal(np.array(data["height_map"]), ds.height_map)
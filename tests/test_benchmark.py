@@ -0,0 +1,10 @@
+from pathlib import Path
+import pytest
+from tui_map_generator import benchmark
+
+
+@pytest.mark.parametrize("operation", list(benchmark.SUITE_SETUP))
+def test_load_is_measured_without_its_save(operation: str, tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    results = benchmark.time_operations(9, "landscape_16", [operation], repeat=1)
+    assert [result["operation"] for result in results] == [operation]
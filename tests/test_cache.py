@@ -0,0 +1,83 @@
+from pathlib import Path
+import filecmp
+import pickle
+import random
+import numpy as np
+from rich.console import Console
+from tui_map_generator import cache
+from tui_map_generator.cache import MapCache
+from tui_map_generator.diamond_square import DiamondSquare
+
+
+def exported_map(map_cache: MapCache, name: str) -> DiamondSquare:
+    ds = DiamondSquare(65, random_seed=8, map_name=name, map_cache=map_cache)
+    ds.console = Console(quiet=True)
+    ds.generate()
+    ds.export(["png", "json", "xp", "hmap"], workers=1)
+    return ds
+
+
+def test_second_export_comes_from_cache(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    map_cache = MapCache(tmp_path / "cache")
+    first = exported_map(map_cache, "first")
+    for file_name in (tmp_path / "maps").glob("first.*"):
+        file_name.rename(file_name.with_name(f"cold{file_name.suffix}"))
+    second = exported_map(map_cache, "first")
+
+    assert np.array_equal(first.height_map, second.height_map)
+    # map and 4 exports
+    assert map_cache.hits == 5
+    for file_name in (tmp_path / "maps").glob("first.*"):
+        cold = file_name.with_name(f"cold{file_name.suffix}")
+        assert filecmp.cmp(file_name, cold, shallow=False)
+
+
+def test_writes_scan_folder_only_when_full(tmp_path: Path, monkeypatch):
+    map_cache = MapCache(tmp_path, max_bytes=10_000)
+    scans = []
+    entries = map_cache.entries
+    monkeypatch.setattr(map_cache, "entries", lambda: scans.append(1) or entries())
+
+    for i in range(9):
+        map_cache.write(map_cache.key({"i": i}), "bin", lambda f: f.write(b"x" * 1000))
+    # the first write learns the size of the folder
+    assert len(scans) == 1
+    assert map_cache.total == 9000
+
+    map_cache.write(map_cache.key({"i": 9}), "bin", lambda f: f.write(b"x" * 2000))
+    assert len(scans) == 2
+    assert map_cache.total <= 10_000 * cache.CACHE_EVICT_TO
+    assert map_cache.total == map_cache.size()
+    # the newest file is kept
+    assert map_cache.get(map_cache.key({"i": 9}), "bin") is not None
+
+
+def test_overwritten_file_is_counted_once(tmp_path: Path):
+    map_cache = MapCache(tmp_path)
+    key = map_cache.key({"map": 1})
+    for _ in range(3):
+        map_cache.write(key, "bin", lambda f: f.write(b"x" * 100))
+    assert map_cache.total == map_cache.size() == 100
+
+
+def test_cache_can_be_sent_to_worker_processes(tmp_path: Path):
+    map_cache = MapCache(tmp_path, max_bytes=1234)
+    copy = pickle.loads(pickle.dumps(map_cache))
+    assert (copy.folder, copy.max_bytes) == (tmp_path, 1234)
+    copy.write(copy.key({"map": 1}), "bin", lambda f: f.write(b"x"))
+
+
+def test_cached_map_leaves_random_state_of_generation(tmp_path: Path):
+    map_cache = MapCache(tmp_path / "cache")
+    cold = DiamondSquare(33, random_seed=2, map_cache=map_cache)
+    cold.generate()
+    cold_state = random.getstate()
+
+    random.seed(0)
+    warm = DiamondSquare(33, random_seed=2, map_cache=map_cache)
+    warm.generate()
+    assert map_cache.hits == 1
+    assert random.getstate() == cold_state
+    assert warm.generation["random_state"] == cold_state
+    assert np.array_equal(warm.height_map, cold.height_map)
@@ -0,0 +1,59 @@
+from pathlib import Path
+import json
+import numpy as np
+import pytest
+from tui_map_generator import engines
+from tui_map_generator.diamond_square import DiamondSquare
+
+# maps shipped with the repository, generated by the original (loop) version
+GOLDEN_MAPS = sorted((Path(__file__).parent.parent / "maps").glob("example_0*.json"))
+
+
+@pytest.mark.parametrize("engine", ["exact", "loop"])
+@pytest.mark.parametrize("file_name", GOLDEN_MAPS, ids=lambda path: path.stem)
+def test_engine_reproduces_golden_map(engine: str, file_name: Path):
+    with open(file_name, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    parameters = data["parameters"]
+    ds = DiamondSquare(
+        parameters["Map size"],
+        height_max=parameters["Max height"],
+        roughness=parameters["Roughness"],
+        random_seed=parameters["Random seed"],
+        palette=parameters["Palette"],
+        engine=engine,
+    )
+    ds.generate()
+    assert np.array_equal(ds.height_map, np.array(data["height_map"]))
+
+
+def test_golden_maps_found():
+    assert len(GOLDEN_MAPS) == 3
+
+
+def test_parallel_engine_does_not_depend_on_workers(monkeypatch):
+    # small bands, so every pass is split between the workers
+    monkeypatch.setattr(engines, "PARALLEL_BAND_CELLS", 1024)
+    maps = []
+    for workers in (1, 2, 4):
+        ds = DiamondSquare(257, random_seed=21, engine="parallel", workers=workers)
+        ds.generate()
+        maps.append(ds.height_map)
+    assert np.array_equal(maps[0], maps[1])
+    assert np.array_equal(maps[0], maps[2])
+
+
+@pytest.mark.parametrize("engine", ["exact", "loop", "numpy"])
+def test_progressive_generation_ends_with_generated_map(engine: str):
+    ds = DiamondSquare(65, random_seed=3, engine=engine)
+    levels = [np.array(level) for level in ds.iter_generate(keep_lods=True)]
+    cold = DiamondSquare(65, random_seed=3, engine=engine)
+    cold.generate()
+    assert np.array_equal(levels[-1], cold.height_map)
+    if engine != "loop":
+        # the loop engine yields the full map only
+        assert [level.shape[0] for level in levels] == [2, 3, 5, 9, 17, 33, 65]
+    # points of yielded levels don't change later
+    for lod, level in enumerate(reversed(levels)):
+        assert np.array_equal(cold.lod(lod), level)
+        assert np.array_equal(ds.lod_pyramid[lod], level)
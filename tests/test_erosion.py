@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from rich.console import Console
+from tui_map_generator import erosion
+from tui_map_generator.defaults import EROSION_KINDS
+from tui_map_generator.diamond_square import DiamondSquare
+
+
+def eroded_map(kind: str) -> DiamondSquare:
+    ds = DiamondSquare(65, height_min=2, height_max=12, random_seed=4)
+    ds.console = Console(quiet=True)
+    ds.generate()
+    ds.erode(kind, 20)
+    return ds
+
+
+@pytest.mark.parametrize("kind", EROSION_KINDS)
+def test_erosion_is_deterministic_and_keeps_heights_in_range(kind: str):
+    first = eroded_map(kind)
+    second = eroded_map(kind)
+    assert np.array_equal(first.height_map, second.height_map)
+    assert first.height_map.min() >= 2
+    assert first.height_map.max() <= 12
+
+    generated = DiamondSquare(65, height_min=2, height_max=12, random_seed=4)
+    generated.generate()
+    assert not np.array_equal(first.height_map, generated.height_map)
+    assert first.height_map.dtype == generated.height_map.dtype
+
+
+@pytest.mark.parametrize("kind", EROSION_KINDS)
+def test_erosion_of_float_heights_is_deterministic(kind: str):
+    heights = np.random.default_rng(1).random((33, 33), dtype=erosion.EROSION_FLOAT)
+    first, second = heights.copy(), heights.copy()
+    assert erosion.erode(first, kind, 10, None) == 10
+    assert erosion.erode(second, kind, 10, None) == 10
+    assert np.array_equal(first, second)
+    assert np.isfinite(first).all()
@@ -0,0 +1,51 @@
+import random
+import numpy as np
+import pytest
+from tui_map_generator.diamond_square import DiamondSquare
+
+FUZZ_CHANGES = 40
+PALETTES = ["landscape_16", "grey_16", "grey_32", "grey_64"]
+
+
+def cold_generation(**parameters) -> tuple[np.ndarray, tuple]:
+    ds = DiamondSquare(**parameters)
+    ds.generate()
+    return ds.height_map, random.getstate()
+
+
+@pytest.mark.parametrize("engine", ["exact", "loop", "numpy"])
+def test_changed_parameters_give_cold_generation_maps(engine: str):
+    # random sequence of palette, roughness, max height and seed changes,
+    # every map and random state must be the same as after a cold generation
+    fuzz = random.Random(engine)
+    parameters = {"map_size": 65, "random_seed": 3, "engine": engine}
+    ds = DiamondSquare(**parameters)
+    ds.generate()
+    for _ in range(FUZZ_CHANGES):
+        change = fuzz.choice(["palette", "roughness", "height_max", "random_seed"])
+        if change == "palette":
+            parameters["palette"] = fuzz.choice(PALETTES)
+        elif change == "roughness":
+            parameters["roughness"] = fuzz.choice([1.0, 3.0, 7.5, 16.0, 40.0])
+        elif change == "height_max":
+            parameters["height_max"] = fuzz.randint(2, 16)
+        else:
+            parameters["random_seed"] = fuzz.randint(0, 3)
+        for name in ("palette", "roughness", "height_max", "random_seed"):
+            if name in parameters:
+                setattr(ds, name, parameters[name])
+        ds.generate()
+        state = random.getstate()
+
+        expected_map, expected_state = cold_generation(**parameters)
+        assert np.array_equal(ds.height_map, expected_map), parameters
+        assert ds.height_map.dtype == expected_map.dtype
+        assert state == expected_state, parameters
+
+
+def test_out_of_core_generation_keeps_no_draws(tmp_path):
+    ds = DiamondSquare(
+        129, random_seed=3, memmap_file=str(tmp_path / "map.dat"), memory_budget=4096
+    )
+    ds.generate()
+    assert ds.generation["draws"] is None
@@ -0,0 +1,77 @@
+from pathlib import Path
+import json
+import numpy as np
+import pytest
+from tui_map_generator import json_map
+from tui_map_generator.diamond_square import JSON_INDENT, DiamondSquare
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_saved_map_loads_back(compress: bool, tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ds = DiamondSquare(65, random_seed=11, map_name="saved")
+    ds.generate()
+    ds.save_to_map(compress)
+
+    loaded = DiamondSquare(9, map_name="saved")
+    loaded.load_from_map()
+    assert np.array_equal(loaded.height_map, ds.height_map)
+    assert loaded.height_map.dtype == ds.height_map.dtype
+    assert (loaded.map_size, loaded.random_seed) == (65, 11)
+    assert not loaded.is_out_of_core()
+
+
+def test_changes_of_loaded_raw_map_are_kept(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ds = DiamondSquare(65, random_seed=11, map_name="raw")
+    ds.generate()
+    ds.save_to_map(compress=False)
+
+    loaded = DiamondSquare(9, map_name="raw")
+    loaded.load_from_map()
+    loaded.height_map[:] = 1
+    loaded.save_to_json()
+    assert (loaded.height_map == 1).all()
+    with open(tmp_path / "maps" / "raw.json", "r", encoding="utf-8") as f:
+        assert (np.array(json.load(f)["height_map"]) == 1).all()
+    # the file itself is never changed
+    reloaded = DiamondSquare(9, map_name="raw")
+    reloaded.load_from_map()
+    assert np.array_equal(reloaded.height_map, ds.height_map)
+
+
+def test_loaded_raw_map_can_be_eroded(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ds = DiamondSquare(65, random_seed=11, map_name="raw")
+    ds.generate()
+    ds.save_to_map(compress=False)
+
+    loaded = DiamondSquare(9, map_name="raw")
+    loaded.load_from_map()
+    loaded.erode("thermal", 5)
+    ds.erode("thermal", 5)
+    assert np.array_equal(loaded.height_map, ds.height_map)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_json_export_loads_back_in_chunks(compact: bool, tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # small chunks split rows and numbers between reads
+    monkeypatch.setattr(json_map, "JSON_READ_CHUNK", 7)
+    ds = DiamondSquare(33, random_seed=5, map_name="streamed")
+    ds.generate()
+    ds.save_to_json(compact)
+
+    with open(tmp_path / "maps" / "streamed.json", "r", encoding="utf-8") as f:
+        text = f.read()
+    data = {"parameters": ds.txt_legend_dict, "height_map": ds.height_map.tolist()}
+    if compact:
+        assert text == json.dumps(data, separators=(",", ":"))
+    else:
+        assert text == json.dumps(data, indent=JSON_INDENT)
+
+    loaded = DiamondSquare(9, map_name="streamed")
+    loaded.load_from_json()
+    assert np.array_equal(loaded.height_map, ds.height_map)
+    assert loaded.height_map.dtype == ds.height_map.dtype
+    assert (loaded.map_size, loaded.random_seed) == (33, 5)
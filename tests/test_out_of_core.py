@@ -0,0 +1,37 @@
+from pathlib import Path
+import numpy as np
+import pytest
+from tui_map_generator import tiled
+from tui_map_generator.diamond_square import DiamondSquare
+
+
+def test_create_memmap_fills_in_bands_of_budget(tmp_path: Path, monkeypatch):
+    budgets = []
+    iter_row_bands = tiled.iter_row_bands
+
+    def recording_iter_row_bands(height_map, memory_budget, *args, **kwargs):
+        budgets.append(memory_budget)
+        return iter_row_bands(height_map, memory_budget, *args, **kwargs)
+
+    monkeypatch.setattr(tiled, "iter_row_bands", recording_iter_row_bands)
+    height_map = tiled.create_memmap(
+        tmp_path / "map.dat", (65, 65), np.dtype(np.uint8), 7, memory_budget=256
+    )
+    assert budgets == [256]
+    assert (height_map == 7).all()
+
+
+@pytest.mark.parametrize("engine", ["exact", "numpy"])
+def test_memmap_map_equals_in_memory_map(engine: str, tmp_path: Path):
+    in_memory = DiamondSquare(129, random_seed=5, engine=engine)
+    in_memory.generate()
+    out_of_core = DiamondSquare(
+        129,
+        random_seed=5,
+        engine=engine,
+        memmap_file=str(tmp_path / "map.dat"),
+        memory_budget=4096,
+    )
+    out_of_core.generate()
+    assert out_of_core.is_out_of_core()
+    assert np.array_equal(in_memory.height_map, out_of_core.height_map)
@@ -0,0 +1,66 @@
+from pathlib import Path
+import json
+import numpy as np
+import pytest
+from PIL import Image
+from rich.console import Console
+from tui_map_generator.diamond_square import DiamondSquare, HEIGHT_TO_CHR_MAPPING
+
+MAPS_FOLDER = Path(__file__).parent.parent / "maps"
+GOLDEN_MAPS = sorted(MAPS_FOLDER.glob("example_0*.json"))
+# PNG files saved by the original per-pixel loop with current palettes
+# (example_02.png was saved with older grey palettes)
+GOLDEN_PNGS = ["example_01", "example_03"]
+
+
+def example_map(file_name: Path) -> DiamondSquare:
+    with open(file_name, "r", encoding="utf-8") as f:
+        parameters = json.load(f)["parameters"]
+    ds = DiamondSquare(
+        parameters["Map size"],
+        height_max=parameters["Max height"],
+        roughness=parameters["Roughness"],
+        random_seed=parameters["Random seed"],
+        palette=parameters["Palette"],
+        map_name=file_name.stem,
+    )
+    ds.console = Console(quiet=True)
+    ds.generate()
+    return ds
+
+
+def loop_reference(ds: DiamondSquare, scale_up: int) -> np.ndarray:
+    # the original export: background color of each cell, scaled up
+    size = ds.map_size
+    img = np.zeros((size, size, 3), dtype=np.uint8)
+    for y in range(size):
+        for x in range(size):
+            height = ds.height_map[y][x]
+            img[y][x] = ds.palette_dict[HEIGHT_TO_CHR_MAPPING[height - 1]]["bg"]
+    return img.repeat(scale_up, axis=0).repeat(scale_up, axis=1)
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+@pytest.mark.parametrize("file_name", GOLDEN_MAPS, ids=lambda path: path.stem)
+def test_png_equals_loop_reference(
+    indexed: bool, file_name: Path, tmp_path: Path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    ds = example_map(file_name)
+    ds.save_to_png(3, indexed=indexed)
+
+    image = Image.open(tmp_path / "maps" / f"{file_name.stem}.png")
+    assert image.mode == ("P" if indexed else "RGB")
+    assert np.array_equal(np.array(image.convert("RGB")), loop_reference(ds, 3))
+
+
+@pytest.mark.parametrize("name", GOLDEN_PNGS)
+def test_png_equals_golden_png(name: str, tmp_path: Path, monkeypatch):
+    golden = Image.open(MAPS_FOLDER / f"{name}.png")
+    ds = example_map(MAPS_FOLDER / f"{name}.json")
+    monkeypatch.chdir(tmp_path)
+    ds.save_to_png(golden.width // ds.map_size)
+
+    image = Image.open(tmp_path / "maps" / f"{name}.png")
+    assert np.array_equal(np.array(image), np.array(golden))
+    assert image.text == golden.text
@@ -0,0 +1,26 @@
+from pathlib import Path
+from rich.console import Console
+from tui_map_generator import profiling
+from tui_map_generator.diamond_square import DiamondSquare
+
+
+def test_threaded_export_records_phase_per_format(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    profiler = profiling.start()
+    try:
+        ds = DiamondSquare(65, random_seed=1)
+        ds.console = Console(quiet=True)
+        ds.generate()
+        ds.export(["png", "json", "xp", "hmap"], workers=4)
+    finally:
+        profiling.finish(Console(quiet=True))
+
+    rows = {row["phase"]: row for row in profiler.summary()}
+    for phase in (
+        "write_png_file",
+        "write_json_file",
+        "write_xp_file",
+        "write_map_file",
+    ):
+        assert rows[phase]["calls"] == 1
+        assert rows[phase]["depth"] == rows["export"]["depth"] + 1
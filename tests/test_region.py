@@ -0,0 +1,84 @@
+import random
+import numpy as np
+import pytest
+from tui_map_generator import engines, region
+from tui_map_generator.region import RegionMap
+
+
+def loop_reference(region_map: RegionMap) -> np.ndarray:
+    # the loop version of diamond square (see DiamondSquare.diamond_square)
+    # with random values taken from region map hashes
+    size = region_map.map_size
+    low, high = region_map.height_min, region_map.height_max
+    height_map = np.zeros((size, size), dtype=np.int64)
+
+    def noise(spacing: int, x: int, y: int) -> int:
+        return int(region_map.noise(spacing, np.array([x]), np.array([y]))[0, 0])
+
+    def round_and_clamp(value: float) -> int:
+        return int(engines.round_and_clamp(np.array([value]), low, high)[0])
+
+    for x, y in ((0, 0), (size - 1, 0), (0, size - 1), (size - 1, size - 1)):
+        value = region_map.hashes(size - 1, np.array([x]), np.array([y]))[0, 0]
+        height_map[y, x] = low + int(value % np.uint64(high - low + 1))
+
+    chunk_size = size - 1
+    while chunk_size > 1:
+        half = chunk_size // 2
+        scalar = region_map.random_scalar(half)
+        for y in range(0, size - 1, chunk_size):
+            for x in range(0, size - 1, chunk_size):
+                average = (
+                    height_map[y, x]
+                    + height_map[y, x + chunk_size]
+                    + height_map[y + chunk_size, x]
+                    + height_map[y + chunk_size, x + chunk_size]
+                ) / 4
+                height_map[y + half, x + half] = round_and_clamp(
+                    average + noise(half, x + half, y + half) * scalar
+                )
+        for y in range(0, size, half):
+            for x in range((y + half) % chunk_size, size, chunk_size):
+                total, count = 0, 0
+                if x - half > 0:
+                    total, count = total + height_map[y, x - half], count + 1
+                if x + half < size:
+                    total, count = total + height_map[y, x + half], count + 1
+                if y - half > 0:
+                    total, count = total + height_map[y - half, x], count + 1
+                if y + half < size:
+                    total, count = total + height_map[y + half, x], count + 1
+                height_map[y, x] = round_and_clamp(
+                    total / count + noise(half, x, y) * scalar
+                )
+        chunk_size = half
+    return height_map
+
+
+@pytest.mark.parametrize("map_size", [9, 33, 65])
+def test_region_map_equals_loop_reference(map_size: int, monkeypatch):
+    # small tiles, so maps are made of many tiles of every level
+    monkeypatch.setattr(region, "REGION_TILE", 4)
+    region_map = RegionMap(map_size, random_seed=17, roughness=8.0, height_max=16)
+    expected = loop_reference(region_map)
+    assert np.array_equal(region_map.region(0, 0, map_size, map_size), expected)
+
+
+def test_windows_equal_full_map(monkeypatch):
+    monkeypatch.setattr(region, "REGION_TILE", 16)
+    full = RegionMap(129, random_seed=5).region(0, 0, 129, 129)
+    # tiny cache, tiles are evicted and generated again between queries
+    region_map = RegionMap(129, random_seed=5, cache_size=16)
+    windows = random.Random(5)
+    for _ in range(20):
+        width, height = windows.randint(1, 40), windows.randint(1, 40)
+        x, y = windows.randint(0, 129 - width), windows.randint(0, 129 - height)
+        window = region_map.region(x, y, width, height)
+        assert np.array_equal(window, full[y : y + height, x : x + width])
+    assert len(region_map.tiles) <= 16
+    assert region_map.reused > 0
+
+
+def test_region_outside_map_raises():
+    with pytest.raises(Exception):
+        RegionMap(65).region(60, 0, 10, 10)
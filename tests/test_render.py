@@ -0,0 +1,98 @@
+import io
+import re
+import numpy as np
+from rich.console import Console
+from rich.segment import Segments
+from tui_map_generator import render
+from tui_map_generator.diamond_square import DiamondSquare
+
+ESCAPE = re.compile(r"\x1b\[([0-9;]*)m")
+# heights of a small map (values of landscape_16 palette)
+HEIGHTS = [[1, 1, 2], [3, 3, 3]]
+
+
+def printed_map(heights: list[list[int]], renderer: str) -> str:
+    # terminal output of the map only (without legend and palette preview)
+    ds = DiamondSquare(9, palette="landscape_16")
+    ds.build_palette()
+    ds.height_map = np.array(heights, dtype=np.uint8)
+    ds.console = Console(
+        file=io.StringIO(), force_terminal=True, color_system="truecolor", width=80
+    )
+    ds.print_height_map(renderer)
+    output = ds.console.file.getvalue()
+    start = output.index("\n", output.index("Height map")) + 1
+    return output[start:].rstrip("\n") + "\n"
+
+
+def parse_cells(output: str) -> list[list[tuple[str, tuple | None, tuple | None]]]:
+    # (character, foreground, background) of each terminal column of each line
+    lines = [[]]
+    fg = bg = None
+    for i, part in enumerate(ESCAPE.split(output)):
+        if i % 2 == 1:
+            codes = [int(code) for code in part.split(";") if code] or [0]
+            j = 0
+            while j < len(codes):
+                if codes[j] == 0:
+                    fg = bg = None
+                elif codes[j] == 39:
+                    fg = None
+                elif codes[j] == 49:
+                    bg = None
+                elif codes[j] in (38, 48):
+                    color = tuple(codes[j + 2 : j + 5])
+                    fg, bg = (color, bg) if codes[j] == 38 else (fg, color)
+                    j += 4
+                j += 1
+            continue
+        for character in part:
+            if character == "\n":
+                lines.append([])
+            else:
+                lines[-1].append((character, fg, bg))
+    return [line for line in lines if line]
+
+
+def test_ansi_renderer_draws_runs_of_cells():
+    output = printed_map(HEIGHTS, "ansi")
+    # one escape per run of the same color, 2 columns per cell
+    assert output.count("\x1b[48;2;") == 3
+    assert [len(line) for line in parse_cells(output)] == [6, 6]
+
+
+def test_ansi_renderer_equals_rich_renderer():
+    ansi = parse_cells(printed_map(HEIGHTS, "ansi"))
+    rich = parse_cells(printed_map(HEIGHTS, "rich"))
+    # the same characters and backgrounds in every column (rich also sets
+    # foreground of the empty cells, it is not visible)
+    assert [[(c, bg) for c, _, bg in line] for line in ansi] == [
+        [(c, bg) for c, _, bg in line] for line in rich
+    ]
+
+
+def test_half_renderer_draws_2_rows_per_line():
+    # odd last row has default background
+    heights = HEIGHTS + [[4, 5, 4]]
+    rich = parse_cells(printed_map(heights, "rich"))
+    colors = [[bg for _, _, bg in line[::2]] for line in rich]
+    expected = [
+        [(render.HALF_BLOCK, top, bottom) for top, bottom in zip(colors[0], colors[1])],
+        [(render.HALF_BLOCK, top, None) for top in colors[2]],
+    ]
+    assert parse_cells(printed_map(heights, "half")) == expected
+
+
+def test_half_block_segments_equal_half_renderer():
+    heights = np.array(HEIGHTS + [[4, 5, 4]], dtype=np.uint8)
+    ds = DiamondSquare(9, palette="landscape_16")
+    ds.build_palette()
+    lut = ds.palette_lut()
+    console = Console(
+        file=io.StringIO(), force_terminal=True, color_system="truecolor", width=80
+    )
+    console.print(Segments(render.half_block_segments(heights, lut)), end="")
+    ansi = "".join(
+        render.render_half_ansi(heights, render.fg_escapes(lut), render.bg_escapes(lut))
+    )
+    assert parse_cells(console.file.getvalue()) == parse_cells(ansi)
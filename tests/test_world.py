@@ -0,0 +1,41 @@
+import numpy as np
+from tui_map_generator.world import ChunkedWorld
+
+
+def test_neighbouring_chunks_share_edges():
+    with ChunkedWorld(33, random_seed=6, prefetch_radius=0) as world:
+        for cy in range(-1, 2):
+            for cx in range(-1, 2):
+                chunk = world.chunk(cx, cy)
+                assert np.array_equal(chunk[:, -1], world.chunk(cx + 1, cy)[:, 0])
+                assert np.array_equal(chunk[-1, :], world.chunk(cx, cy + 1)[0, :])
+
+
+def test_chunks_dont_depend_on_order_or_cache():
+    with ChunkedWorld(33, random_seed=6, cache_size=2) as world:
+        first = [np.array(world.chunk(cx, 0)) for cx in range(4)]
+    with ChunkedWorld(33, random_seed=6, cache_size=16) as world:
+        second = [np.array(world.chunk(cx, 0)) for cx in reversed(range(4))]
+    assert all(np.array_equal(a, b) for a, b in zip(first, reversed(second)))
+
+
+def test_chunk_cache_never_exceeds_its_size():
+    with ChunkedWorld(17, random_seed=6, cache_size=4, prefetch_radius=2) as world:
+        for cy in range(3):
+            for cx in range(3):
+                world.chunk(cx, cy)
+                assert len(world.chunks) <= 4
+                for future in list(world.pending.values()):
+                    future.result()
+                    assert len(world.chunks) <= 4
+        assert len(world.chunks) == 4
+
+
+def test_region_equals_chunks():
+    with ChunkedWorld(17, random_seed=6, prefetch_radius=0) as world:
+        region = world.region(-8, -8, 40, 24)
+        for y in range(-8, 16, 5):
+            for x in range(-8, 32, 7):
+                cx, cy = world.chunk_of(x, y)
+                chunk = world.chunk(cx, cy, prefetch=False)
+                assert region[y + 8, x + 8] == chunk[y - cy * 16, x - cx * 16]
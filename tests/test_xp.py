@@ -0,0 +1,125 @@
+from pathlib import Path
+import shutil
+import numpy as np
+import pytest
+from rich.console import Console
+from tui_map_generator.diamond_square import (
+    GZIP_MAGIC,
+    XP_LEGEND_SEPARATOR_X,
+    XP_LEGEND_START_X,
+    XP_LEGEND_START_Y,
+    DiamondSquare,
+    read_xp_layers,
+)
+
+DATA_FOLDER = Path(__file__).parent / "data"
+MAPS_FOLDER = Path(__file__).parent.parent / "maps"
+
+
+def legend_rows(file_name: Path, rows: int) -> list[str]:
+    layer = read_xp_layers(file_name)[-1]
+    return [
+        "".join(chr(int(code)) for code in layer["glyph"][y, : XP_LEGEND_START_X + 20])
+        for y in range(XP_LEGEND_START_Y, XP_LEGEND_START_Y + rows)
+    ]
+
+
+def test_legend_longer_than_template_has_separators(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ds = DiamondSquare(65, map_height=40, algorithm="fbm", random_seed=3)
+    ds.console = Console(quiet=True)
+    ds.generate()
+    ds.erode("thermal", 2)
+    ds.save_to_xp()
+
+    rows = legend_rows(tmp_path / "maps" / "height_map.xp", len(ds.txt_legend_dict))
+    for row, (label, value) in zip(rows, ds.txt_legend_dict.items()):
+        assert row[:XP_LEGEND_SEPARATOR_X].rstrip() == label
+        assert row[XP_LEGEND_SEPARATOR_X] == ":"
+        assert row[XP_LEGEND_START_X:].startswith(str(value))
+
+
+def reference_map() -> DiamondSquare:
+    ds = DiamondSquare(
+        17,
+        height_max=8,
+        roughness=3.0,
+        random_seed=7,
+        palette="landscape_8",
+        map_name="reference_17",
+    )
+    ds.console = Console(quiet=True)
+    ds.generate()
+    return ds
+
+
+def test_uncompressed_xp_equals_per_tile_writer(tmp_path: Path, monkeypatch):
+    # reference file was saved by the original writer packing tile by tile
+    reference = (DATA_FOLDER / "reference_17.xp").read_bytes()
+    monkeypatch.chdir(tmp_path)
+    ds = reference_map()
+    ds.save_to_xp(compress=False)
+    assert (tmp_path / "maps" / "reference_17.xp").read_bytes() == reference
+    ds.export(["xp", "png"], workers=1)
+    assert (tmp_path / "maps" / "reference_17.xp").read_bytes() == reference
+
+
+def test_compressed_xp_reads_back(tmp_path: Path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ds = reference_map()
+    ds.save_to_xp(compress=True)
+    file_name = tmp_path / "maps" / "reference_17.xp"
+    assert file_name.read_bytes()[:2] == GZIP_MAGIC
+
+    layers = read_xp_layers(file_name)
+    reference = read_xp_layers(DATA_FOLDER / "reference_17.xp")
+    assert len(layers) == len(reference)
+    for layer, reference_layer in zip(layers, reference):
+        assert np.array_equal(layer, reference_layer)
+
+
+def pyrexpaint_reference(file_name: Path, tmp_path: Path) -> tuple[list, dict]:
+    # the original loader: tile by tile through pyrexpaint (gzip files only),
+    # heights are glyph codes, palette has colors of first tile of each glyph
+    import gzip
+    import pyrexpaint
+
+    compressed = tmp_path / f"{file_name.stem}.gz.xp"
+    compressed.write_bytes(gzip.compress(file_name.read_bytes()))
+    layer = pyrexpaint.load(str(compressed))[0]
+    heights = []
+    palette = {}
+    for i in range(layer.height):
+        row = []
+        for j in range(layer.width):
+            tile = layer.tiles[j * layer.height + i]
+            char = tile.ascii_code.decode("cp437").replace(chr(0), "")
+            if char not in palette:
+                palette[char] = {
+                    "fg": (tile.fg_r, tile.fg_g, tile.fg_b),
+                    "bg": (tile.bg_r, tile.bg_g, tile.bg_b),
+                }
+            row.append(ord(char))
+        heights.append(row)
+    return heights, palette
+
+
+@pytest.mark.parametrize(
+    "file_name",
+    [MAPS_FOLDER / "example_01.xp", DATA_FOLDER / "reference_17.xp"],
+    ids=lambda path: path.stem,
+)
+def test_load_from_xp_equals_pyrexpaint_loader(
+    file_name: Path, tmp_path: Path, monkeypatch
+):
+    heights, palette = pyrexpaint_reference(file_name, tmp_path)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "maps").mkdir()
+    shutil.copy(file_name, tmp_path / "maps" / file_name.name)
+
+    ds = DiamondSquare(9, map_name=file_name.stem)
+    ds.load_from_xp()
+    assert np.array_equal(ds.height_map, np.array(heights))
+    assert ds.map_size == len(heights[0])
+    assert ds.palette == "custom"
+    assert ds.palette_dict == palette